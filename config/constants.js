@@ -106,7 +106,11 @@ export const MESSAGES = {
         fileSize: 'Размер файла превышает допустимый лимит',
         parsing: 'Ошибка при обработке файла',
         upload: 'Ошибка при загрузке файла',
-        versionTooOld: 'Версия сборщика диагностических данных слишком старая. Требуется версия не ниже'
+        versionTooOld: 'Версия сборщика диагностических данных слишком старая. Требуется версия не ниже',
+        fleetArchive: 'Архив опроса нескольких серверов (--fleet) не поддерживается: в нем только zabbix.stats узлов в подкаталогах <host>_<port>. Откройте архив сбора одного сервера'
+    },
+    warnings: {
+        incrementalArchive: 'Инкрементальный архив (--since): неизменившиеся файлы лежат в базовых архивах. Выберите их вместе с этим архивом:'
     },
     success: {
         upload: 'Файл успешно загружен и обработан',
@@ -66,9 +66,9 @@ class ZabbixAnalyzer {
         }
     }
 
-    async processData(zipContent) {
-        // Парсинг данных из ZIP
-        this.diagnosticData = await this.dataParser.processZipFiles(zipContent);
+    async processData(zipContent, references = {}) {
+        // Парсинг данных из ZIP; references - базовые архивы инкрементального сбора по имени файла
+        this.diagnosticData = await this.dataParser.processZipFiles(zipContent, references);
 
         // Обновление всех страниц
         this.updateAllPages();
@@ -5,11 +5,32 @@ export class DataParser {
         this.filePatterns = FILE_PATTERNS;
     }
 
-    async processZipFiles(zip) {
+    async processZipFiles(zip, references = {}) {
         const diagnosticData = {};
+        const entries = Object.entries(zip.files).filter(([, file]) => !file.dir);
+
+        // Инкрементальный архив (--since): неизменившиеся файлы лежат в базовых
+        // архивах, на которые ссылается manifest.json
+        const manifest = await this.readManifest(zip);
+        if (manifest) {
+            const { files, missing } = this.resolveReferences(manifest, entries, references);
+            entries.push(...files);
+            if (missing.length) {
+                diagnosticData.missingArchives = missing;
+            }
+        }
 
-        for (const [fileName, file] of Object.entries(zip.files)) {
-            if (file.dir) continue;
+        for (const [fileName, file] of entries) {
+
+            // Структурированный diaginfo, который сборщик разбирает сам
+            if (fileName.endsWith('1_diaginfo.json')) {
+                diagnosticData.diaginfoStructured = this.parseDiaginfoStructured(await file.async('text'));
+                continue;
+            }
+
+            // Текстовые парсеры применяются только к .txt; дополнительные
+            // JSON-файлы сборщика (например, 5_vmstat_samples.json) пропускаем
+            if (!fileName.endsWith('.txt')) continue;
 
             const content = await file.async('text');
 
@@ -42,6 +63,45 @@ export class DataParser {
         return diagnosticData;
     }
 
+    async readManifest(zip) {
+        const entry = Object.entries(zip.files).find(
+            ([fileName, file]) => !file.dir && fileName.split('/').pop() === 'manifest.json'
+        );
+        if (!entry) return null;
+
+        try {
+            const data = JSON.parse(await entry[1].async('text'));
+            return data && typeof data === 'object' ? data : null;
+        } catch (e) {
+            console.error('Ошибка парсинга manifest.json:', e);
+            return null;
+        }
+    }
+
+    resolveReferences(manifest, entries, references) {
+        // Файлы ищутся по имени без учета каталога, как и в самом архиве
+        const present = new Set(entries.map(([fileName]) => fileName.split('/').pop()));
+        const files = [];
+        const missing = new Set();
+
+        for (const [name, artifact] of Object.entries(manifest.artifacts || {})) {
+            const archive = artifact && artifact.archive;
+            if (present.has(name) || !archive || archive === manifest.archive) continue;
+
+            const base = references[archive];
+            const entry = base && Object.entries(base.files).find(
+                ([fileName, file]) => !file.dir && fileName.split('/').pop() === name
+            );
+            if (entry) {
+                files.push(entry);
+            } else {
+                missing.add(archive);
+            }
+        }
+
+        return { files, missing: [...missing] };
+    }
+
     parseVmstat(content) {
         const lines = content.split('\n');
         const data = [];
@@ -84,7 +144,30 @@ export class DataParser {
         return sections;
     }
 
+    parseDiaginfoStructured(content) {
+        try {
+            const data = JSON.parse(content);
+            return data && data.sections ? data : null;
+        } catch (e) {
+            console.error('Ошибка парсинга 1_diaginfo.json:', e);
+            return null;
+        }
+    }
+
     parseZabbixStats(content) {
+        // Сборщик начиная с версии 20261017 сохраняет ответ как валидный JSON
+        const jsonStart = content.indexOf('{');
+        if (jsonStart === -1) return null;
+
+        try {
+            return JSON.parse(content.slice(jsonStart));
+        } catch (e) {
+            // Архивы старых версий содержат repr() словаря Python
+            return this.parseZabbixStatsLegacy(content);
+        }
+    }
+
+    parseZabbixStatsLegacy(content) {
         try {
             // Извлечь JSON из строки
             const jsonMatch = content.match(/\{.*\}/s);
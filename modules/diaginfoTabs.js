@@ -30,15 +30,19 @@ export class DiaginfoTabs {
         }
     }
 
-    createHistoryCacheTab(diaginfoData) {
+    createHistoryCacheTab(diaginfoData, structured = null) {
         const historyData = diaginfoData['history cache diagnostic information'] || [];
         
-        if (historyData.length === 0) {
+        const section = this.getStructuredSection(structured, 'historycache');
+
+        if (!section && historyData.length === 0) {
             return '<div class="card"><p>Нет данных о кэше истории</p></div>';
         }
 
         // Парсим данные истории кэша
-        const parsed = this.parseHistoryCacheData(historyData);
+        const parsed = section
+            ? this.fromStructuredHistoryCache(section)
+            : this.parseHistoryCacheData(historyData);
         
         return `
             <div class="dashboard-grid">
@@ -118,14 +122,18 @@ export class DiaginfoTabs {
         `;
     }
 
-    createValueCacheTab(diaginfoData) {
+    createValueCacheTab(diaginfoData, structured = null) {
         const valueCacheData = diaginfoData['value cache diagnostic information'] || [];
         
-        if (valueCacheData.length === 0) {
+        const section = this.getStructuredSection(structured, 'valuecache');
+
+        if (!section && valueCacheData.length === 0) {
             return '<div class="card"><p>Нет данных о кэше значений</p></div>';
         }
 
-        const parsed = this.parseValueCacheData(valueCacheData);
+        const parsed = section
+            ? this.fromStructuredValueCache(section)
+            : this.parseValueCacheData(valueCacheData);
         
         return `
             <div class="dashboard-grid">
@@ -250,14 +258,18 @@ export class DiaginfoTabs {
         `;
     }
 
-    createPreprocessingTab(diaginfoData) {
+    createPreprocessingTab(diaginfoData, structured = null) {
         const preprocData = diaginfoData['preprocessing diagnostic information'] || [];
         
-        if (preprocData.length === 0) {
+        const section = this.getStructuredSection(structured, 'preprocessing');
+
+        if (!section && preprocData.length === 0) {
             return '<div class="card"><p>Нет данных о препроцессинге</p></div>';
         }
 
-        const parsed = this.parsePreprocessingData(preprocData);
+        const parsed = section
+            ? this.fromStructuredPreprocessing(section)
+            : this.parsePreprocessingData(preprocData);
         
         return `
             <div class="dashboard-grid">
@@ -336,14 +348,18 @@ export class DiaginfoTabs {
         `;
     }
 
-    createLLDTab(diaginfoData) {
+    createLLDTab(diaginfoData, structured = null) {
         const lldData = diaginfoData['LLD diagnostic information'] || [];
         
-        if (lldData.length === 0) {
+        const section = this.getStructuredSection(structured, 'lld');
+
+        if (!section && lldData.length === 0) {
             return '<div class="card"><p>Нет данных о LLD</p></div>';
         }
 
-        const parsed = this.parseLLDData(lldData);
+        const parsed = section
+            ? this.fromStructuredLLD(section)
+            : this.parseLLDData(lldData);
         
         return `
             <div class="dashboard-grid">
@@ -406,14 +422,18 @@ export class DiaginfoTabs {
         `;
     }
 
-    createAlertingTab(diaginfoData) {
+    createAlertingTab(diaginfoData, structured = null) {
         const alertingData = diaginfoData['alerting diagnostic information'] || [];
         
-        if (alertingData.length === 0) {
+        const section = this.getStructuredSection(structured, 'alerting');
+
+        if (!section && alertingData.length === 0) {
             return '<div class="card"><p>Нет данных об аллертинге</p></div>';
         }
 
-        const parsed = this.parseAlertingData(alertingData);
+        const parsed = section
+            ? this.fromStructuredAlerting(section)
+            : this.parseAlertingData(alertingData);
         
         return `
             <div class="dashboard-grid">
@@ -435,14 +455,18 @@ export class DiaginfoTabs {
         `;
     }
 
-    createLocksTab(diaginfoData) {
+    createLocksTab(diaginfoData, structured = null) {
         const locksData = diaginfoData['locks diagnostic information'] || [];
         
-        if (locksData.length === 0) {
+        const section = this.getStructuredSection(structured, 'locks');
+
+        if (!section && locksData.length === 0) {
             return '<div class="card"><p>Нет данных о блокировках</p></div>';
         }
 
-        const locks = this.parseLocksData(locksData);
+        const locks = section
+            ? this.fromStructuredLocks(section)
+            : this.parseLocksData(locksData);
         
         return `
             <div class="card">
@@ -462,6 +486,97 @@ export class DiaginfoTabs {
         `;
     }
 
+    // Структурированные данные из 1_diaginfo.json (сборщик 20261017+)
+    getStructuredSection(structured, key) {
+        return structured && structured.sections ? structured.sections[key] || null : null;
+    }
+
+    memoryUsage(block) {
+        const size = block && block.size;
+        if (!size) return undefined;
+
+        const free = size.free || 0;
+        const used = size.used || 0;
+        const total = free + used;
+        return {
+            free,
+            used,
+            total,
+            usedPercent: total ? ((used / total) * 100).toFixed(2) : '0.00'
+        };
+    }
+
+    fromStructuredHistoryCache(section) {
+        const summary = section.summary || {};
+        const memory = section.memory || {};
+        const top = (section.top || {})['Top.values'] || [];
+
+        return {
+            items: summary.Items,
+            values: summary.values,
+            time: summary.time,
+            memoryData: this.memoryUsage(memory['Memory.data']),
+            memoryIndex: this.memoryUsage(memory['Memory.index']),
+            topValues: top.length ? top.map(row => ({ itemid: row.itemid, values: row.values })) : undefined
+        };
+    }
+
+    fromStructuredValueCache(section) {
+        const summary = section.summary || {};
+        const top = section.top || {};
+        const memory = this.memoryUsage((section.memory || {}).Memory);
+        const toRow = row => ({ itemid: row.itemid, values: row.values, requests: row['request.values'] });
+
+        return {
+            items: summary.Items,
+            values: summary.values,
+            mode: summary.mode !== undefined ? String(summary.mode) : undefined,
+            time: summary.time,
+            memory: memory ? { free: memory.free, used: memory.used } : undefined,
+            topValues: top['Top.values'] ? top['Top.values'].map(toRow) : undefined,
+            topRequests: top['Top.request.values'] ? top['Top.request.values'].map(toRow) : undefined
+        };
+    }
+
+    fromStructuredPreprocessing(section) {
+        const summary = section.summary || {};
+        const top = (section.top || {})['Top.values'];
+
+        return {
+            values: summary.Values,
+            done: summary.done,
+            queued: summary.queued,
+            processing: summary.processing,
+            pending: summary.pending,
+            time: summary.time,
+            topValues: top ? top.map(row => ({ itemid: row.itemid, values: row.values, steps: row.steps })) : undefined
+        };
+    }
+
+    fromStructuredLLD(section) {
+        const summary = section.summary || {};
+        const top = (section.top || {})['Top.values'];
+
+        return {
+            rules: summary.Rules,
+            values: summary.values,
+            time: summary.time,
+            topValues: top ? top.map(row => ({ itemid: row.itemid, values: row.values })) : undefined
+        };
+    }
+
+    fromStructuredAlerting(section) {
+        const summary = section.summary || {};
+        return {
+            alerts: summary.Alerts,
+            time: summary.time
+        };
+    }
+
+    fromStructuredLocks(section) {
+        return section.locks || [];
+    }
+
     // Методы парсинга данных
     parseHistoryCacheData(data) {
         const result = {};
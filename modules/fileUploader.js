@@ -46,7 +46,7 @@ export class FileUploader {
             this.uploadArea.classList.remove('dragover');
             const files = e.dataTransfer.files;
             if (files.length > 0) {
-                this.handleFile(files[0]);
+                this.handleFiles(Array.from(files));
             }
         });
     }
@@ -55,8 +55,8 @@ export class FileUploader {
         this.fileInput.addEventListener('change', (e) => {
             console.log('File input changed, files:', e.target.files.length);
             if (e.target.files.length > 0) {
-                console.log('Processing file:', e.target.files[0].name);
-                this.handleFile(e.target.files[0]);
+                console.log('Processing files:', Array.from(e.target.files).map(file => file.name).join(', '));
+                this.handleFiles(Array.from(e.target.files));
             }
         });
     }
@@ -70,8 +70,7 @@ export class FileUploader {
         });
     }
 
-    async handleFile(file) {
-        const errorMessage = document.getElementById('errorMessage');
+    async handleFiles(files) {
         const processingMessage = document.getElementById('processingMessage');
         const fileInfo = document.getElementById('fileInfo');
         const resetBtn = document.getElementById('resetBtn');
@@ -81,15 +80,30 @@ export class FileUploader {
         processingMessage.style.display = 'flex';
 
         try {
-            if (!this.validateFile(file)) {
+            if (!files.every(file => this.validateFile(file))) {
                 throw new Error('Поддерживаются только ZIP архивы');
             }
 
+            // Распаковать ZIP; при нескольких файлах остальные - базовые архивы
+            // инкрементального сбора (--since)
+            const archives = [];
+            for (const file of files) {
+                archives.push({ file, zip: await this.unpackZip(file) });
+            }
+            const main = await this.selectMainArchive(archives);
+            const zipContent = main.zip;
+            const references = {};
+            for (const archive of archives) {
+                if (archive !== main) {
+                    references[archive.file.name] = archive.zip;
+                }
+            }
+
             // Показать информацию о файле
-            this.displayFileInfo(file);
+            this.displayFileInfo(main.file, Object.keys(references));
 
-            // Распаковать ZIP
-            const zipContent = await this.unpackZip(file);
+            // Архив --fleet содержит одинаковые файлы нескольких узлов в подкаталогах
+            this.validateArchiveType(zipContent);
 
             // Проверить версию сборщика диагностических данных и получить версию для отображения
             const collectorVersion = await this.validateCollectorVersion(zipContent);
@@ -103,7 +117,8 @@ export class FileUploader {
             fileInfo.style.display = 'block';
 
             // Обработать файлы через основное приложение
-            await this.app.processData(zipContent);
+            await this.app.processData(zipContent, references);
+            this.showMissingArchives(this.app.diagnosticData.missingArchives);
 
             processingMessage.style.display = 'none';
             resetBtn.style.display = 'inline-block';
@@ -118,16 +133,49 @@ export class FileUploader {
         return file.name.toLowerCase().endsWith('.zip');
     }
 
-    displayFileInfo(file) {
-        document.getElementById('fileName').textContent = file.name;
+    displayFileInfo(file, baseNames = []) {
+        const suffix = baseNames.length ? ` (базовые архивы: ${baseNames.join(', ')})` : '';
+        document.getElementById('fileName').textContent = file.name + suffix;
         document.getElementById('fileSize').textContent = utils.formatFileSize(file.size);
     }
 
+    async selectMainArchive(archives) {
+        // Основной архив - с самым новым manifest.json, остальные на него ссылаются
+        let main = archives[0];
+        let latest = '';
+        for (const archive of archives) {
+            const manifest = await this.app.dataParser.readManifest(archive.zip);
+            const created = (manifest && manifest.created) || '';
+            if (created > latest) {
+                latest = created;
+                main = archive;
+            }
+        }
+        return main;
+    }
+
+    showMissingArchives(missing) {
+        const warningMessage = document.getElementById('warningMessage');
+        if (!warningMessage || !missing || !missing.length) return;
+
+        warningMessage.textContent = `${MESSAGES.warnings.incrementalArchive} ${missing.join(', ')}`;
+        warningMessage.style.display = 'block';
+    }
+
     async unpackZip(file) {
         const zip = new JSZip();
         return await zip.loadAsync(file);
     }
 
+    validateArchiveType(zipContent) {
+        const isFleet = Object.keys(zipContent.files).some(
+            filePath => filePath.split('/').pop() === 'fleet_summary.json'
+        );
+        if (isFleet) {
+            throw new Error(MESSAGES.errors.fleetArchive);
+        }
+    }
+
     async validateCollectorVersion(zipContent) {
         console.log('validateCollectorVersion method called');
         // Поиск файла 0_version.txt в любой папке архива
@@ -173,10 +221,12 @@ export class FileUploader {
 
     hideAllMessages() {
         const errorMessage = document.getElementById('errorMessage');
+        const warningMessage = document.getElementById('warningMessage');
         const fileInfo = document.getElementById('fileInfo');
         const resetBtn = document.getElementById('resetBtn');
 
         errorMessage.style.display = 'none';
+        warningMessage.style.display = 'none';
         fileInfo.style.display = 'none';
         resetBtn.style.display = 'none';
     }
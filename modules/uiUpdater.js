@@ -311,7 +311,7 @@ export class UIUpdater {
 
     updateDiagnosticsPage(diagnosticData) {
         // Проверяем наличие данных diaginfo
-        if (!diagnosticData.diaginfo) {
+        if (!diagnosticData.diaginfo && !diagnosticData.diaginfoStructured) {
             return;
         }
 
@@ -319,7 +319,7 @@ export class UIUpdater {
         this.diaginfoTabs.setupDiaginfoTabs();
 
         // Создаем контент для каждой вкладки
-        this.createDiaginfoTabContent(diagnosticData.diaginfo);
+        this.createDiaginfoTabContent(diagnosticData.diaginfo || {}, diagnosticData.diaginfoStructured);
 
         // Показываем первую активную вкладку
         this.diaginfoTabs.showDiaginfoTab('history');
@@ -331,7 +331,7 @@ export class UIUpdater {
         console.log('Vmstat страница обновлена через графики');
     }
 
-    createDiaginfoTabContent(diaginfoData) {
+    createDiaginfoTabContent(diaginfoData, structured = null) {
         const container = document.getElementById('diaginfoTabContent');
         if (!container) return;
 
@@ -339,12 +339,12 @@ export class UIUpdater {
 
         // Создаем контент для каждой вкладки
         const tabs = {
-            history: this.diaginfoTabs.createHistoryCacheTab(diaginfoData),
-            value: this.diaginfoTabs.createValueCacheTab(diaginfoData),
-            preprocessing: this.diaginfoTabs.createPreprocessingTab(diaginfoData),
-            lld: this.diaginfoTabs.createLLDTab(diaginfoData),
-            alerting: this.diaginfoTabs.createAlertingTab(diaginfoData),
-            locks: this.diaginfoTabs.createLocksTab(diaginfoData)
+            history: this.diaginfoTabs.createHistoryCacheTab(diaginfoData, structured),
+            value: this.diaginfoTabs.createValueCacheTab(diaginfoData, structured),
+            preprocessing: this.diaginfoTabs.createPreprocessingTab(diaginfoData, structured),
+            lld: this.diaginfoTabs.createLLDTab(diaginfoData, structured),
+            alerting: this.diaginfoTabs.createAlertingTab(diaginfoData, structured),
+            locks: this.diaginfoTabs.createLocksTab(diaginfoData, structured)
         };
 
         // Добавляем каждую вкладку в контейнер
@@ -0,0 +1,104 @@
+import json
+import zipfile
+
+import zdiag
+from zdiag_bench import synthetic_stats
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for name, content in files.items():
+            zipf.writestr(f"zabbix-diag/{name}", content)
+    return str(path)
+
+
+def stats_file(data):
+    return "Успешно получен JSON ответ:\n" + json.dumps({'response': 'success', 'data': data})
+
+
+def findings(tmp_path, files, rule):
+    archive = zdiag.DiagnosticArchive(write_archive(tmp_path / 'host.zip', files)).load()
+    return [item for item in zdiag.HealthAnalyzer(archive).run() if item['rule'] == rule]
+
+
+def test_synthetic_stats_findings(tmp_path):
+    data = synthetic_stats(0)['data']
+    cache_free = {item['metric']: item['severity'] for item in findings(
+        tmp_path, {'2_zabbix_stats.txt': stats_file(data)}, 'cache_free')}
+
+    assert cache_free['rcache.pfree'] == 'warning'
+    assert cache_free['wcache.history.pfree'] == 'good'
+
+
+def test_vcache_hit_ratio_and_low_memory_mode(tmp_path):
+    data = {'vcache': {'cache': {'hits': 20, 'misses': 80, 'mode': 1}}}
+    result = findings(tmp_path, {'2_zabbix_stats.txt': stats_file(data)}, 'vcache_hit_ratio')
+
+    assert [(item['metric'], item['severity']) for item in result] == [
+        ('vcache.cache.hits', 'critical'), ('vcache.cache.mode', 'critical'),
+    ]
+    assert result[0]['value'] == 20.0
+
+
+def test_process_busy_suggests_more_processes(tmp_path):
+    data = {'process': {'poller': {'busy': {'avg': 80.0}, 'count': 5},
+                        'trapper': {'busy': {'avg': 10.0}, 'count': 5}}}
+    result = findings(tmp_path, {
+        '2_zabbix_stats.txt': stats_file(data),
+        '6_zabbix_config.txt': "StartPollers=5\n",
+    }, 'process_busy')
+
+    assert len(result) == 1
+    assert result[0]['metric'] == 'process.poller.busy.avg'
+    assert result[0]['configured'] == '5'
+    assert result[0]['suggested'] == 8
+
+
+def test_memory_swap_and_cpu(tmp_path):
+    vmstat = {'columns': {'id': [10, 30], 'wa': [5, 5], 'si': [0, 4], 'so': [0, 0]}}
+    files = {
+        '4_free.txt': "=== STDOUT ===\n"
+                      "              total   used   free  shared  buff/cache  available\n"
+                      "Mem:            100     95      1       0           4          5\n"
+                      "Swap:           100     10     90\n",
+        '5_vmstat_samples.json': json.dumps(vmstat),
+    }
+    archive = zdiag.DiagnosticArchive(write_archive(tmp_path / 'host.zip', files)).load()
+    result = {item['metric']: item for item in zdiag.HealthAnalyzer(archive).run()}
+
+    assert result['memory.used']['severity'] == 'critical'
+    assert result['swap.used']['severity'] == 'warning'
+    assert result['vmstat.si_so']['value'] == 50.0
+    assert result['vmstat.si_so']['severity'] == 'critical'
+    assert result['vmstat.cpu']['value'] == 80.0
+
+
+def test_malformed_values_are_skipped(tmp_path):
+    data = {'process': {'poller': {'busy': {'avg': 90.0}, 'count': "5"}},
+            'rcache': {'pfree': "x"},
+            'vcache': {'cache': {'hits': "1", 'misses': 2}}}
+    archive = zdiag.DiagnosticArchive(write_archive(tmp_path / 'host.zip', {
+        '4_free.txt': "Mem: 1 2 3 4 5 x\nSwap: 1 0 1\n",
+        '2_zabbix_stats.txt': stats_file(data),
+        '5_vmstat_samples.json': json.dumps({'columns': {'id': ['a', 50], 'si': 'x'}}),
+    })).load()
+
+    assert archive.memory() == {'swap': {'total': 1, 'used': 0, 'free': 1}}
+    result = {item['metric']: item for item in zdiag.HealthAnalyzer(archive).run()}
+    assert 'suggested' not in result['process.poller.busy.avg']
+    assert 'rcache.pfree' not in result
+    assert result['vmstat.cpu']['value'] == 50.0
+
+
+def test_analyze_archive_reports_errors_per_archive(tmp_path, monkeypatch):
+    good = write_archive(tmp_path / 'good.zip', {'4_free.txt': "Mem: 100 50 10 0 40 60\n"})
+    corrupt = tmp_path / 'corrupt.zip'
+    corrupt.write_bytes(b'PK\x03\x04garbage')
+
+    assert 'error' in zdiag.analyze_archive(str(corrupt))
+    assert zdiag.analyze_archive(good)['summary']['good'] == 1
+
+    def fail(self):
+        raise RuntimeError("broken rule")
+    monkeypatch.setattr(zdiag.HealthAnalyzer, 'run', fail)
+    assert zdiag.analyze_archive(good)['error'] == "RuntimeError: broken rule"
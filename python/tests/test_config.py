@@ -0,0 +1,90 @@
+import zdiag
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_include_directory_and_mask(tmp_path):
+    conf_d = tmp_path / 'conf.d'
+    conf_d.mkdir()
+    write(conf_d / 'a.conf', "StartPollers=10\n")
+    write(conf_d / 'b.conf', "CacheSize=64M\n")
+    write(tmp_path / 'extra.inc', "Timeout=10\n")
+    main = write(tmp_path / 'zabbix_server.conf', (
+        "# comment\n"
+        "StartPollers=5\n"
+        f"Include={conf_d}\n"
+        "Include=*.inc\n"
+        "Timeout=4\n"
+    ))
+
+    config = zdiag.ZabbixServerConfig.load(main)
+
+    assert config.get('StartPollers') == '10'
+    assert config.get('CacheSize') == '64M'
+    assert config.get('Timeout') == '4'
+    assert config.sources['StartPollers'] == (str(conf_d / 'a.conf'), 1)
+    assert config.sources['Timeout'] == (main, 5)
+    assert config.files == [main, str(conf_d / 'a.conf'), str(conf_d / 'b.conf'), str(tmp_path / 'extra.inc')]
+
+
+def test_include_cycle_is_skipped(tmp_path):
+    main = write(tmp_path / 'main.conf', "StartPollers=5\nInclude=other.conf\n")
+    write(tmp_path / 'other.conf', "Timeout=3\nInclude=main.conf\n")
+
+    config = zdiag.ZabbixServerConfig.load(main)
+
+    assert config.get('Timeout') == '3'
+    assert len(config.cycles) == 1
+    assert config.cycles[0].endswith('main.conf')
+    assert [entry[0] for entry in config.entries] == ['StartPollers', 'Timeout']
+
+
+def test_effective_keeps_multi_value_keys(tmp_path):
+    main = write(tmp_path / 'main.conf', (
+        "LoadModule=first.so\n"
+        "StartPollers=5\n"
+        "Include=modules.conf\n"
+        "StartPollers=7\n"
+    ))
+    write(tmp_path / 'modules.conf', "LoadModule=second.so\nStartPollers=6\n")
+
+    effective = zdiag.ZabbixServerConfig.load(main).effective()
+
+    assert [(key, value) for key, value, _, _ in effective] == [
+        ('LoadModule', 'first.so'),
+        ('LoadModule', 'second.so'),
+        ('StartPollers', '7'),
+    ]
+
+
+def test_redacted_excludes_sensitive(tmp_path):
+    main = write(tmp_path / 'main.conf', (
+        "DBHost=db.example\n"
+        "DBPassword=secret\n"
+        "DBPort=5432\n"
+        "TLSCertFile=/etc/zabbix/cert.pem\n"
+        "VaultToken=token\n"
+        "StatsAllowedIP=10.0.0.1\n"
+        "StartPollers=5\n"
+    ))
+
+    kept, excluded = zdiag.ZabbixServerConfig.load(main).redacted()
+
+    assert [entry[0] for entry in kept] == ['DBPort', 'StartPollers']
+    assert excluded == ['DBHost', 'DBPassword', 'StatsAllowedIP', 'TLSCertFile', 'VaultToken']
+
+
+def test_fingerprint_changes_with_included_file(tmp_path):
+    main = write(tmp_path / 'main.conf', "Include=inc.conf\n")
+    include = tmp_path / 'inc.conf'
+    write(include, "Timeout=3\n")
+
+    before = zdiag.ZabbixServerConfig.load(main).fingerprint()
+    write(include, "Timeout=30\n")
+    after = zdiag.ZabbixServerConfig.load(main).fingerprint()
+
+    assert before != after
+    assert [item[0] for item in after] == [main, str(include)]
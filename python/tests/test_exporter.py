@@ -0,0 +1,46 @@
+import pytest
+
+import zdiag
+from zdiag_bench import FakeTrapper
+
+
+@pytest.fixture(scope='module')
+def trapper():
+    trapper = FakeTrapper(stats_size=2048).start()
+    yield trapper
+    trapper.stop()
+
+
+class Diagnostic:
+    def __init__(self, port):
+        self.port = port
+
+    def create_stats_client(self):
+        return zdiag.ZabbixProtocolClient('127.0.0.1', self.port, timeout=5)
+
+
+def test_write_once_success(trapper, tmp_path, capsys):
+    path = tmp_path / 'zabbix.prom'
+
+    assert zdiag.PrometheusExporter(Diagnostic(trapper.port), textfile=str(path)).write_once()
+    text = path.read_text()
+    assert 'zabbix_server_up 1' in text
+    assert 'zabbix_server_hosts 811' in text
+    assert "Метрики сохранены" in capsys.readouterr().out
+
+
+def test_write_once_stats_failure(tmp_path, capsys):
+    path = tmp_path / 'zabbix.prom'
+
+    assert not zdiag.PrometheusExporter(Diagnostic(1), textfile=str(path)).write_once()
+    assert 'zabbix_server_up 0' in path.read_text()
+    assert "Метрики сохранены" not in capsys.readouterr().out
+
+
+def test_write_once_write_failure(trapper, tmp_path, capsys):
+    path = tmp_path / 'missing' / 'zabbix.prom'
+
+    assert not zdiag.PrometheusExporter(Diagnostic(trapper.port), textfile=str(path)).write_once()
+    out = capsys.readouterr().out
+    assert "Ошибка записи" in out
+    assert "Метрики сохранены" not in out
@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+import zipfile
+
+import pytest
+
+import zdiag
+from zdiag_bench import FakeTrapper, FakeTrapperHandler
+
+
+class SlowHandler(FakeTrapperHandler):
+    """Ответ с задержкой; задержка N-го соединения к trapper'у берется из delays"""
+
+    def handle(self):
+        state = self.server.state
+        with state['lock']:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+            index = self.server.connections
+            self.server.connections += 1
+        try:
+            delays = self.server.delays
+            time.sleep(delays[index] if index < len(delays) else delays[-1])
+            super().handle()
+        finally:
+            with state['lock']:
+                state['active'] -= 1
+
+
+def slow_trapper(state, delays, mode='plain'):
+    trapper = FakeTrapper(stats_size=2048, mode=mode)
+    trapper.RequestHandlerClass = SlowHandler
+    trapper.state = state
+    trapper.delays = delays
+    trapper.connections = 0
+    return trapper.start()
+
+
+@pytest.fixture
+def state():
+    return {'lock': threading.Lock(), 'active': 0, 'max_active': 0}
+
+
+@pytest.fixture
+def trappers():
+    started = []
+    yield started
+    for trapper in started:
+        trapper.stop()
+
+
+def fleet(trappers, **kwargs):
+    diag = zdiag.ZabbixDiagnostic(stats_timeout=kwargs.pop('stats_timeout', 5))
+    endpoints = [('127.0.0.1', trapper.port) for trapper in trappers]
+    return zdiag.FleetCollector(diag, endpoints, retry_delay=0.01, **kwargs)
+
+
+def test_concurrency_is_limited_by_semaphore(state, trappers):
+    trappers.extend(slow_trapper(state, [0.2]) for _ in range(5))
+
+    results = fleet(trappers, concurrency=2, retries=0).collect()
+
+    assert all(result['success'] for result in results)
+    assert state['max_active'] == 2
+
+
+def test_timed_out_target_succeeds_on_retry(state, trappers):
+    trappers.append(slow_trapper(state, [2.0, 0.0], mode='compressed'))
+
+    result, = fleet(trappers, stats_timeout=0.3, retries=2).collect()
+
+    assert result['success']
+    assert result['attempts'] == 2
+    assert result['stats']['data']['hosts'] == 811
+    assert 'error' not in result
+
+
+def test_failed_target_reports_error(state, trappers):
+    trappers.append(slow_trapper(state, [2.0]))
+
+    result, = fleet(trappers, stats_timeout=0.2, retries=1).collect()
+
+    assert not result['success']
+    assert result['attempts'] == 2
+    assert result['error'].startswith("Таймаут")
+
+
+def test_run_writes_subtrees_and_summary(state, trappers, tmp_path):
+    trappers.extend(slow_trapper(state, [0.0], mode=mode) for mode in ('plain', 'large'))
+    collector = fleet(trappers, retries=0)
+    collector.endpoints.append(('127.0.0.1', 1))
+    zip_path = tmp_path / 'fleet.zip'
+
+    assert collector.run(zip_path) is False
+
+    with zipfile.ZipFile(zip_path) as zipf:
+        names = set(zipf.namelist())
+        summary = json.loads(zipf.read(zdiag.FleetCollector.SUMMARY_NAME))
+        stats = {name: zipf.read(name).decode('utf-8') for name in names if name.endswith('2_zabbix_stats.txt')}
+
+    subtrees = [f"127.0.0.1_{port}" for _, port in collector.endpoints]
+    assert names == {f"{subtree}/{name}" for subtree in subtrees for name in ('0_version.txt', '2_zabbix_stats.txt')} \
+        | {zdiag.FleetCollector.SUMMARY_NAME}
+    assert '"response": "success"' in stats[f"{subtrees[0]}/2_zabbix_stats.txt"]
+    assert 'Ошибка получения статистики' in stats[f"{subtrees[2]}/2_zabbix_stats.txt"]
+    assert [(target['port'], target['success']) for target in summary['targets']] == \
+        [(port, port != 1) for _, port in collector.endpoints]
+
+    result = zdiag.analyze_archive(str(zip_path))
+    assert '--fleet' in result['error']
@@ -0,0 +1,53 @@
+import json
+import zipfile
+
+import pytest
+
+import zdiag
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for name, content in files.items():
+            zipf.writestr(f"zabbix-diag/{name}", content)
+    return str(path)
+
+
+@pytest.fixture
+def index():
+    with zdiag.ArchiveIndex(':memory:') as index:
+        yield index
+
+
+def collected_archive(path, collected, available):
+    return write_archive(path, {
+        'final.txt': f"# Завершение сбора\n{collected}\n",
+        '4_free.txt': f"Mem: 100 50 10 0 40 {available}\n",
+        zdiag.CollectionManifest.NAME: json.dumps({'hostname': 'zbx01', 'artifacts': {}}),
+    })
+
+
+def test_index_ingest_skips_broken_and_duplicate_archives(tmp_path, index):
+    good = collected_archive(tmp_path / 'zbx01.zip', '2026-01-01T10:00:00', 10)
+    corrupt = tmp_path / 'corrupt.zip'
+    corrupt.write_bytes(b'PK\x03\x04garbage')
+    malformed = write_archive(tmp_path / 'malformed.zip', {'1_diaginfo.json': json.dumps({'sections': {'x': [1]}})})
+
+    added, skipped, errors = index.ingest([good, str(corrupt), malformed, good], jobs=1)
+
+    assert (added, skipped) == (1, 1)
+    assert [path for path, _ in errors] == [str(corrupt), malformed]
+    assert index.series('memory.mem_available') == {'zbx01': [('2026-01-01T10:00:00', 10)]}
+
+
+def test_index_diff_days_with_microseconds(tmp_path, index):
+    paths = [
+        collected_archive(tmp_path / 'zbx01.zip', '2026-01-01T10:00:00.500000', 10),
+        collected_archive(tmp_path / 'zbx01-1.zip', '2026-01-01T22:00:00', 20),
+        collected_archive(tmp_path / 'zbx01-2.zip', '2026-01-02T10:00:00.900000', 40),
+    ]
+    index.ingest(paths, jobs=1)
+
+    rows = index.diff('memory.mem_available', ratio=2, days=1)
+    assert [(row['base_value'], row['value'], row['ratio']) for row in rows] == [(10, 40, 4.0)]
+    assert [row['base_value'] for row in index.diff('memory.mem_available', ratio=2)] == [20]
@@ -0,0 +1,125 @@
+import json
+import zipfile
+from pathlib import Path
+
+import zdiag
+from zdiag_bench import FakeEnvironment
+
+Manifest = zdiag.CollectionManifest
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for name, content in files.items():
+            zipf.writestr(f"zabbix-diag/{name}", content)
+    return path
+
+
+def manifest_json(archive, artifacts, hostname=None):
+    data = {'version': zdiag.VERSION, 'archive': archive, 'base': None, 'artifacts': artifacts}
+    if hostname:
+        data['hostname'] = hostname
+    return json.dumps(data)
+
+
+def test_record_and_reference_by_digest_or_fingerprint():
+    base = Manifest('base.zip')
+    base.record('os-release.txt', 'aaa')
+    base.record('6_zabbix_config.txt', 'bbb', fingerprint=[['/etc/z.conf', 10, 1]])
+
+    manifest = Manifest('next.zip', 'zbx01')
+    manifest.base = base.to_dict()['artifacts']
+
+    assert manifest.reference('os-release.txt', digest='aaa') == 'base.zip'
+    assert manifest.reference('os-release.txt', digest='changed') is None
+    assert manifest.reference('6_zabbix_config.txt', fingerprint=[['/etc/z.conf', 10, 1]]) == 'base.zip'
+    assert manifest.reference('6_zabbix_config.txt', fingerprint=[['/etc/z.conf', 11, 1]]) is None
+    assert manifest.reference('missing.txt', digest='aaa') is None
+
+    data = manifest.to_dict()
+    assert data['hostname'] == 'zbx01'
+    assert data['archive'] == 'next.zip'
+    assert set(data['artifacts']) == {'os-release.txt', '6_zabbix_config.txt'}
+
+
+def test_load_base_resolves_renamed_and_missing_archives(tmp_path):
+    write_archive(tmp_path / 'zbx01-1.zip', {'nproc.txt': '4'})
+    base = write_archive(tmp_path / 'zbx01-2.zip', {
+        Manifest.NAME: manifest_json('zbx01.zip', {
+            'os-release.txt': {'sha256': 'a', 'archive': 'zbx01.zip'},
+            'nproc.txt': {'sha256': 'b', 'archive': 'zbx01-1.zip'},
+            'cpuinfo.txt': {'sha256': 'c', 'archive': 'deleted.zip'},
+        }),
+    })
+
+    manifest = Manifest('zbx01-3.zip')
+    manifest.load_base(base)
+
+    assert manifest.base_name == 'zbx01-2.zip'
+    assert manifest.base['os-release.txt']['archive'] == 'zbx01-2.zip'
+    assert manifest.base['nproc.txt']['archive'] == 'zbx01-1.zip'
+    assert 'cpuinfo.txt' not in manifest.base
+
+
+def test_diagnostic_archive_reads_references_and_hostname(tmp_path):
+    write_archive(tmp_path / 'zbx01.zip', {'4_free.txt': 'Mem: 100 50 10 0 40 60\n'})
+    path = write_archive(tmp_path / 'zbx01-20261016-120000.zip', {
+        Manifest.NAME: manifest_json('zbx01-20261016-120000.zip', {
+            '4_free.txt': {'sha256': 'x', 'archive': 'zbx01.zip'},
+        }, hostname='zbx01'),
+    })
+
+    archive = zdiag.DiagnosticArchive(path).load()
+
+    assert archive.hostname == 'zbx01'
+    assert archive.memory()['mem']['available'] == 60
+
+
+def test_hostname_falls_back_to_file_stem(tmp_path):
+    path = write_archive(tmp_path / 'legacy-host.zip', {'0_version.txt': '20250101'})
+    assert zdiag.DiagnosticArchive(path).load().hostname == 'legacy-host'
+
+
+def test_archive_path_with_since(tmp_path):
+    diag = zdiag.ZabbixDiagnostic(since=tmp_path / 'base.zip')
+    path = diag.get_archive_path()
+
+    assert path.parent == tmp_path
+    assert path.name.startswith(f"{diag.get_hostname()}-")
+    assert zdiag.ZabbixDiagnostic().get_archive_path() == Path('/tmp') / f"{diag.get_hostname()}.zip"
+
+
+def collect(env, workdir, archive, since=None):
+    class Diagnostic(zdiag.ZabbixDiagnostic):
+        def get_archive_path(self):
+            return archive
+
+    Diagnostic(
+        output_dir=str(workdir / 'out'), proc_root=str(env.proc_root), profile='light',
+        sample_interval=0.2, sample_duration=1, worker_samples=1, worker_interval=0.2,
+        probe_count=1, nice=0, ionice='none', since=since,
+    ).run_all_tasks()
+
+
+def test_since_run_references_unchanged_files(tmp_path):
+    with FakeEnvironment(tmp_path / 'env', stats_size=4096, diaginfo_items=10, workers=4) as env:
+        archives = tmp_path / 'archives'
+        archives.mkdir()
+        base = archives / 'zbx01.zip'
+        collect(env, tmp_path, base)
+        incremental = archives / 'zbx01-20261016-120000.zip'
+        collect(env, tmp_path, incremental, since=base)
+
+    with zipfile.ZipFile(incremental) as zipf:
+        names = {name.rsplit('/', 1)[-1] for name in zipf.namelist()}
+        manifest = json.loads(zipf.read(next(name for name in zipf.namelist() if name.endswith(Manifest.NAME))))
+
+    referenced = {name for name, entry in manifest['artifacts'].items() if entry['archive'] == base.name}
+    assert manifest['base'] == base.name
+    assert manifest['hostname'] == zdiag.ZabbixDiagnostic.get_hostname()
+    assert '6_zabbix_config.txt' in referenced
+    assert not referenced & names
+
+    archive = zdiag.DiagnosticArchive(incremental).load()
+    assert archive.hostname == zdiag.ZabbixDiagnostic.get_hostname()
+    assert 'StartPollers' in archive.config()
@@ -0,0 +1,86 @@
+import struct
+
+import pytest
+
+import zdiag
+from zdiag_bench import FakeTrapper
+
+Client = zdiag.ZabbixProtocolClient
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_pack_unpack_roundtrip(compress):
+    packet = Client.pack({"request": "zabbix.stats"}, compress=compress)
+    flags, length, reserved = Client.parse_header(packet)
+
+    assert packet[:4] == Client.SIGNATURE
+    assert bool(flags & Client.FLAG_COMPRESSED) == compress
+    assert length == len(packet) - Client.header_size(flags)
+    assert Client.unpack(packet) == b'{"request":"zabbix.stats"}'
+
+
+def test_parse_header_large_packet():
+    flags = Client.FLAG_PROTOCOL | Client.FLAG_LARGE
+    header = Client.SIGNATURE + struct.pack("<BQQ", flags, 2 ** 33, 0)
+
+    assert Client.header_size(flags) == 21
+    assert Client.parse_header(header) == (flags, 2 ** 33, 0)
+
+
+@pytest.mark.parametrize('packet', [
+    b'XXXX\x01\x00\x00\x00\x00\x00\x00\x00\x00',
+    b'ZBXD\x00\x00\x00\x00\x00\x00\x00\x00\x00',
+    b'ZBXD\x01\x00\x00',
+])
+def test_parse_header_rejects_invalid(packet):
+    with pytest.raises(zdiag.ZabbixProtocolError):
+        Client.parse_header(packet)
+
+
+def test_unpack_truncated_data():
+    packet = Client.pack(b'0123456789')
+    with pytest.raises(zdiag.ZabbixProtocolError):
+        Client.unpack(packet[:-3])
+
+
+def test_unpack_compressed_size_mismatch():
+    packet = bytearray(Client.pack(b'0123456789', compress=True))
+    struct.pack_into("<I", packet, 9, 5)
+    with pytest.raises(zdiag.ZabbixProtocolError):
+        Client.unpack(bytes(packet))
+
+
+@pytest.fixture(params=['plain', 'compressed', 'large'])
+def trapper(request):
+    trapper = FakeTrapper(stats_size=64 * 1024, mode=request.param).start()
+    yield trapper
+    trapper.stop()
+
+
+def test_request_against_trapper(trapper):
+    client = Client('127.0.0.1', trapper.port, timeout=10)
+    response = client.request({"request": "zabbix.stats"})
+
+    assert response['response'] == 'success'
+    assert response['data']['hosts'] == 811
+    assert client.sock is None
+
+
+def test_request_keep_alive_reconnects(trapper):
+    # Trapper закрывает соединение после ответа, второй запрос переподключается
+    with Client('127.0.0.1', trapper.port, timeout=10) as client:
+        for _ in range(2):
+            assert client.request({"request": "zabbix.stats"}, keep_alive=True)['response'] == 'success'
+
+
+def test_receive_respects_size_limit(trapper):
+    client = Client('127.0.0.1', trapper.port, timeout=10, max_data_size=1024)
+    with pytest.raises(zdiag.ZabbixProtocolError):
+        client.request({"request": "zabbix.stats"})
+
+
+def test_aborted_client_does_not_connect(trapper):
+    client = Client('127.0.0.1', trapper.port, timeout=10)
+    client.abort()
+    with pytest.raises(zdiag.ZabbixProtocolError):
+        client.request({"request": "zabbix.stats"})
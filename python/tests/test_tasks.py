@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import zdiag
+from zdiag import CollectionTask
+
+
+class Diagnostic(zdiag.ZabbixDiagnostic):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    def task_ok(self):
+        self.calls.append('ok')
+        return True
+
+    def task_fail(self):
+        self.calls.append('fail')
+        return False
+
+    def task_wait(self):
+        # Отменяемое ожидание: задача завершается сразу после отмены
+        self.calls.append('wait')
+        self.task_control().wait(30)
+        self.task_control().check()
+        return True
+
+    def task_hang(self):
+        # Неотменяемая задача: следующая не должна ее дожидаться
+        self.calls.append('hang')
+        time.sleep(3)
+        return True
+
+
+TASKS = [
+    CollectionTask("fail", 'task_fail', zdiag.ALL_PROFILES),
+    CollectionTask("needs fail", 'task_ok', zdiag.ALL_PROFILES, deps=("fail",)),
+    CollectionTask("after fail", 'task_ok', zdiag.ALL_PROFILES, after=("fail",)),
+    CollectionTask("needs skipped", 'task_ok', zdiag.ALL_PROFILES, deps=("needs fail",)),
+    CollectionTask("wait", 'task_wait', zdiag.ALL_PROFILES, timeout=0.5),
+    CollectionTask("hang", 'task_hang', zdiag.ALL_PROFILES, timeout=0.5),
+    CollectionTask("last", 'task_ok', zdiag.ALL_PROFILES, deps=("after fail",)),
+]
+
+EXPECTED = [
+    ("fail", False),
+    ("needs fail", False),
+    ("after fail", True),
+    ("needs skipped", False),
+    ("wait", False),
+    ("hang", False),
+    ("last", True),
+]
+
+
+@pytest.mark.parametrize('serial', [True, False])
+def test_timeouts_and_dependencies(serial):
+    diag = Diagnostic(serial=serial, jobs=1 if serial else 4)
+    started = time.monotonic()
+
+    if serial:
+        results = diag.run_tasks_serial(TASKS)
+    else:
+        results = diag.run_tasks_parallel(TASKS)
+
+    assert results == EXPECTED
+    assert sorted(diag.calls) == sorted(['fail', 'ok', 'wait', 'hang', 'ok'])
+    assert time.monotonic() - started < 2.5
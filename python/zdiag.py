@@ -10,486 +10,4963 @@ import shutil
 import subprocess
 import tempfile
 import socket
+import sqlite3
 import argparse
+import ast
+import asyncio
+import bisect
+import cProfile
+import io
 import re
 import zipfile
-from datetime import datetime
+import time
+import glob
+import hashlib
+import importlib
+import http.server
+import json
+import marshal
+import math
+import pstats
+import resource
+import select
+import signal
+import socketserver
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 
 # Версия скрипта
-VERSION = "20250809"
+VERSION = "20261017"
+
+# Количество параллельно выполняемых задач по умолчанию
+DEFAULT_JOBS = 4
+
+# Корень файловой системы procfs
+PROC_ROOT = "/proc"
+
+# Расположение os-release в порядке приоритета
+OS_RELEASE_PATHS = ("/etc/os-release", "/usr/lib/os-release")
+
+# Файлы utmp для подсчета вошедших пользователей
+UTMP_PATHS = ("/run/utmp", "/var/run/utmp")
+
+# Параметры встроенного сэмплера системных метрик (аналог vmstat 1 30)
+DEFAULT_SAMPLE_INTERVAL = 1.0
+DEFAULT_SAMPLE_DURATION = 30
+
+# Секции zabbix_server -R diaginfo=<секция> в порядке вывода полного diaginfo
+# и таймаут на одну секцию в секундах
+DIAGINFO_SECTIONS = ('historycache', 'valuecache', 'preprocessing', 'lld', 'alerting', 'locks', 'connector')
+DEFAULT_DIAGINFO_TIMEOUT = 30
+
+# Порт trapper'а zabbix_server по умолчанию
+DEFAULT_TRAPPER_PORT = 10051
+
+# Интервал между замерами в режиме наблюдения (--watch), в секундах
+DEFAULT_WATCH_INTERVAL = 10
+
+# Замер задержек trapper'а и БД (задача 2.2): число запросов в каждом режиме,
+# пауза между ними, границы корзин гистограммы в миллисекундах и драйверы БД
+# в порядке предпочтения (устанавливаются отдельно, не обязательны)
+DEFAULT_PROBE_COUNT = 20
+DEFAULT_PROBE_INTERVAL = 0.1
+DEFAULT_PROBE_DB_TIMEOUT = 10
+PROBE_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PROBE_DB_DRIVERS = {
+    'mysql': ('MySQLdb', 'pymysql'),
+    'postgresql': ('psycopg2', 'psycopg'),
+}
+
+# Методы сжатия архива; веб-интерфейс (JSZip) читает только deflate и store
+COMPRESSION_METHODS = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'store': zipfile.ZIP_STORED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'xz': zipfile.ZIP_LZMA,
+    'zstd': getattr(zipfile, 'ZIP_ZSTANDARD', None),
+}
+DEFAULT_COMPRESSION = 'deflate'
+
+# Параметры опроса нескольких серверов (--fleet)
+DEFAULT_FLEET_CONCURRENCY = 10
+DEFAULT_FLEET_RETRIES = 2
+
+# Параметры сэмплера процессов zabbix_server
+DEFAULT_WORKER_SAMPLES = 10
+DEFAULT_WORKER_INTERVAL = 1.0
+
+# Профили сбора (--profile): параметры по умолчанию и приоритет процесса.
+# light - для нагруженных серверов и запуска из cron: без diaginfo (блокировки
+# внутри zabbix_server), ps aux и cpuinfo, с короткими замерами
+COLLECTION_PROFILES = {
+    'light': {'sample_duration': 5, 'worker_samples': 3, 'probe_count': 5, 'nice': 19, 'ionice': 'idle'},
+    'standard': {'nice': 10, 'ionice': 'best-effort'},
+    'deep': {'sample_duration': 60, 'worker_samples': 30, 'watch_duration': 60, 'probe_count': 100,
+             'nice': 0, 'ionice': 'none'},
+}
+DEFAULT_PROFILE = 'standard'
+
+# Аргументы ionice для классов ввода-вывода
+IONICE_CLASSES = {
+    'idle': ['-c', '3'],
+    'best-effort': ['-c', '2', '-n', '7'],
+    'none': None,
+}
+
+# Режим демона (--daemon): длина буфера в секундах, пауза между выгрузками
+# по условиям и количество хранимых выгрузок
+DEFAULT_DAEMON_WINDOW = 600
+DEFAULT_DAEMON_COOLDOWN = 300
+DEFAULT_DAEMON_DIR = "/tmp/zdiag-dumps"
+DEFAULT_DAEMON_MAX_DUMPS = 10
+
+# Экспорт метрик для Prometheus (--exporter, --textfile): адрес HTTP-сервера
+# и время жизни закэшированного ответа zabbix.stats в секундах
+DEFAULT_EXPORTER_LISTEN = "0.0.0.0:9224"
+DEFAULT_EXPORTER_TTL = 10
+
+# Инкрементальный сбор (--since): поля /proc/cpuinfo, которые меняются между
+# запусками и не учитываются при сравнении с предыдущим архивом
+CPUINFO_VOLATILE_FIELDS = ('cpu mhz', 'bogomips')
+
+# Количество процессов для анализа архивов (analyze)
+DEFAULT_ANALYZE_JOBS = os.cpu_count() or 4
+
+# Файл индекса архивов (index)
+DEFAULT_INDEX_DB = "zdiag-index.sqlite"
+
+
+class ZabbixServerConfig:
+    """Конфигурация zabbix_server, прочитанная один раз за запуск
+
+    Файлы читаются построчно за один проход с учетом директив Include (файл,
+    директория или маска); циклические Include пропускаются. Для каждого
+    параметра запоминается файл и строка, где он задан. При повторении
+    параметра действует последнее значение, как и в самом zabbix_server,
+    кроме параметров из MULTI_VALUE, у которых действуют все значения.
+    """
+
+    # Параметры, которые можно задавать несколько раз (каждое значение действует)
+    MULTI_VALUE = frozenset({'LoadModule'})
+
+    # Параметры, которые не попадают в архив: учетные данные БД и Vault,
+    # пути к ключам и сертификатам TLS, список разрешенных адресов
+    SENSITIVE = re.compile(r'DB(?:Host|Name|User|Password)|StatsAllowedIP|Vault\w*|(?:DB)?TLS\w*File')
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.params = {}
+        self.sources = {}
+        self.files = []
+        self.cycles = []
+
+    @classmethod
+    def load(cls, path):
+        """Чтение основного файла конфигурации и всех включаемых файлов"""
+        config = cls(path)
+        config._read(path, [])
+        return config
+
+    def _read(self, path, stack):
+        real = os.path.realpath(path)
+        if real in stack:
+            cycle = ' -> '.join(stack[stack.index(real):] + [real])
+            print(f"Циклический Include пропущен: {cycle}")
+            self.cycles.append(cycle)
+            return
+
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            if path not in self.files:
+                self.files.append(path)
+            stack.append(real)
+            try:
+                for lineno, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line or line.startswith('#') or '=' not in line:
+                        continue
+
+                    key, value = line.split('=', 1)
+                    key, value = key.strip(), value.strip()
+
+                    if key == 'Include':
+                        self._include(value, os.path.dirname(path), stack)
+                    else:
+                        self.params[key] = value
+                        self.sources[key] = (path, lineno)
+                        self.entries.append((key, value, path, lineno))
+            finally:
+                stack.pop()
+
+    def _include(self, pattern, base_dir, stack):
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(base_dir, pattern)
+
+        if os.path.isdir(pattern):
+            paths = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            paths = sorted(glob.glob(pattern))
+
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            try:
+                self._read(path, stack)
+            except OSError as e:
+                print(f"Не удалось прочитать включаемый конфиг {path}: {e}")
+
+    def get(self, key, default=None):
+        """Эффективное значение параметра"""
+        return self.params.get(key, default)
+
+    def effective(self):
+        """Действующие параметры (key, value, path, lineno) в порядке чтения файлов"""
+        last = {entry[0]: index for index, entry in enumerate(self.entries)}
+        return [entry for index, entry in enumerate(self.entries)
+                if entry[0] in self.MULTI_VALUE or last[entry[0]] == index]
+
+    def redacted(self):
+        """Действующие параметры без чувствительных и имена исключенных параметров"""
+        kept, excluded = [], set()
+        for entry in self.effective():
+            if self.SENSITIVE.fullmatch(entry[0]):
+                excluded.add(entry[0])
+            else:
+                kept.append(entry)
+        return kept, sorted(excluded)
+
+    def fingerprint(self):
+        """Путь, размер и время изменения прочитанных файлов для сравнения с предыдущим сбором"""
+        result = []
+        for path in self.files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            result.append([path, stat.st_size, stat.st_mtime_ns])
+        return result
+
+
+class ZabbixServerDiscovery:
+    """Поиск процесса zabbix_server через /proc без запуска ps"""
+
+    def __init__(self, proc_root=PROC_ROOT):
+        self.proc_root = proc_root
+
+    def iter_pids(self):
+        """Идентификаторы всех процессов в системе"""
+        try:
+            names = os.listdir(self.proc_root)
+        except OSError:
+            return
+        for name in names:
+            if name.isdigit():
+                yield int(name)
+
+    def read_cmdline(self, pid):
+        """Аргументы командной строки процесса"""
+        try:
+            with open(os.path.join(self.proc_root, str(pid), 'cmdline'), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return []
+        return [arg.decode('utf-8', errors='replace') for arg in raw.split(b'\0') if arg]
+
+    def resolve_path(self, pid, path):
+        """Относительный путь процесса приводится к абсолютному через /proc/<pid>/cwd"""
+        if os.path.isabs(path):
+            return path
+        try:
+            cwd = os.readlink(os.path.join(self.proc_root, str(pid), 'cwd'))
+            return os.path.normpath(os.path.join(cwd, path))
+        except OSError:
+            return path
+
+    def find_processes(self):
+        """Все процессы zabbix_server: список кортежей (pid, заголовок процесса)"""
+        processes = []
+        for pid in self.iter_pids():
+            args = self.read_cmdline(pid)
+            if args and 'zabbix_server' in args[0]:
+                processes.append((pid, ' '.join(args)))
+        return processes
+
+    def find_server(self):
+        """Поиск основного процесса zabbix_server, запущенного с -c
+
+        Возвращает кортеж (pid, путь к бинарнику, путь к конфигу) или None.
+        """
+        for pid in self.iter_pids():
+            args = self.read_cmdline(pid)
+            if len(args) == 1 and ' ' in args[0]:
+                # Заголовок процесса мог быть перезаписан одной строкой
+                args = args[0].split()
+            if not args or not args[0].endswith('zabbix_server'):
+                continue
+
+            config_path = None
+            for i, arg in enumerate(args[1:], 1):
+                if arg in ('-c', '--config') and i + 1 < len(args):
+                    config_path = args[i + 1]
+                    break
+                if arg.startswith('--config='):
+                    config_path = arg.split('=', 1)[1]
+                    break
+
+            if not config_path:
+                continue
+
+            binary_path = args[0]
+            if not os.path.isabs(binary_path):
+                binary_path = shutil.which(binary_path) or self.resolve_path(pid, binary_path)
+
+            return pid, binary_path, self.resolve_path(pid, config_path)
+
+        return None
+
+
+class SystemInfoCollector:
+    """Чтение системной информации напрямую из /proc и /etc без запуска утилит
+
+    Формат результата повторяет вывод free -b, uptime, nproc и cat, чтобы
+    веб-интерфейс разбирал файлы так же, как раньше. Работает в минимальных
+    контейнерах без procps.
+    """
+
+    # Формат записи utmp в Linux: ut_type (short) в начале записи размером 384 байта
+    UTMP_RECORD_SIZE = 384
+    UTMP_USER_PROCESS = 7
+
+    def __init__(self, proc_root=PROC_ROOT):
+        self.proc_root = proc_root
+
+    def read_proc(self, name):
+        """Чтение файла из procfs целиком"""
+        with open(os.path.join(self.proc_root, name), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def read_meminfo(self):
+        """Содержимое /proc/meminfo в байтах"""
+        meminfo = {}
+        for line in self.read_proc('meminfo').splitlines():
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            value = int(parts[1])
+            if len(parts) > 2 and parts[2] == 'kB':
+                value *= 1024
+            meminfo[parts[0].rstrip(':')] = value
+        return meminfo
+
+    def free_text(self):
+        """Аналог вывода free -b (procps-ng)"""
+        mem = self.read_meminfo()
+        total = mem.get('MemTotal', 0)
+        free = mem.get('MemFree', 0)
+        buffers = mem.get('Buffers', 0)
+        cached = mem.get('Cached', 0) + mem.get('SReclaimable', 0)
+        shared = mem.get('Shmem', 0)
+        if 'MemAvailable' in mem:
+            available = mem['MemAvailable']
+            used = total - available
+        else:
+            available = free + buffers + cached
+            used = total - free - buffers - cached
+
+        swap_total = mem.get('SwapTotal', 0)
+        swap_free = mem.get('SwapFree', 0)
+
+        return (
+            f"{'':14}{'total':>6}{'used':>12}{'free':>12}{'shared':>12}{'buff/cache':>12}{'available':>12}\n"
+            f"Mem:   {total:>13}{used:>12}{free:>12}{shared:>12}{buffers + cached:>12}{available:>12}\n"
+            f"Swap:  {swap_total:>13}{swap_total - swap_free:>12}{swap_free:>12}\n"
+        )
+
+    def count_users(self):
+        """Количество пользовательских сессий из utmp"""
+        for path in UTMP_PATHS:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+
+            users = 0
+            for offset in range(0, len(data) - self.UTMP_RECORD_SIZE + 1, self.UTMP_RECORD_SIZE):
+                ut_type = struct.unpack_from('<h', data, offset)[0]
+                if ut_type == self.UTMP_USER_PROCESS:
+                    users += 1
+            return users
+        return 0
+
+    def uptime_text(self):
+        """Аналог вывода uptime (procps-ng)"""
+        uptime_seconds = int(float(self.read_proc('uptime').split()[0]))
+        loadavg = self.read_proc('loadavg').split()[:3]
+
+        days, rest = divmod(uptime_seconds, 86400)
+        hours, rest = divmod(rest, 3600)
+        minutes = rest // 60
+
+        up = ""
+        if days:
+            up += f"{days} day{'s' if days != 1 else ''}, "
+        if hours:
+            up += f"{hours:2d}:{minutes:02d}, "
+        else:
+            up += f"{minutes} min, "
+
+        users = self.count_users()
+        load = ", ".join(f"{float(value):.2f}" for value in loadavg)
+
+        return (
+            f" {datetime.now().strftime('%H:%M:%S')} up {up} {users} user{'s' if users != 1 else ''}, "
+            f" load average: {load}\n"
+        )
+
+    def nproc(self):
+        """Количество доступных процессу CPU, как у nproc"""
+        try:
+            return len(os.sched_getaffinity(0))
+        except (AttributeError, OSError):
+            return os.cpu_count() or 1
+
+    def cpuinfo_text(self):
+        """Содержимое /proc/cpuinfo"""
+        return self.read_proc('cpuinfo')
+
+    @staticmethod
+    def stable_cpuinfo(content):
+        """/proc/cpuinfo без полей, меняющихся между запусками (частота, bogomips)"""
+        return '\n'.join(
+            line for line in content.splitlines()
+            if line.split(':', 1)[0].strip().lower() not in CPUINFO_VOLATILE_FIELDS
+        )
+
+    def os_release(self):
+        """Путь и содержимое первого найденного os-release"""
+        for path in OS_RELEASE_PATHS:
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    return path, f.read()
+            except OSError:
+                continue
+        raise FileNotFoundError(f"Файл os-release не найден: {', '.join(OS_RELEASE_PATHS)}")
+
+
+class ProcFile:
+    """Файл procfs, открытый один раз и перечитываемый через pread"""
+
+    def __init__(self, path, bufsize=65536):
+        self.path = path
+        self.bufsize = bufsize
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        """Текущее содержимое файла (bytes)"""
+        while True:
+            data = os.pread(self.fd, self.bufsize, 0)
+            if len(data) < self.bufsize:
+                return data
+            self.bufsize *= 2
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SystemSampler:
+    """Высокочастотный сэмплер системных метрик из /proc
+
+    Читает /proc/stat, /proc/vmstat, /proc/meminfo и /proc/pressure/* с
+    заданным интервалом. Результат каждого интервала содержит те же колонки,
+    что и vmstat (скорости в секунду, память в KiB, CPU в процентах), и
+    дополнительно долю времени простоя по PSI.
+    """
+
+    VMSTAT_COLUMNS = (
+        'r', 'b', 'swpd', 'free', 'buff', 'cache', 'si', 'so',
+        'bi', 'bo', 'in', 'cs', 'us', 'sy', 'id', 'wa', 'st'
+    )
+    PSI_RESOURCES = ('cpu', 'io', 'memory')
+
+    def __init__(self, proc_root=PROC_ROOT):
+        self.proc_root = proc_root
+        self.files = {}
+
+    def open(self):
+        """Открытие файлов procfs; отсутствующие PSI-файлы пропускаются"""
+        for name in ('stat', 'vmstat', 'meminfo'):
+            self.files[name] = ProcFile(os.path.join(self.proc_root, name))
+        for resource in self.PSI_RESOURCES:
+            try:
+                self.files[f"psi_{resource}"] = ProcFile(
+                    os.path.join(self.proc_root, 'pressure', resource), bufsize=4096
+                )
+            except OSError:
+                pass
+
+    def close(self):
+        for proc_file in self.files.values():
+            proc_file.close()
+        self.files = {}
+
+    def snapshot(self):
+        """Снимок счетчиков на текущий момент"""
+        snap = {'time': time.monotonic()}
+
+        for line in self.files['stat'].read().split(b'\n'):
+            if line.startswith(b'cpu '):
+                ticks = [int(value) for value in line.split()[1:9]]
+                ticks += [0] * (8 - len(ticks))
+                snap['cpu'] = ticks
+            elif line.startswith(b'intr '):
+                snap['intr'] = int(line.split(None, 2)[1])
+            elif line.startswith(b'ctxt '):
+                snap['ctxt'] = int(line.split()[1])
+            elif line.startswith(b'procs_running '):
+                snap['r'] = int(line.split()[1])
+            elif line.startswith(b'procs_blocked '):
+                snap['b'] = int(line.split()[1])
+
+        vmstat = {}
+        for line in self.files['vmstat'].read().split(b'\n'):
+            parts = line.split()
+            if len(parts) == 2 and parts[0] in (b'pswpin', b'pswpout', b'pgpgin', b'pgpgout'):
+                vmstat[parts[0].decode()] = int(parts[1])
+        snap['vmstat'] = vmstat
+
+        meminfo = {}
+        for line in self.files['meminfo'].read().split(b'\n'):
+            parts = line.split()
+            if len(parts) >= 2:
+                meminfo[parts[0].rstrip(b':').decode()] = int(parts[1])
+        snap['meminfo'] = meminfo
+
+        psi = {}
+        for resource in self.PSI_RESOURCES:
+            proc_file = self.files.get(f"psi_{resource}")
+            if not proc_file:
+                continue
+            for line in proc_file.read().split(b'\n'):
+                parts = line.split()
+                if parts and parts[-1].startswith(b'total='):
+                    psi[f"{resource}_{parts[0].decode()}"] = int(parts[-1][6:])
+        snap['psi'] = psi
+
+        return snap
+
+    def row(self, prev, cur):
+        """Значения метрик за интервал между двумя снимками"""
+        elapsed = max(cur['time'] - prev['time'], 1e-6)
+
+        def rate(delta):
+            return delta / elapsed
+
+        cpu_delta = [c - p for c, p in zip(cur['cpu'], prev['cpu'])]
+        user, nice, system, idle, iowait, irq, softirq, steal = cpu_delta
+        total_ticks = sum(cpu_delta) or 1
+
+        def pct(ticks):
+            return round(100.0 * ticks / total_ticks, 1)
+
+        mem = cur['meminfo']
+        page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+        vm_prev, vm_cur = prev['vmstat'], cur['vmstat']
+
+        def vm_delta(key):
+            return vm_cur.get(key, 0) - vm_prev.get(key, 0)
+
+        row = {
+            'r': cur.get('r', 0),
+            'b': cur.get('b', 0),
+            'swpd': mem.get('SwapTotal', 0) - mem.get('SwapFree', 0),
+            'free': mem.get('MemFree', 0),
+            'buff': mem.get('Buffers', 0),
+            'cache': mem.get('Cached', 0) + mem.get('SReclaimable', 0),
+            'si': round(rate(vm_delta('pswpin') * page_kb)),
+            'so': round(rate(vm_delta('pswpout') * page_kb)),
+            'bi': round(rate(vm_delta('pgpgin'))),
+            'bo': round(rate(vm_delta('pgpgout'))),
+            'in': round(rate(cur.get('intr', 0) - prev.get('intr', 0))),
+            'cs': round(rate(cur.get('ctxt', 0) - prev.get('ctxt', 0))),
+            'us': pct(user + nice),
+            'sy': pct(system + irq + softirq),
+            'id': pct(idle),
+            'wa': pct(iowait),
+            'st': pct(steal),
+        }
+
+        # PSI total - накопленное время простоя в микросекундах
+        for key, total in cur['psi'].items():
+            stalled = total - prev['psi'].get(key, total)
+            row[f"psi_{key}"] = round(100.0 * stalled / (elapsed * 1e6), 2)
+
+        return row
+
+    def capture(self, interval, duration, stop_event=None):
+        """Сбор метрик с интервалом interval в течение duration секунд
+
+        Возвращает список строк-словарей; в поле t записывается смещение
+        конца интервала от начала сбора в секундах. При установке stop_event
+        сбор прекращается досрочно.
+        """
+        self.open()
+        try:
+            rows = []
+            prev = self.snapshot()
+            start = prev['time']
+            count = max(1, int(round(duration / interval)))
+
+            for i in range(1, count + 1):
+                delay = start + i * interval - time.monotonic()
+                if stop_event is not None:
+                    if stop_event.wait(max(delay, 0)):
+                        break
+                elif delay > 0:
+                    time.sleep(delay)
+
+                cur = self.snapshot()
+                row = {'t': round(cur['time'] - start, 3)}
+                row.update(self.row(prev, cur))
+                rows.append(row)
+                prev = cur
+
+            return rows
+        finally:
+            self.close()
+
+    def vmstat_text(self, rows):
+        """Вывод в формате vmstat для DataParser.parseVmstat"""
+        lines = [
+            "procs -----------memory---------- ---swap-- -----io---- -system-- ------cpu-----",
+            " r  b   swpd   free   buff  cache   si   so    bi    bo   in   cs us sy id wa st",
+        ]
+        for row in rows:
+            lines.append(
+                f"{row['r']:2d} {row['b']:2d} {row['swpd']:6d} {row['free']:6d} {row['buff']:6d} "
+                f"{row['cache']:6d} {row['si']:4d} {row['so']:4d} {row['bi']:5d} {row['bo']:5d} "
+                f"{row['in']:4d} {row['cs']:4d} {round(row['us']):2d} {round(row['sy']):2d} "
+                f"{round(row['id']):2d} {round(row['wa']):2d} {round(row['st']):2d}"
+            )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def columnar(rows):
+        """Компактное колоночное представление: имя колонки -> список значений"""
+        columns = {}
+        for row in rows:
+            for key in row:
+                if key not in columns:
+                    columns[key] = []
+        for key, values in columns.items():
+            values.extend(row.get(key) for row in rows)
+        return columns
+
+
+class WorkerSampler:
+    """Сэмплер нагрузки процессов zabbix_server по /proc/<pid>/stat, status и io
+
+    Файлы каждого процесса открываются один раз, каждый замер - это один
+    pread на файл без fork и повторных open. Процесс помечается по
+    заголовку, который выставляет zabbix_server (например, "history syncer #3").
+    """
+
+    TITLE_PATTERN = re.compile(r'zabbix_server:\s*([^#\[\]]+?)\s*(?:#(\d+))?\s*(?:\[|$)')
+
+    def __init__(self, proc_root=PROC_ROOT):
+        self.proc_root = proc_root
+        self.discovery = ZabbixServerDiscovery(proc_root)
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.workers = {}
+
+    @classmethod
+    def parse_title(cls, title):
+        """Тип процесса и метка вида "history syncer #3" по его заголовку"""
+        match = cls.TITLE_PATTERN.search(title)
+        if match:
+            process_type = match.group(1).strip()
+            label = f"{process_type} #{match.group(2)}" if match.group(2) else process_type
+            return process_type, label
+        if re.search(r'zabbix_server\s+-c\s+', title) or ' -c ' in title:
+            return 'main server', 'main server'
+        return 'unknown', 'unknown'
+
+    def open(self):
+        """Поиск процессов zabbix_server и открытие их файлов в /proc"""
+        for pid, title in self.discovery.find_processes():
+            base = os.path.join(self.proc_root, str(pid))
+            files = {}
+            try:
+                files['stat'] = ProcFile(os.path.join(base, 'stat'), bufsize=4096)
+                files['status'] = ProcFile(os.path.join(base, 'status'), bufsize=8192)
+            except OSError:
+                for proc_file in files.values():
+                    proc_file.close()
+                continue
+            try:
+                # /proc/<pid>/io доступен только владельцу процесса или root
+                files['io'] = ProcFile(os.path.join(base, 'io'), bufsize=4096)
+            except OSError:
+                pass
+
+            process_type, label = self.parse_title(title)
+            self.workers[pid] = {
+                'pid': pid,
+                'type': process_type,
+                'label': label,
+                'title': title,
+                'files': files,
+            }
+
+    def close(self):
+        for worker in self.workers.values():
+            for proc_file in worker['files'].values():
+                proc_file.close()
+        self.workers = {}
+
+    def read_worker(self, worker):
+        """Снимок счетчиков одного процесса"""
+        files = worker['files']
+
+        stat = files['stat'].read()
+        # Имя процесса в скобках может содержать пробелы, поля считаем после ')'
+        fields = stat[stat.rindex(b')') + 2:].split()
+        snap = {
+            'cpu_ticks': int(fields[11]) + int(fields[12]),
+            'rss': int(fields[21]) * self.page_size,
+        }
+
+        for line in files['status'].read().split(b'\n'):
+            if line.startswith(b'voluntary_ctxt_switches:'):
+                snap['voluntary_ctxt_switches'] = int(line.split()[1])
+            elif line.startswith(b'nonvoluntary_ctxt_switches:'):
+                snap['nonvoluntary_ctxt_switches'] = int(line.split()[1])
+
+        if 'io' in files:
+            try:
+                for line in files['io'].read().split(b'\n'):
+                    if line.startswith(b'read_bytes:'):
+                        snap['read_bytes'] = int(line.split()[1])
+                    elif line.startswith(b'write_bytes:'):
+                        snap['write_bytes'] = int(line.split()[1])
+            except OSError:
+                pass
+
+        return snap
+
+    def snapshot(self):
+        """Снимок всех процессов; завершившиеся процессы исключаются"""
+        snap = {'time': time.monotonic(), 'workers': {}}
+        for pid, worker in list(self.workers.items()):
+            try:
+                snap['workers'][pid] = self.read_worker(worker)
+            except (OSError, ValueError, IndexError):
+                for proc_file in worker['files'].values():
+                    proc_file.close()
+                del self.workers[pid]
+        return snap
+
+    def interval(self, prev, cur):
+        """Показатели процессов за интервал: pid -> словарь метрик"""
+        elapsed = max(cur['time'] - prev['time'], 1e-6)
+        result = {}
+
+        for pid, now in cur['workers'].items():
+            before = prev['workers'].get(pid)
+            if before is None:
+                continue
+
+            def rate(key):
+                if key not in now or key not in before:
+                    return None
+                return round((now[key] - before[key]) / elapsed, 1)
+
+            result[pid] = {
+                'cpu_pct': round(100.0 * (now['cpu_ticks'] - before['cpu_ticks'])
+                                 / self.clock_ticks / elapsed, 2),
+                'rss': now['rss'],
+                'voluntary_ctxt_switches_per_sec': rate('voluntary_ctxt_switches'),
+                'nonvoluntary_ctxt_switches_per_sec': rate('nonvoluntary_ctxt_switches'),
+                'read_bytes_per_sec': rate('read_bytes'),
+                'write_bytes_per_sec': rate('write_bytes'),
+            }
+
+        return result
+
+    def capture(self, samples, interval, stop_event=None):
+        """Сбор samples интервалов длительностью interval секунд
+
+        При установке stop_event сбор прекращается досрочно.
+        """
+        self.open()
+        try:
+            prev = self.snapshot()
+            start = prev['time']
+            intervals = []
+
+            for i in range(1, samples + 1):
+                delay = start + i * interval - time.monotonic()
+                if stop_event is not None:
+                    if stop_event.wait(max(delay, 0)):
+                        break
+                elif delay > 0:
+                    time.sleep(delay)
+                cur = self.snapshot()
+                intervals.append(self.interval(prev, cur))
+                prev = cur
+
+            return self.summarize(intervals)
+        finally:
+            self.close()
+
+    def summarize(self, intervals):
+        """Сводка по процессам и по типам процессов"""
+        processes = []
+        by_type = {}
+
+        for pid, worker in sorted(self.workers.items()):
+            series = [item[pid] for item in intervals if pid in item]
+            if not series:
+                continue
+
+            cpu = [item['cpu_pct'] for item in series]
+
+            def total_rate(key):
+                values = [item[key] for item in series if item[key] is not None]
+                return round(sum(values) / len(values), 1) if values else None
+
+            process = {
+                'pid': pid,
+                'type': worker['type'],
+                'label': worker['label'],
+                'title': worker['title'],
+                'cpu_pct_avg': round(sum(cpu) / len(cpu), 2),
+                'cpu_pct_max': max(cpu),
+                'cpu_pct': cpu,
+                'rss': series[-1]['rss'],
+                'rss_max': max(item['rss'] for item in series),
+                'voluntary_ctxt_switches_per_sec': total_rate('voluntary_ctxt_switches_per_sec'),
+                'nonvoluntary_ctxt_switches_per_sec': total_rate('nonvoluntary_ctxt_switches_per_sec'),
+                'read_bytes_per_sec': total_rate('read_bytes_per_sec'),
+                'write_bytes_per_sec': total_rate('write_bytes_per_sec'),
+            }
+            processes.append(process)
+
+            group = by_type.setdefault(worker['type'], {
+                'type': worker['type'],
+                'count': 0,
+                'cpu_pct_avg': 0.0,
+                'cpu_pct_max': 0.0,
+                'rss': 0,
+                'voluntary_ctxt_switches_per_sec': 0.0,
+                'nonvoluntary_ctxt_switches_per_sec': 0.0,
+                'read_bytes_per_sec': 0.0,
+                'write_bytes_per_sec': 0.0,
+            })
+            group['count'] += 1
+            group['cpu_pct_avg'] = round(group['cpu_pct_avg'] + process['cpu_pct_avg'], 2)
+            group['cpu_pct_max'] = max(group['cpu_pct_max'], process['cpu_pct_max'])
+            group['rss'] += process['rss']
+            for key in ('voluntary_ctxt_switches_per_sec', 'nonvoluntary_ctxt_switches_per_sec',
+                        'read_bytes_per_sec', 'write_bytes_per_sec'):
+                if process[key] is not None:
+                    group[key] = round(group[key] + process[key], 1)
+
+        return {
+            'processes': processes,
+            'types': sorted(by_type.values(), key=lambda item: item['cpu_pct_avg'], reverse=True),
+        }
+
+
+class ZabbixProtocolError(Exception):
+    """Ошибка обмена данными по протоколу Zabbix"""
+
+
+class ZabbixProtocolClient:
+    """Клиент протокола Zabbix (заголовок ZBXD) для запросов к trapper'у
+
+    Ответ принимается в заранее выделенный bytearray через recv_into без
+    копирования частей. Поддерживаются флаги сжатия (0x02) и больших
+    пакетов (0x04).
+    """
+
+    SIGNATURE = b"ZBXD"
+    FLAG_PROTOCOL = 0x01
+    FLAG_COMPRESSED = 0x02
+    FLAG_LARGE = 0x04
+
+    # Максимальный размер принимаемых данных (как ZBX_MAX_RECV_DATA_SIZE)
+    MAX_DATA_SIZE = 1024 * 1024 * 1024
+
+    def __init__(self, host='localhost', port=DEFAULT_TRAPPER_PORT, timeout=60,
+                 compress=False, max_data_size=MAX_DATA_SIZE):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.compress = compress
+        self.max_data_size = max_data_size
+        self.sock = None
+        self.aborted = False
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @classmethod
+    def pack(cls, data, compress=False):
+        """Упаковка данных (dict или bytes) в пакет протокола Zabbix"""
+        if not isinstance(data, (bytes, bytearray)):
+            data = json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+        flags = cls.FLAG_PROTOCOL
+        reserved = 0
+        if compress:
+            flags |= cls.FLAG_COMPRESSED
+            reserved = len(data)
+            data = zlib.compress(data)
+
+        if len(data) > 0xFFFFFFFF or reserved > 0xFFFFFFFF:
+            header = cls.SIGNATURE + struct.pack("<BQQ", flags | cls.FLAG_LARGE, len(data), reserved)
+        else:
+            header = cls.SIGNATURE + struct.pack("<BII", flags, len(data), reserved)
+        return header + data
+
+    @classmethod
+    def header_size(cls, flags):
+        """Полный размер заголовка для заданных флагов"""
+        return 5 + (16 if flags & cls.FLAG_LARGE else 8)
+
+    @classmethod
+    def parse_header(cls, header):
+        """Разбор заголовка: (флаги, длина данных, исходная длина для сжатых данных)"""
+        if header[:4] != cls.SIGNATURE:
+            raise ZabbixProtocolError("Некорректная сигнатура протокола")
+
+        flags = header[4]
+        if not flags & cls.FLAG_PROTOCOL:
+            raise ZabbixProtocolError(f"Неподдерживаемые флаги протокола: 0x{flags:02x}")
+
+        if len(header) < cls.header_size(flags):
+            raise ZabbixProtocolError("Получен неполный заголовок")
+
+        if flags & cls.FLAG_LARGE:
+            data_length, reserved = struct.unpack_from("<QQ", header, 5)
+        else:
+            data_length, reserved = struct.unpack_from("<II", header, 5)
+        return flags, data_length, reserved
+
+    @classmethod
+    def unpack(cls, packet):
+        """Извлечение данных из полного пакета (bytes)"""
+        if len(packet) < 5:
+            raise ZabbixProtocolError("Получен слишком короткий ответ")
+
+        flags, data_length, reserved = cls.parse_header(packet)
+        offset = cls.header_size(flags)
+        data = memoryview(packet)[offset:offset + data_length]
+        if len(data) < data_length:
+            raise ZabbixProtocolError(f"Получено {len(data)} байт данных из {data_length}")
+        return cls.decode_data(flags, data, reserved)
+
+    @classmethod
+    def decode_data(cls, flags, data, reserved):
+        """Распаковка сжатых данных при необходимости"""
+        if flags & cls.FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+            if reserved and len(data) != reserved:
+                raise ZabbixProtocolError(
+                    f"Размер распакованных данных {len(data)} не совпадает с заявленным {reserved}"
+                )
+            return data
+        return bytes(data)
+
+    def connect(self):
+        if self.aborted:
+            raise ZabbixProtocolError("Запрос прерван")
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def abort(self):
+        """Прерывание ожидающих send/recv из другого потока (при отмене задачи)"""
+        self.aborted = True
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def send(self, data):
+        self.sock.sendall(self.pack(data, self.compress))
+
+    def _recv_into(self, view):
+        """Чтение ровно len(view) байт в буфер"""
+        received = 0
+        while received < len(view):
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise ZabbixProtocolError(
+                    f"Соединение закрыто, получено {received} байт из {len(view)}"
+                )
+            received += count
+
+    def read_packet(self):
+        """Разбор одного пакета по частям, общий для синхронного и asyncio приема
+
+        Генератор отдает буферы (memoryview), которые вызывающий заполняет
+        ровно до их длины, и возвращает данные пакета через StopIteration.
+        """
+        header = bytearray(21)
+        view = memoryview(header)
+        yield view[:5]
+
+        if header[:4] != self.SIGNATURE:
+            raise ZabbixProtocolError("Некорректная сигнатура протокола")
+
+        size = self.header_size(header[4])
+        yield view[5:size]
+        flags, data_length, reserved = self.parse_header(header[:size])
+
+        limit = reserved if flags & self.FLAG_COMPRESSED else data_length
+        if data_length > self.max_data_size or limit > self.max_data_size:
+            raise ZabbixProtocolError(f"Размер ответа {limit} превышает лимит {self.max_data_size}")
+
+        buffer = bytearray(data_length)
+        yield memoryview(buffer)
+        return self.decode_data(flags, buffer, reserved)
+
+    def receive(self):
+        """Прием одного пакета, возвращает данные (bytes)"""
+        packet = self.read_packet()
+        try:
+            while True:
+                self._recv_into(next(packet))
+        except StopIteration as e:
+            return e.value
+
+    async def receive_async(self, reader):
+        """Прием одного пакета из asyncio.StreamReader, возвращает данные (bytes)"""
+        packet = self.read_packet()
+        try:
+            while True:
+                view = next(packet)
+                try:
+                    view[:] = await reader.readexactly(len(view))
+                except asyncio.IncompleteReadError as e:
+                    raise ZabbixProtocolError(
+                        f"Соединение закрыто, получено {len(e.partial)} байт из {len(view)}"
+                    )
+        except StopIteration as e:
+            return e.value
+
+    @staticmethod
+    def decode_json(response):
+        try:
+            return json.loads(response.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ZabbixProtocolError(f"Ошибка парсинга JSON: {e}")
+
+    async def request_async(self, data):
+        """Запрос через asyncio на отдельном соединении; таймаут задает вызывающий"""
+        if self.aborted:
+            raise ZabbixProtocolError("Запрос прерван")
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(self.pack(data, self.compress))
+            await writer.drain()
+            response = await self.receive_async(reader)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        return self.decode_json(response)
+
+    def request(self, data, keep_alive=False):
+        """Отправка JSON запроса и получение JSON ответа
+
+        Если соединение не открыто, оно создается на время запроса. При
+        keep_alive=True соединение остается открытым для следующих запросов;
+        если сервер закрыл его после предыдущего ответа, выполняется
+        переподключение.
+        """
+        reused = self.sock is not None
+        if not reused:
+            self.connect()
+        try:
+            try:
+                self.send(data)
+                response = self.receive()
+            except (ZabbixProtocolError, ConnectionError):
+                if not reused:
+                    raise
+                self.close()
+                self.connect()
+                self.send(data)
+                response = self.receive()
+        finally:
+            if not reused and not keep_alive:
+                self.close()
+        return self.decode_json(response)
+
+
+class StatsRateCalculator:
+    """Расчет приращений и скоростей счетчиков zabbix.stats между замерами"""
+
+    COUNTERS = (
+        'vcache.cache.requests',
+        'vcache.cache.hits',
+        'vcache.cache.misses',
+        'wcache.values.all',
+        'wcache.values.float',
+        'wcache.values.uint',
+        'wcache.values.str',
+        'wcache.values.log',
+        'wcache.values.text',
+        'wcache.values.not supported',
+    )
+
+    def __init__(self):
+        self.prev_time = None
+        self.prev_values = {}
+
+    @staticmethod
+    def lookup(data, path):
+        """Значение по пути вида 'vcache.cache.hits' или None"""
+        for key in path.split('.'):
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data if isinstance(data, (int, float)) else None
+
+    @staticmethod
+    def section(data, path):
+        """Вложенный словарь по пути вида 'wcache.history' или None"""
+        for key in path.split('.'):
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data if isinstance(data, dict) else None
+
+    def update(self, timestamp, stats):
+        """Приращения и скорости (в секунду) относительно предыдущего замера"""
+        data = stats.get('data', stats) if isinstance(stats, dict) else {}
+        values = {}
+        for path in self.COUNTERS:
+            value = self.lookup(data, path)
+            if value is not None:
+                values[path] = value
+
+        deltas = {}
+        rates = {}
+        if self.prev_time is not None:
+            elapsed = timestamp - self.prev_time
+            for path, value in values.items():
+                prev = self.prev_values.get(path)
+                # Уменьшение счетчика означает перезапуск сервера
+                if prev is None or value < prev:
+                    continue
+                deltas[path] = value - prev
+                if elapsed > 0:
+                    rates[path] = round((value - prev) / elapsed, 3)
+
+        self.prev_time = timestamp
+        self.prev_values = values
+        return {'deltas': deltas, 'rates': rates}
+
+
+class DiaginfoParser:
+    """Разбор вывода zabbix_server -R diaginfo в структурированные данные
+
+    Каждая секция (historycache, valuecache, preprocessing, lld, alerting,
+    locks, connector) разбирается в словарь:
+      summary - пары ключ:значение из строк верхнего уровня (Items:, Values: ...);
+      memory  - блоки Memory*: size, chunks и buckets;
+      top     - списки Top.* (itemid и счетчики);
+      lists   - прочие списки (Media.alerts, Source.alerts);
+      locks   - имена и адреса мьютексов.
+    Числовые значения приводятся к int/float.
+    """
+
+    HEADER_PATTERN = re.compile(r'^== (.+) ==$')
+    PAIR_PATTERN = re.compile(r'([^\s:]+):(\S*)')
+    SECTION_KEYS = {
+        'history cache': 'historycache',
+        'value cache': 'valuecache',
+        'preprocessing': 'preprocessing',
+        'LLD': 'lld',
+        'alerting': 'alerting',
+        'locks': 'locks',
+        'connector': 'connector',
+    }
+
+    @staticmethod
+    def convert(value):
+        """Приведение строкового значения к int или float, если возможно"""
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    @classmethod
+    def section_key(cls, title):
+        name = title.replace('diagnostic information', '').strip()
+        return cls.SECTION_KEYS.get(name, re.sub(r'\W+', '_', name.lower()))
+
+    @classmethod
+    def pairs(cls, text):
+        return {key: cls.convert(value) for key, value in cls.PAIR_PATTERN.findall(text)}
+
+    def parse(self, lines):
+        """Разбор итерируемого набора строк (str или bytes)"""
+        sections = {}
+        section = None
+        block = None
+        block_kind = None
+        buckets = None
+
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            line = line.rstrip('\r\n')
+            stripped = line.strip()
+
+            header = self.HEADER_PATTERN.match(stripped)
+            if header:
+                section = {'title': header.group(1), 'summary': {}, 'memory': {}, 'top': {},
+                           'lists': {}, 'locks': []}
+                sections[self.section_key(header.group(1))] = section
+                block = block_kind = buckets = None
+                continue
+            if stripped == '==':
+                section = None
+                continue
+            if section is None or not stripped:
+                continue
+
+            indented = line[0] in ' \t'
+
+            if not indented:
+                buckets = None
+                if stripped.endswith(':') and ' ' not in stripped:
+                    name = stripped[:-1]
+                    if name.startswith('Memory'):
+                        block_kind = 'memory'
+                        block = section['memory'].setdefault(name, {})
+                    elif name == 'Locks':
+                        block_kind = 'locks'
+                        block = section['locks']
+                    elif name.startswith('Top.'):
+                        block_kind = 'list'
+                        block = section['top'].setdefault(name, [])
+                    else:
+                        block_kind = 'list'
+                        block = section['lists'].setdefault(name, [])
+                else:
+                    block = block_kind = None
+                    section['summary'].update(self.pairs(stripped))
+                continue
+
+            if block_kind == 'memory':
+                if stripped == 'buckets:':
+                    buckets = block.setdefault('buckets', {})
+                elif buckets is not None and ' ' not in stripped:
+                    size, _, count = stripped.partition(':')
+                    buckets[size] = self.convert(count)
+                else:
+                    label, _, rest = stripped.partition(' ')
+                    buckets = None
+                    if label.endswith(':'):
+                        block[label[:-1]] = self.pairs(rest)
+            elif block_kind == 'locks':
+                name, _, address = stripped.partition(':')
+                block.append({'name': name, 'address': address})
+            elif block_kind == 'list':
+                block.append(self.pairs(stripped))
+
+        return sections
+
+
+class TextEntry:
+    """Текстовая обертка записи архива: строки кодируются в UTF-8"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        return self.stream.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ArchiveWriter:
+    """Потоковая запись результатов задач в zip-архив без промежуточной директории
+
+    Запись, открытая через open(), накапливается в SpooledTemporaryFile (в
+    памяти до SPOOL_SIZE, дальше во временном файле) и по закрытию
+    копируется в запись архива через ZipFile.open(..., 'w') блоками по
+    CHUNK_SIZE. Уже накопленные данные (например, вывод команды из
+    capture_command) передаются в write() частями и копируются в архив
+    напрямую, без повторной буферизации. Так задачи могут писать
+    параллельно, а расход памяти ограничен независимо от объема данных.
+    При заданном staging_dir копия записи сохраняется и в директорию.
+    """
+
+    SPOOL_SIZE = 4 * 1024 * 1024
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, zip_path, prefix, compression=DEFAULT_COMPRESSION, compression_level=None,
+                 staging_dir=None, on_commit=None):
+        method = COMPRESSION_METHODS.get(compression)
+        if method is None:
+            raise ValueError(f"Метод сжатия '{compression}' не поддерживается этой версией Python")
+
+        self.zip_path = Path(zip_path)
+        self.prefix = prefix
+        self.staging_dir = Path(staging_dir) if staging_dir else None
+        self.lock = threading.Lock()
+        self.sizes = {}
+        self.on_commit = on_commit
+        self.closed = False
+        self.zip = zipfile.ZipFile(self.zip_path, 'w', method, compresslevel=compression_level)
+
+    def arcname(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def entry_info(self, name):
+        """ZipInfo записи: текущее время, права 0644, метод и уровень сжатия архива
+
+        До Python 3.13 у ZipInfo нет публичного уровня сжатия, поэтому при
+        явно заданном уровне запись открывается по имени и получает уровень
+        из ZipFile(compresslevel=...), а время - значение по умолчанию zipfile.
+        """
+        if self.zip.compresslevel is not None and not hasattr(zipfile.ZipInfo, 'compress_level'):
+            return self.arcname(name)
+        zinfo = zipfile.ZipInfo(self.arcname(name), date_time=time.localtime()[:6])
+        zinfo.compress_type = self.zip.compression
+        zinfo.external_attr = 0o644 << 16
+        if self.zip.compresslevel is not None:
+            zinfo.compress_level = self.zip.compresslevel
+        return zinfo
+
+    def check_open(self, name):
+        if self.closed:
+            raise ValueError(f"Архив {self.zip_path} уже закрыт, запись {name} не добавлена")
+
+    @contextmanager
+    def open(self, name, binary=False):
+        """Открытие записи архива на запись (текстовой или бинарной)"""
+        self.check_open(name)
+        spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        try:
+            yield spool if binary else TextEntry(spool)
+            self.write(name, [spool])
+        finally:
+            spool.close()
+
+    def copy_parts(self, parts, target):
+        for part in parts:
+            if isinstance(part, (bytes, bytearray)):
+                target.write(part)
+            else:
+                part.seek(0)
+                shutil.copyfileobj(part, target, self.CHUNK_SIZE)
+
+    def write(self, name, parts):
+        """Запись в архив готовых частей: bytes и бинарных файлов (читаются с начала)"""
+        size = sum(len(part) if isinstance(part, (bytes, bytearray)) else part.seek(0, io.SEEK_END)
+                   for part in parts)
+
+        waited = time.monotonic()
+        with self.lock:
+            acquired = time.monotonic()
+            # Задача, завершившаяся после закрытия архива, не должна его испортить
+            self.check_open(name)
+            # Размер известен заранее, по нему решается, нужен ли ZIP64
+            with self.zip.open(self.entry_info(name), 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+                self.copy_parts(parts, entry)
+            self.sizes[name] = size
+
+        if self.staging_dir:
+            with open(self.staging_dir / name, 'wb') as f:
+                self.copy_parts(parts, f)
+
+        if self.on_commit:
+            # Ожидание блокировки архива и время сжатия/записи - для самоизмерения сборщика
+            self.on_commit(name, size, acquired - waited, time.monotonic() - acquired)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.zip.close()
+
+
+class CollectionManifest:
+    """manifest.json: отпечатки статических файлов архива для инкрементального сбора
+
+    Для каждого файла хранится sha256 содержимого (без заголовка сборщика) и
+    имя архива, в котором файл лежит физически. При --since файл, не
+    изменившийся с базового архива, не записывается, а в манифесте остается
+    ссылка на архив с данными; цепочки ссылок разрешаются при сборе, поэтому
+    ссылка всегда ведет прямо на архив с файлом. Архивы ищутся в одной
+    директории.
+    """
+
+    NAME = "manifest.json"
+
+    def __init__(self, archive_name, hostname=None):
+        self.archive_name = archive_name
+        self.hostname = hostname
+        self.base_name = None
+        self.base = {}
+        self.artifacts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def load_base(self, path):
+        """Чтение манифеста базового архива; ссылки на недоступные архивы отбрасываются"""
+        path = Path(path)
+        with zipfile.ZipFile(path) as zipf:
+            name = next((name for name in zipf.namelist() if name.rsplit('/', 1)[-1] == self.NAME), None)
+            if name is None:
+                raise ValueError(f"В архиве {path.name} нет {self.NAME} (создан версией без инкрементального сбора)")
+            data = json.loads(zipf.read(name).decode('utf-8'))
+
+        self.base_name = path.name
+        for name, entry in data.get('artifacts', {}).items():
+            archive = entry.get('archive') or path.name
+            # Архив, в котором создан манифест, мог быть переименован
+            if archive == data.get('archive'):
+                archive = path.name
+            if archive == path.name or (path.parent / archive).is_file():
+                self.base[name] = dict(entry, archive=archive)
+
+    def reference(self, name, digest=None, fingerprint=None):
+        """Имя архива с неизменившимся файлом или None, если файл нужно записать
+
+        Файл считается неизменившимся при совпадении отпечатка источника
+        (тогда данные можно не собирать) или sha256 содержимого.
+        """
+        entry = self.base.get(name)
+        if entry is None:
+            return None
+        if not (fingerprint is not None and entry.get('fingerprint') == fingerprint
+                or digest is not None and entry.get('sha256') == digest):
+            return None
+
+        entry = dict(entry)
+        if fingerprint is not None:
+            entry['fingerprint'] = fingerprint
+        with self.lock:
+            self.artifacts[name] = entry
+        return entry['archive']
+
+    def record(self, name, digest, fingerprint=None):
+        """Файл, записанный в текущий архив"""
+        entry = {'sha256': digest, 'archive': self.archive_name}
+        if fingerprint is not None:
+            entry['fingerprint'] = fingerprint
+        with self.lock:
+            self.artifacts[name] = entry
+
+    def to_dict(self):
+        with self.lock:
+            artifacts = dict(sorted(self.artifacts.items()))
+        return {
+            'version': VERSION,
+            'archive': self.archive_name,
+            'hostname': self.hostname,
+            'base': self.base_name,
+            'created': datetime.now().isoformat(),
+            'artifacts': artifacts,
+        }
+
+
+class CommandResult:
+    """Результат ZabbixDiagnostic.capture_command
+
+    stdout - временный буфер с выводом (бинарный файл, позиция в начале),
+    stderr - байты, timed_out - команда завершена по таймауту.
+    """
+
+    def __init__(self, command, started, returncode, timed_out, stdout, stderr):
+        self.command = command
+        self.started = started
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.stdout = stdout
+        self.stderr = stderr
+
+    @property
+    def exit_code(self):
+        return "timeout" if self.timed_out else self.returncode
+
+
+class CollectionTask:
+    """Задача сбора в реестре ZabbixDiagnostic.TASKS
+
+    cost - ожидаемая длительность в секундах, по ней решается, помещается ли
+    задача в оставшийся бюджет времени; timeout - предельная длительность.
+    Оба значения задаются числом или функцией от ZabbixDiagnostic, если
+    зависят от параметров запуска. deps - задачи, после успешного завершения
+    которых запускается эта (если они есть в плане; если зависимость
+    завершилась ошибкой, задача пропускается), after - задачи, после которых
+    она запускается независимо от их результата, profiles - профили, в
+    которые входит задача, condition - дополнительное условие включения.
+    """
+
+    def __init__(self, name, method, profiles, cost=1, timeout=60, deps=(), after=(), condition=None):
+        self.name = name
+        self.method = method
+        self.profiles = profiles
+        self.cost = cost
+        self.timeout = timeout
+        self.deps = deps
+        self.after = after
+        self.condition = condition
+
+    @staticmethod
+    def resolve(value, diag):
+        return value(diag) if callable(value) else value
+
+    def enabled(self, diag):
+        return diag.profile in self.profiles and (self.condition is None or self.condition(diag))
+
+    def estimate(self, diag):
+        return self.resolve(self.cost, diag)
+
+    def limit(self, diag):
+        return self.resolve(self.timeout, diag)
+
+
+class TaskCancelled(Exception):
+    """Задача остановлена до завершения по таймауту"""
+
+
+class TaskControl:
+    """Отмена выполняющейся задачи сбора
+
+    Задача и ее вспомогательные потоки ждут через wait() вместо time.sleep,
+    а запущенные команды и открытые соединения регистрируют обработчики
+    через on_cancel(). cancel() прерывает ожидания и вызывает обработчики
+    (завершение группы процессов, закрытие сокета), поэтому поток задачи
+    завершается вскоре после таймаута и не задерживает выход из сборщика.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.handlers = []
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def wait(self, delay):
+        """Пауза на delay секунд; True, если задача отменена"""
+        return self.event.wait(max(0.0, delay))
+
+    def check(self):
+        if self.event.is_set():
+            raise TaskCancelled("задача остановлена по таймауту")
+
+    @contextmanager
+    def on_cancel(self, handler):
+        """Вызов handler при отмене задачи во время выполнения блока"""
+        with self.lock:
+            cancelled = self.event.is_set()
+            if not cancelled:
+                self.handlers.append(handler)
+        if cancelled:
+            handler()
+        try:
+            yield
+        finally:
+            with self.lock:
+                if handler in self.handlers:
+                    self.handlers.remove(handler)
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            handlers, self.handlers = self.handlers, []
+        for handler in handlers:
+            try:
+                handler()
+            except Exception:
+                pass
+
+
+class CollectorMetrics:
+    """Самоизмерение сборщика по задачам
+
+    Для каждой задачи записываются время выполнения, процессорное время
+    потока, объем записанных в архив данных (и время ожидания/записи в
+    архив), число запущенных команд, их процессорное время и пиковый RSS
+    (по os.wait4), а также пиковый RSS самого сборщика. Задача определяется
+    по текущему потоку. При profile=True каждая задача выполняется под
+    cProfile, результаты объединяются в один pstats.
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.started = time.monotonic()
+        self.started_at = datetime.now()
+        self.records = []
+        self.stats = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @staticmethod
+    def thread_cpu_time():
+        return time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+
+    @contextmanager
+    def measure(self, name):
+        """Измерение выполнения блока; вложенные блоки учитываются во внешнем"""
+        outer = getattr(self.local, 'record', None)
+        if outer is not None:
+            yield outer
+            return
+
+        record = {
+            'name': name,
+            'success': None,
+            'start': round(time.monotonic() - self.started, 3),
+            'subprocesses': 0,
+            'children_cpu': 0.0,
+            'children_maxrss_kb': 0,
+            'files': 0,
+            'bytes_written': 0,
+            'archive_wait': 0.0,
+            'archive_write': 0.0,
+        }
+        self.local.record = record
+        profiler = cProfile.Profile() if self.profile else None
+        wall_started = time.monotonic()
+        cpu_started = self.thread_cpu_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall'] = round(time.monotonic() - wall_started, 3)
+            record['cpu'] = round(self.thread_cpu_time() - cpu_started, 3)
+            record['children_cpu'] = round(record['children_cpu'], 3)
+            record['archive_wait'] = round(record['archive_wait'], 3)
+            record['archive_write'] = round(record['archive_write'], 3)
+            record['maxrss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.local.record = None
+            with self.lock:
+                self.records.append(record)
+                if profiler:
+                    if self.stats is None:
+                        self.stats = pstats.Stats(profiler)
+                    else:
+                        self.stats.add(profiler)
+
+    def current(self):
+        return getattr(self.local, 'record', None)
+
+    @contextmanager
+    def attach(self, record):
+        """Учет работы вспомогательного потока в записи задачи record"""
+        self.local.record = record
+        try:
+            yield record
+        finally:
+            self.local.record = None
+
+    def written(self, name, size, wait_time, write_time):
+        """Обработчик ArchiveWriter.on_commit"""
+        record = self.current()
+        if record is not None:
+            record['files'] += 1
+            record['bytes_written'] += size
+            record['archive_wait'] += wait_time
+            record['archive_write'] += write_time
+
+    def child_finished(self, usage):
+        """Учет завершенной команды по rusage из os.wait4"""
+        record = self.current()
+        if record is None:
+            return
+        with self.lock:
+            record['subprocesses'] += 1
+            record['children_cpu'] += usage.ru_utime + usage.ru_stime
+            record['children_maxrss_kb'] = max(record['children_maxrss_kb'], usage.ru_maxrss)
+
+    def wall_time(self, name):
+        for record in self.records:
+            if record['name'] == name:
+                return record['wall']
+        return None
+
+    def to_dict(self):
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with self.lock:
+            tasks = sorted(self.records, key=lambda record: record['start'])
+        return {
+            'version': VERSION,
+            'started': self.started_at.isoformat(),
+            'wall': round(time.monotonic() - self.started, 3),
+            'process': {
+                'cpu_user': round(own.ru_utime, 3),
+                'cpu_system': round(own.ru_stime, 3),
+                'maxrss_kb': own.ru_maxrss,
+            },
+            'children': {
+                'cpu_user': round(children.ru_utime, 3),
+                'cpu_system': round(children.ru_stime, 3),
+                'maxrss_kb': children.ru_maxrss,
+            },
+            'tasks': tasks,
+        }
+
+    def profile_text(self, limit=40):
+        """Текстовый отчет cProfile: функции с наибольшим суммарным временем"""
+        stream = io.StringIO()
+        self.stats.stream = stream
+        self.stats.sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+
+ALL_PROFILES = tuple(COLLECTION_PROFILES)
+FULL_PROFILES = ('standard', 'deep')
+
+
+class LatencyHistogram:
+    """Задержки в миллисекундах: перцентили и гистограмма с границами PROBE_BUCKETS_MS
+
+    Корзины накопительные, как у гистограмм Prometheus: значение le
+    содержит количество замеров не больше le миллисекунд.
+    """
+
+    def __init__(self, buckets=PROBE_BUCKETS_MS):
+        self.buckets = buckets
+        self.values = []
+
+    def add(self, seconds):
+        self.values.append(seconds * 1000)
+
+    def percentile(self, pct):
+        """Перцентиль по методу ближайшего ранга"""
+        ordered = sorted(self.values)
+        index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+        return ordered[index]
+
+    def to_dict(self):
+        if not self.values:
+            return {'count': 0}
+
+        counts = [0] * (len(self.buckets) + 1)
+        for value in self.values:
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+        cumulative = {}
+        total = 0
+        for le, count in zip(list(self.buckets) + ['+Inf'], counts):
+            total += count
+            cumulative[str(le)] = total
+
+        return {
+            'count': len(self.values),
+            'min': round(min(self.values), 3),
+            'max': round(max(self.values), 3),
+            'mean': round(sum(self.values) / len(self.values), 3),
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3),
+            'buckets': cumulative,
+        }
+
+
+class LatencyProbe:
+    """Замер задержек trapper'а и базы данных (задача 2.2)
+
+    Выполняется count запросов zabbix.stats на новых соединениях и столько
+    же на одном переиспользуемом соединении. Для каждого запроса отдельно
+    замеряются подключение, отправка, ожидание первого байта ответа после
+    отправки и полный цикл. zabbix_server закрывает соединение после
+    ответа, поэтому в режиме reused переподключения считаются отдельно.
+
+    Замер БД (db: auto, mysql, postgresql) выполняет SELECT 1 через
+    установленный драйвер с параметрами DB* из конфигурации zabbix_server.
+    Учетные данные, адрес и имя БД в результат не попадают и вырезаются из
+    текста ошибок.
+    """
+
+    PHASES = ('connect', 'send', 'first_byte', 'total')
+    MAX_CONSECUTIVE_ERRORS = 3
+    DB_SECRET_PARAMS = ('DBUser', 'DBPassword', 'DBHost', 'DBName', 'DBSocket', 'DBSchema')
+
+    def __init__(self, diag, count=DEFAULT_PROBE_COUNT, interval=DEFAULT_PROBE_INTERVAL, db='off'):
+        self.diag = diag
+        self.count = max(1, count)
+        self.interval = interval
+        self.db = db
+
+    def budget_exhausted(self):
+        remaining = self.diag.remaining_budget()
+        return remaining is not None and remaining < self.diag.stats_timeout
+
+    def round_trip(self, client, request, timings):
+        """Один запрос zabbix.stats; возвращает True, если понадобилось переподключение"""
+        reconnected = False
+        started = time.perf_counter()
+        if client.sock is None:
+            client.connect()
+            timings['connect'].add(time.perf_counter() - started)
+
+        while True:
+            send_started = time.perf_counter()
+            try:
+                client.sock.sendall(request)
+                sent = time.perf_counter()
+                first = client.sock.recv(1, socket.MSG_PEEK)
+            except (BrokenPipeError, ConnectionResetError):
+                first = b''
+            if first or reconnected:
+                break
+            # Сервер закрыл соединение после предыдущего ответа
+            reconnected = True
+            client.close()
+            connect_started = time.perf_counter()
+            client.connect()
+            timings['connect'].add(time.perf_counter() - connect_started)
+
+        if not first:
+            raise ZabbixProtocolError("Соединение закрыто до ответа")
+        first_byte = time.perf_counter()
+        response = client.receive()
+        finished = time.perf_counter()
+
+        if json.loads(response.decode('utf-8')).get('response') != 'success':
+            raise ZabbixProtocolError("Неуспешный ответ zabbix.stats")
+
+        timings['send'].add(sent - send_started)
+        timings['first_byte'].add(first_byte - sent)
+        timings['total'].add(finished - started)
+        return reconnected
+
+    def probe_trapper(self, client, reuse):
+        """Серия запросов на новых (reuse=False) или одном соединении клиента"""
+        control = self.diag.task_control()
+        request = client.pack({"request": "zabbix.stats"})
+        timings = {phase: LatencyHistogram() for phase in self.PHASES}
+        errors = []
+        consecutive_errors = 0
+        reconnects = 0
+        rounds = 0
+
+        try:
+            for i in range(self.count):
+                if control.cancelled or self.budget_exhausted() \
+                        or consecutive_errors >= self.MAX_CONSECUTIVE_ERRORS:
+                    break
+                if i and self.interval and control.wait(self.interval):
+                    break
+                rounds += 1
+                try:
+                    with control.on_cancel(client.abort):
+                        if self.round_trip(client, request, timings):
+                            reconnects += 1
+                    consecutive_errors = 0
+                except Exception as e:
+                    client.close()
+                    errors.append(str(e) or type(e).__name__)
+                    consecutive_errors += 1
+                if not reuse:
+                    client.close()
+        finally:
+            client.close()
+
+        result = {
+            'rounds': rounds,
+            'successful': timings['total'].to_dict()['count'],
+            'errors': len(errors),
+            'error_samples': errors[:5],
+            'latency_ms': {phase: histogram.to_dict() for phase, histogram in timings.items()},
+        }
+        if reuse:
+            result['reconnects'] = reconnects
+        return result
+
+    def detect_db_type(self):
+        """Тип БД по библиотекам, загруженным процессом zabbix_server, или по DBSchema"""
+        pid = self.diag.get_zabbix_pid()
+        if pid:
+            try:
+                with open(os.path.join(self.diag.discovery.proc_root, str(pid), 'maps'), 'r') as f:
+                    maps = f.read()
+                if 'libpq' in maps:
+                    return 'postgresql'
+                if 'libmysqlclient' in maps or 'libmariadb' in maps:
+                    return 'mysql'
+            except OSError:
+                pass
+        config = self.diag.get_zabbix_config()
+        if config and config.get('DBSchema'):
+            return 'postgresql'
+        return None
+
+    @staticmethod
+    def import_driver(db_type):
+        """Первый установленный драйвер для типа БД: (имя модуля, модуль) или (None, None)"""
+        for name in PROBE_DB_DRIVERS[db_type]:
+            try:
+                return name, importlib.import_module(name)
+            except ImportError:
+                continue
+        return None, None
+
+    @staticmethod
+    def connect_params(db_type, driver_name, config):
+        """Параметры подключения драйвера из конфигурации zabbix_server"""
+        host = config.get('DBHost', 'localhost')
+        port = config.get('DBPort')
+        if db_type == 'postgresql':
+            params = {'dbname': config.get('DBName'), 'user': config.get('DBUser'),
+                      'password': config.get('DBPassword'), 'connect_timeout': DEFAULT_PROBE_DB_TIMEOUT}
+            if host:
+                params['host'] = host
+            if port:
+                params['port'] = int(port)
+            tls = {'required': 'require', 'verify_ca': 'verify-ca', 'verify_full': 'verify-full'}
+            if config.get('DBTLSConnect') in tls:
+                params['sslmode'] = tls[config.get('DBTLSConnect')]
+            for key, name in (('DBTLSCAFile', 'sslrootcert'), ('DBTLSCertFile', 'sslcert'), ('DBTLSKeyFile', 'sslkey')):
+                if config.get(key):
+                    params[name] = config.get(key)
+            return {key: value for key, value in params.items() if value is not None}
+
+        legacy = driver_name == 'MySQLdb'
+        params = {
+            'user': config.get('DBUser'),
+            'passwd' if legacy else 'password': config.get('DBPassword') or '',
+            'db' if legacy else 'database': config.get('DBName'),
+            'connect_timeout': DEFAULT_PROBE_DB_TIMEOUT,
+        }
+        if config.get('DBSocket') and host in ('', 'localhost'):
+            params['unix_socket'] = config.get('DBSocket')
+        params['host'] = host or 'localhost'
+        if port:
+            params['port'] = int(port)
+        ssl = {name: config.get(key) for key, name in
+               (('DBTLSCAFile', 'ca'), ('DBTLSCertFile', 'cert'), ('DBTLSKeyFile', 'key')) if config.get(key)}
+        if ssl:
+            params['ssl'] = ssl
+        return {key: value for key, value in params.items() if value is not None}
+
+    def redact(self, text, config):
+        for key in self.DB_SECRET_PARAMS:
+            value = config.get(key)
+            if value:
+                text = text.replace(value, '***')
+        return text
+
+    def probe_database(self):
+        """Время подключения к БД и выполнения SELECT 1"""
+        config = self.diag.get_zabbix_config()
+        if not config:
+            return {'skipped': 'конфигурация zabbix_server не найдена'}
+        if config.get('VaultDBPath'):
+            return {'skipped': 'учетные данные БД хранятся в Vault'}
+
+        db_type = self.detect_db_type() if self.db == 'auto' else self.db
+        if not db_type:
+            return {'skipped': 'не удалось определить тип БД, укажите --probe-db mysql|postgresql'}
+
+        driver_name, driver = self.import_driver(db_type)
+        if driver is None:
+            return {'type': db_type, 'skipped': f"драйвер не установлен: {', '.join(PROBE_DB_DRIVERS[db_type])}"}
+
+        result = {'type': db_type, 'driver': driver_name}
+        connect = LatencyHistogram()
+        query = LatencyHistogram()
+        connection = None
+        try:
+            started = time.perf_counter()
+            connection = driver.connect(**self.connect_params(db_type, driver_name, config))
+            connect.add(time.perf_counter() - started)
+            cursor = connection.cursor()
+            control = self.diag.task_control()
+            for i in range(self.count):
+                if i and self.interval and control.wait(self.interval):
+                    break
+                started = time.perf_counter()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                query.add(time.perf_counter() - started)
+            cursor.close()
+        except Exception as e:
+            result['error'] = self.redact(f"{type(e).__name__}: {e}", config)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+        result['latency_ms'] = {'connect': connect.to_dict(), 'query': query.to_dict()}
+        return result
+
+    def run(self):
+        """Результат замера для 2_latency_probe.json"""
+        client = self.diag.create_stats_client()
+        result = {
+            'collected': datetime.now().isoformat(),
+            'target': {'host': client.host, 'port': client.port},
+            'count': self.count,
+            'interval': self.interval,
+            'buckets_ms': list(PROBE_BUCKETS_MS),
+            'trapper': {
+                'fresh': self.probe_trapper(client, reuse=False),
+                'reused': self.probe_trapper(client, reuse=True),
+            },
+        }
+        if self.db != 'off':
+            result['database'] = self.probe_database()
+        return result
 
 
 class ZabbixDiagnostic:
-    def __init__(self, output_dir="/tmp/zabbix-diag", keep_temp_config=False, stats_timeout=60):
+    # Реестр задач сбора; 0. Version и Final выполняются отдельно до и после них
+    TASKS = (
+        CollectionTask("2. Zabbix Stats", 'task_2_zabbix_stats', ALL_PROFILES,
+                       cost=1, timeout=lambda diag: diag.stats_timeout + 30),
+        # diaginfo берет блокировки внутри zabbix_server, поэтому запускается после
+        # zabbix.stats, чтобы не искажать его и не нагружать сервер одновременно
+        CollectionTask("1. Diaginfo", 'task_1_diaginfo', FULL_PROFILES,
+                       cost=5, timeout=lambda diag: diag.diaginfo_limit(), after=("2. Zabbix Stats",)),
+        # Замер задержек после diaginfo, чтобы его блокировки не искажали результат
+        CollectionTask("2.2 Latency Probe", 'task_2_latency_probe', ALL_PROFILES,
+                       cost=lambda diag: 2 * diag.probe_count * (diag.probe_interval + 0.01),
+                       timeout=lambda diag: 2 * diag.probe_count * diag.probe_interval + 2 * diag.stats_timeout + 60,
+                       deps=("2. Zabbix Stats",), after=("1. Diaginfo",)),
+        CollectionTask("3. PS AUX", 'task_3_ps_aux', FULL_PROFILES, cost=1, timeout=60),
+        CollectionTask("3.1 Zabbix Workers", 'task_3_zabbix_workers', ALL_PROFILES,
+                       cost=lambda diag: diag.worker_samples * diag.worker_interval,
+                       timeout=lambda diag: diag.worker_samples * diag.worker_interval + 30),
+        CollectionTask("4. Free", 'task_4_free', ALL_PROFILES, cost=0.1, timeout=60),
+        CollectionTask("5. VMStat", 'task_5_vmstat', ALL_PROFILES,
+                       cost=lambda diag: diag.sample_duration,
+                       timeout=lambda diag: diag.sample_duration + 30),
+        CollectionTask("6. Zabbix Config", 'task_6_zabbix_config', ALL_PROFILES, cost=0.1, timeout=60),
+        CollectionTask("7. OS Release", 'task_7_os_release', ALL_PROFILES, cost=0.1, timeout=60),
+        CollectionTask("8. Uptime", 'task_8_uptime', ALL_PROFILES, cost=0.1, timeout=60),
+        CollectionTask("9. Nproc", 'task_9_nproc', ALL_PROFILES, cost=0.1, timeout=60),
+        CollectionTask("10. CPU Info", 'task_10_cpuinfo', FULL_PROFILES, cost=0.5, timeout=60),
+        CollectionTask("2.1 Zabbix Stats Watch", 'task_2_zabbix_stats_watch', ALL_PROFILES,
+                       cost=lambda diag: diag.watch_duration,
+                       timeout=lambda diag: diag.watch_duration + diag.stats_timeout + 60,
+                       deps=("2. Zabbix Stats",),
+                       condition=lambda diag: diag.watch_duration > 0),
+    )
+
+    def __init__(self, output_dir="/tmp/zabbix-diag", keep_temp_config=False, stats_timeout=60, stats_host=None,
+                 jobs=DEFAULT_JOBS, serial=False, proc_root=PROC_ROOT,
+                 sample_interval=DEFAULT_SAMPLE_INTERVAL, sample_duration=None,
+                 worker_samples=None, worker_interval=DEFAULT_WORKER_INTERVAL,
+                 watch_duration=None, watch_interval=DEFAULT_WATCH_INTERVAL, watch_diaginfo_every=0,
+                 compression=DEFAULT_COMPRESSION, compression_level=None, keep_output_dir=False,
+                 profile=DEFAULT_PROFILE, time_budget=None, nice=None, ionice=None, profile_collector=False,
+                 diaginfo_sections=DIAGINFO_SECTIONS, diaginfo_jobs=None, diaginfo_timeout=DEFAULT_DIAGINFO_TIMEOUT,
+                 probe_count=None, probe_interval=DEFAULT_PROBE_INTERVAL, probe_db='off', since=None):
+        self.profile = profile
+        settings = COLLECTION_PROFILES[profile]
         self.output_dir = Path(output_dir)
         self.keep_temp_config = keep_temp_config
         self.stats_timeout = stats_timeout
+        self.stats_host = stats_host
+        self.jobs = max(1, jobs)
+        self.serial = serial or self.jobs == 1
+        self.sample_interval = sample_interval
+        self.sample_duration = settings.get('sample_duration', DEFAULT_SAMPLE_DURATION) \
+            if sample_duration is None else sample_duration
+        self.worker_samples = max(1, settings.get('worker_samples', DEFAULT_WORKER_SAMPLES)
+                                  if worker_samples is None else worker_samples)
+        self.worker_interval = worker_interval
+        self.watch_duration = settings.get('watch_duration', 0) if watch_duration is None else watch_duration
+        self.watch_interval = watch_interval
+        self.watch_diaginfo_every = watch_diaginfo_every
+        self.diaginfo_sections = tuple(diaginfo_sections or ())
+        self.diaginfo_jobs = max(1, min(diaginfo_jobs or len(self.diaginfo_sections) or 1,
+                                        len(self.diaginfo_sections) or 1))
+        self.diaginfo_timeout = diaginfo_timeout
+        self.probe_count = max(1, settings.get('probe_count', DEFAULT_PROBE_COUNT)
+                               if probe_count is None else probe_count)
+        self.probe_interval = probe_interval
+        self.probe_db = probe_db
+        self.since = Path(since) if since else None
+        self.compression = compression
+        self.compression_level = compression_level
+        self.keep_output_dir = keep_output_dir
+        self.time_budget = time_budget
+        self.deadline = None
+        self.nice = settings.get('nice', 0) if nice is None else nice
+        self.ionice = settings.get('ionice', 'none') if ionice is None else ionice
+        self.metrics = CollectorMetrics(profile=profile_collector)
+        self.archive = None
+        self.manifest = None
+        self._task_local = threading.local()
+        self._no_control = TaskControl()
         self.temp_config_path = None
+        self._temp_config_lock = threading.Lock()
+        self._temp_config_users = 0
+        self.discovery = ZabbixServerDiscovery(proc_root)
+        self.system_info = SystemInfoCollector(proc_root)
+        self.system_sampler = SystemSampler(proc_root)
+        self.worker_sampler = WorkerSampler(proc_root)
+        self._discovery_lock = threading.Lock()
+        self._discovered = False
+        self._zabbix_paths = (None, None)
+        self._zabbix_pid = None
+        self._zabbix_config = None
+
+    def setup_output_directory(self):
+        """Создание выходной директории, удаление существующей если есть"""
+        if self.output_dir.exists():
+            print(f"Удаляем существующую директорию {self.output_dir}")
+            shutil.rmtree(self.output_dir)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Создана директория для вывода: {self.output_dir}")
+
+    @staticmethod
+    def get_hostname():
+        """Имя хоста для имени архива и manifest.json"""
+        return socket.gethostname().strip() or "unknown"
+
+    def get_archive_path(self):
+        """Путь к архиву /tmp/HOSTNAME.zip
+
+        При --since архив создается рядом с базовым под именем с датой, чтобы
+        не перезаписать архивы, на которые ссылается манифест.
+        """
+        hostname = self.get_hostname()
+        if self.since:
+            return self.since.parent / f"{hostname}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+        return Path("/tmp") / f"{hostname}.zip"
+
+    def setup_output(self, zip_path=None):
+        """Открытие архива для потоковой записи результатов
+
+        Выходная директория создается только при --keep-output-dir.
+        По умолчанию архив создается по пути get_archive_path().
+        """
+        staging_dir = None
+        if self.keep_output_dir:
+            self.setup_output_directory()
+            staging_dir = self.output_dir
+
+        zip_path = zip_path or self.get_archive_path()
+        if os.path.exists(zip_path):
+            os.unlink(zip_path)
+
+        self.manifest = CollectionManifest(Path(zip_path).name, self.get_hostname())
+        if self.since:
+            try:
+                self.manifest.load_base(self.since)
+                print(f"Инкрементальный сбор относительно {self.since}: "
+                      f"{len(self.manifest.base)} файлов для сравнения")
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                print(f"Базовый архив не используется, выполняется полный сбор: {e}")
+
+        self.archive = ArchiveWriter(
+            zip_path, self.output_dir.name,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            staging_dir=staging_dir,
+            on_commit=self.metrics.written
+        )
+        print(f"Создаем архив: {zip_path} (сжатие: {self.compression})")
+
+    @contextmanager
+    def open_output(self, name, binary=False):
+        """Открытие файла результата в архиве
+
+        Задача, отмененная по таймауту, в архив не пишет: запись, открытая
+        до отмены, отбрасывается.
+        """
+        control = self.task_control()
+        control.check()
+        with self.archive.open(name, binary=binary) as f:
+            yield f
+            control.check()
+
+    def write_parts(self, name, parts):
+        """Запись готовых частей в архив без повторной буферизации (см. ArchiveWriter.write)"""
+        self.task_control().check()
+        self.archive.write(name, parts)
+
+    def task_control(self):
+        """Управление отменой текущей задачи; вне задач - объект, который не отменяется"""
+        return getattr(self._task_local, 'control', None) or self._no_control
+
+    @contextmanager
+    def attach_control(self, control):
+        """Привязка потока (задачи или вспомогательного) к управлению отменой задачи"""
+        self._task_local.control = control
+        try:
+            yield control
+        finally:
+            self._task_local.control = None
+
+    def apply_priority(self):
+        """Понижение приоритета CPU и ввода-вывода; наследуется потоками и дочерними процессами"""
+        if self.nice > 0:
+            try:
+                os.nice(self.nice)
+            except OSError as e:
+                print(f"Не удалось изменить приоритет (nice): {e}")
+
+        ionice_args = IONICE_CLASSES.get(self.ionice)
+        ionice = shutil.which("ionice") if ionice_args else None
+        if ionice_args and not ionice:
+            print("Утилита ionice не найдена, приоритет ввода-вывода не изменен")
+        elif ionice_args:
+            result = subprocess.run(
+                [ionice] + ionice_args + ['-p', str(os.getpid())],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+            )
+            if result.returncode != 0:
+                print(f"Не удалось изменить приоритет ввода-вывода: {result.stderr.strip()}")
+
+        print(f"Приоритет процесса: nice {os.nice(0)}, ionice {self.ionice}")
+
+    def remaining_budget(self):
+        """Оставшийся бюджет времени в секундах или None, если бюджет не задан"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def clip_timeout(self, timeout):
+        """Таймаут, ограниченный оставшимся бюджетом времени"""
+        remaining = self.remaining_budget()
+        if remaining is None:
+            return timeout
+        return max(1.0, min(timeout, remaining))
+
+    def kill_process_group(self, process):
+        """Завершение процесса вместе с дочерними (например, запущенными через shell)"""
+        try:
+            os.killpg(process.pid, 9)
+        except OSError:
+            pass
+
+    def wait_process(self, process):
+        """Ожидание завершения команды через os.wait4 с учетом потребленных ресурсов"""
+        _, status, usage = os.wait4(process.pid, 0)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        self.metrics.child_finished(usage)
+        return process.returncode
+
+    def capture_command(self, command, shell=True, timeout=30):
+        """Выполнение команды с чтением вывода во временный буфер
+
+        Вывод читается из канала блоками и накапливается во временном буфере
+        с ограниченным объемом памяти. При превышении таймаута команда
+        завершается вместе с дочерними процессами, а полученная часть вывода
+        сохраняется. Возвращает CommandResult, буфер stdout закрывает
+        вызывающий.
+        """
+        control = self.task_control()
+        control.check()
+        started = datetime.now()
+        process = subprocess.Popen(
+            command,
+            shell=shell,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+
+        stderr_data = []
+        stderr_reader = threading.Thread(target=lambda: stderr_data.append(process.stderr.read()))
+        stderr_reader.start()
+
+        timer = threading.Timer(self.clip_timeout(timeout), self.kill_process_group, args=(process,))
+        timer.start()
+        stdout_spool = tempfile.SpooledTemporaryFile(max_size=ArchiveWriter.SPOOL_SIZE)
+        try:
+            with control.on_cancel(lambda: self.kill_process_group(process)):
+                for chunk in iter(lambda: process.stdout.read(ArchiveWriter.CHUNK_SIZE), b''):
+                    stdout_spool.write(chunk)
+                returncode = self.wait_process(process)
+            stderr_reader.join()
+            timed_out = not timer.is_alive() and returncode < 0
+        except BaseException:
+            stdout_spool.close()
+            raise
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            process.stderr.close()
+
+        stdout_spool.seek(0)
+        return CommandResult(command, started, returncode, timed_out, stdout_spool,
+                             stderr_data[0] if stderr_data else b'')
+
+    def run_command(self, command, filename, shell=True, timeout=30, stdout_handler=None):
+        """Выполнение команды и сохранение результата в файл
+
+        Если задан stdout_handler, он вызывается с буфером вывода (бинарный
+        файл) до записи в архив. При превышении таймаута сохраняется
+        полученная часть вывода. Возвращает True при нулевом коде возврата.
+        """
+        try:
+            print(f"Выполняем: {command}")
+            result = self.capture_command(command, shell=shell, timeout=timeout)
+
+            with result.stdout as stdout_spool:
+                if stdout_handler:
+                    stdout_handler(stdout_spool)
+
+                # Вывод уже накоплен в буфере capture_command и копируется в архив без повторной буферизации
+                parts = [
+                    f"# Команда: {command}\n"
+                    f"# Дата выполнения: {result.started}\n"
+                    f"# Exit code: {result.exit_code}\n\n"
+                    "=== STDOUT ===\n".encode('utf-8'),
+                    stdout_spool,
+                ]
+                if result.stderr:
+                    parts += [b"\n=== STDERR ===\n", result.stderr]
+                self.write_parts(f"{filename}.txt", parts)
+
+            if result.timed_out:
+                print(f"Команда '{command}' превысила таймаут, сохранен частичный вывод")
+                return False
+
+            print(f"Результат сохранен в {filename}.txt")
+            return result.returncode == 0
+
+        except Exception as e:
+            print(f"Ошибка выполнения команды '{command}': {e}")
+            return False
+
+    def write_output(self, filename, source, content):
+        """Сохранение собранных без запуска команд данных в файл"""
+        with self.open_output(f"{filename}.txt") as f:
+            f.write(f"# Источник: {source}\n")
+            f.write(f"# Дата выполнения: {datetime.now()}\n\n")
+            f.write(content)
+
+        print(f"Результат сохранен в {filename}.txt")
+        return True
+
+    def collect_native(self, filename, source, reader, normalize=None):
+        """Чтение данных функцией reader и сохранение результата в файл
+
+        Если задан normalize, данные считаются статическими и сохраняются
+        через write_static; normalize готовит их к сравнению с базовым архивом.
+        """
+        try:
+            print(f"Читаем: {source}")
+            if normalize:
+                return self.write_static(filename, source, reader(), normalize)
+            return self.write_output(filename, source, reader())
+        except Exception as e:
+            print(f"Ошибка чтения '{source}': {e}")
+            return False
+
+    def unchanged(self, name, digest=None, fingerprint=None):
+        """Файл не изменился с базового архива (--since) и в текущий архив не записывается"""
+        archive = self.manifest.reference(name, digest=digest, fingerprint=fingerprint)
+        if archive:
+            print(f"{name} не изменился, ссылка на архив {archive}")
+        return archive is not None
+
+    def write_static(self, filename, source, content, normalize=str):
+        """Сохранение редко меняющихся данных с учетом в manifest.json"""
+        name = f"{filename}.txt"
+        digest = CollectionManifest.digest(normalize(content))
+        if self.unchanged(name, digest=digest):
+            return True
+        self.write_output(filename, source, content)
+        self.manifest.record(name, digest)
+        return True
+
+    def discover_zabbix_server(self):
+        """Однократный поиск zabbix_server и чтение его конфигурации
+
+        Результат кэшируется на весь запуск, поэтому все задачи работают
+        с одним согласованным снимком, даже если сервер перезапустится.
+        """
+        with self._discovery_lock:
+            if self._discovered:
+                return
+            self._discovered = True
+
+            try:
+                found = self.discovery.find_server()
+            except Exception as e:
+                print(f"Ошибка получения путей zabbix: {e}")
+                return
+
+            if not found:
+                print("Не удалось найти zabbix_server в процессах")
+                return
+
+            pid, binary_path, config_path = found
+            print(f"Найден zabbix_server (pid {pid}): {binary_path}, конфиг: {config_path}")
+            self._zabbix_paths = (binary_path, config_path)
+            self._zabbix_pid = pid
+
+            if not os.path.exists(config_path):
+                print(f"Конфиг-файл не найден: {config_path}")
+                return
+
+            try:
+                self._zabbix_config = ZabbixServerConfig.load(config_path)
+                print(f"Прочитана конфигурация, файлов: {len(self._zabbix_config.files)}")
+            except Exception as e:
+                print(f"Ошибка чтения конфига {config_path}: {e}")
+
+    def get_zabbix_paths(self):
+        """Получение путей к бинарнику и конфиг-файлу zabbix_server"""
+        self.discover_zabbix_server()
+        return self._zabbix_paths
+
+    def get_zabbix_pid(self):
+        """Идентификатор основного процесса zabbix_server (или None)"""
+        self.discover_zabbix_server()
+        return self._zabbix_pid
+
+    def get_zabbix_config(self):
+        """Получение разобранной конфигурации zabbix_server (или None)"""
+        self.discover_zabbix_server()
+        return self._zabbix_config
+
+    def create_temp_config(self):
+        """Создание временного конфига zabbix_server с Timeout=30 для -R diaginfo
+
+        Возвращает путь к временному файлу или None.
+        """
+        binary_path, config_path = self.get_zabbix_paths()
+
+        if not binary_path or not config_path:
+            print("Не удалось получить пути к zabbix_server")
+            return None
+
+        config = self.get_zabbix_config()
+        if not config:
+            print(f"Конфиг-файл не найден: {config_path}")
+            return None
+
+        try:
+            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='_zabbix.conf') as temp_config:
+                # Параметры всех файлов в порядке чтения вместо Include: относительные
+                # пути включаемых файлов не разрешились бы из временной директории
+                for key, value, _, _ in config.entries:
+                    if key != 'Timeout':
+                        temp_config.write(f"{key}={value}\n")
+                temp_config.write("Timeout=30\n")
+                print(f"Создан временный конфиг: {temp_config.name}")
+                return temp_config.name
+
+        except Exception as e:
+            print(f"Ошибка создания временного конфига: {e}")
+            return None
+
+    def remove_temp_config(self, temp_config_path):
+        """Удаление временного конфига, если не нужно сохранять"""
+        if not self.keep_temp_config and temp_config_path:
+            try:
+                os.unlink(temp_config_path)
+                print(f"Удален временный конфиг: {temp_config_path}")
+            except Exception as e:
+                print(f"Не удалось удалить временный конфиг: {e}")
+        else:
+            print(f"Временный конфиг сохранен: {temp_config_path}")
+
+    @contextmanager
+    def shared_temp_config(self):
+        """Временный конфиг, общий для одновременно работающих задач
+
+        Создается при первом обращении и удаляется, когда его освобождает
+        последняя использующая задача (diaginfo и режим наблюдения).
+        """
+        with self._temp_config_lock:
+            if self._temp_config_users == 0:
+                self.temp_config_path = self.create_temp_config()
+            self._temp_config_users += 1
+            temp_config_path = self.temp_config_path
+        try:
+            yield temp_config_path
+        finally:
+            with self._temp_config_lock:
+                self._temp_config_users -= 1
+                if self._temp_config_users == 0:
+                    if self.temp_config_path:
+                        self.remove_temp_config(self.temp_config_path)
+                    self.temp_config_path = None
+
+    def task_1_diaginfo(self):
+        """Задача 1: Сбор diaginfo
+
+        По умолчанию каждая секция снимается отдельной командой
+        -R diaginfo=<секция> со своим таймаутом (см. capture_diaginfo_sections).
+        При пустом списке секций выполняется один полный -R diaginfo.
+        """
+        with self.shared_temp_config() as temp_config_path:
+            if not temp_config_path:
+                return False
+
+            binary_path, _ = self.get_zabbix_paths()
+            if self.diaginfo_sections:
+                return self.capture_diaginfo_sections(binary_path, temp_config_path)
+
+            diaginfo_cmd = f"{binary_path} -c {temp_config_path} -R diaginfo"
+            return self.run_command(
+                diaginfo_cmd, "1_diaginfo", timeout=60, stdout_handler=self.save_diaginfo_json
+            )
+
+    def diaginfo_limit(self):
+        """Предельная длительность задачи diaginfo с учетом числа волн секций"""
+        if not self.diaginfo_sections:
+            return 90
+        waves = math.ceil(len(self.diaginfo_sections) / self.diaginfo_jobs)
+        return waves * self.diaginfo_timeout + 30
+
+    def capture_diaginfo_sections(self, binary_path, temp_config_path):
+        """Посекционный diaginfo в 1_diaginfo.txt и 1_diaginfo.json
+
+        Секции выполняются в пуле из diaginfo_jobs потоков (при 1 - по очереди
+        в порядке diaginfo_sections), каждая со своим таймаутом. Вывод
+        объединяется в порядке diaginfo_sections, поэтому формат файла не
+        отличается от полного diaginfo; секция, превысившая таймаут,
+        сохраняется частично. Ошибки секций пишутся в блок STDERR с именем
+        секции. Задача успешна, если получена хотя бы одна секция.
+        """
+        record = self.metrics.current()
+        control = self.task_control()
+
+        def capture(section):
+            with self.metrics.attach(record), self.attach_control(control):
+                command = f"{binary_path} -c {temp_config_path} -R diaginfo={section}"
+                print(f"Выполняем: {command}")
+                return self.capture_command(command, timeout=self.diaginfo_timeout)
+
+        started = datetime.now()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.diaginfo_jobs, thread_name_prefix="zdiag-diaginfo") as executor:
+            futures = {section: executor.submit(capture, section) for section in self.diaginfo_sections}
+            for section, future in futures.items():
+                try:
+                    results[section] = future.result()
+                except Exception as e:
+                    print(f"Ошибка выполнения diaginfo={section}: {e}")
+                    results[section] = e
+
+        try:
+            stdouts = []
+            stderr = []
+            statuses = []
+            for section in self.diaginfo_sections:
+                result = results[section]
+                if isinstance(result, Exception):
+                    statuses.append(f"{section}=error")
+                    stderr.append(f"[{section}] {result}\n".encode('utf-8'))
+                    continue
+                stdouts.append(result.stdout)
+                statuses.append(f"{section}={result.exit_code}")
+                if result.stderr:
+                    stderr.append(f"[{section}] ".encode('utf-8') + result.stderr)
+                if result.timed_out:
+                    print(f"Секция diaginfo={section} превысила таймаут, сохранен частичный вывод")
+                elif result.returncode != 0:
+                    print(f"Секция diaginfo={section} завершилась с кодом {result.returncode}")
+
+            for stdout in stdouts:
+                stdout.seek(0)
+            self.save_diaginfo_json(line for stdout in stdouts for line in stdout)
+
+            # Буферы секций копируются в архив напрямую, без объединения во временный файл
+            command = f"{binary_path} -c {temp_config_path} -R diaginfo={','.join(self.diaginfo_sections)}"
+            parts = [
+                f"# Команда: {command}\n"
+                f"# Дата выполнения: {started}\n"
+                f"# Exit code: {self.diaginfo_exit_code(results)}\n"
+                f"# Секции: {' '.join(statuses)}\n\n"
+                "=== STDOUT ===\n".encode('utf-8')
+            ] + stdouts
+            if stderr:
+                parts += [b"\n=== STDERR ===\n"] + stderr
+            self.write_parts("1_diaginfo.txt", parts)
+        finally:
+            for result in results.values():
+                if isinstance(result, CommandResult):
+                    result.stdout.close()
+
+        print(f"Результат сохранен в 1_diaginfo.txt ({' '.join(statuses)})")
+        return any(isinstance(result, CommandResult) and result.exit_code == 0 for result in results.values())
+
+    @staticmethod
+    def diaginfo_exit_code(results):
+        """Общий код возврата секций: 0, timeout или первый ненулевой код"""
+        codes = [result.exit_code if isinstance(result, CommandResult) else "error" for result in results.values()]
+        if "timeout" in codes:
+            return "timeout"
+        return next((code for code in codes if code != 0), 0)
+
+    def save_diaginfo_json(self, stdout):
+        """Сохранение разобранного diaginfo в 1_diaginfo.json"""
+        try:
+            sections = DiaginfoParser().parse(stdout)
+        except Exception as e:
+            print(f"Ошибка разбора diaginfo: {e}")
+            return
+
+        if not sections:
+            print("В выводе diaginfo не найдено секций")
+            return
+
+        with self.open_output("1_diaginfo.json") as f:
+            json.dump({
+                'version': VERSION,
+                'source': '1_diaginfo.txt',
+                'collected': datetime.now().isoformat(),
+                'sections': sections,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+
+        print(f"Разобрано секций diaginfo: {len(sections)}, результат сохранен в 1_diaginfo.json")
+
+    def get_zabbix_trapper_port(self):
+        """Получение порта trapper'а из конфигурации"""
+        config = self.get_zabbix_config()
+        default_port = DEFAULT_TRAPPER_PORT
+
+        if not config:
+            print(f"Используем порт по умолчанию: {default_port}")
+            return default_port
+
+        port = config.get('ListenPort')
+        if port:
+            try:
+                port = int(port)
+                print(f"Найден порт в конфиге: {port}")
+                return port
+            except ValueError as e:
+                print(f"Ошибка чтения конфига для порта: {e}")
+
+        print(f"Используем порт по умолчанию: {default_port}")
+        return default_port
+
+    def get_zabbix_trapper_host(self):
+        """Адрес trapper'а: --stats-host, первый адрес ListenIP или localhost"""
+        if self.stats_host:
+            return self.stats_host
+
+        config = self.get_zabbix_config()
+        listen_ip = config.get('ListenIP') if config else None
+        if listen_ip:
+            host = listen_ip.split(',')[0].strip()
+            if host and host not in ('0.0.0.0', '::'):
+                return host
+        return 'localhost'
+
+    def create_zabbix_header(self, data_length):
+        """Создает заголовок Zabbix протокола"""
+        return ZabbixProtocolClient.SIGNATURE + struct.pack(
+            "<BII", ZabbixProtocolClient.FLAG_PROTOCOL, data_length, 0
+        )
+
+    def create_stats_request(self):
+        """Создает JSON запрос для получения статистики Zabbix"""
+        return ZabbixProtocolClient.pack({"request": "zabbix.stats"})
+
+    def parse_zabbix_response(self, raw_response):
+        """Парсит ответ от Zabbix сервера"""
+        try:
+            return json.loads(ZabbixProtocolClient.unpack(raw_response).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Ошибка парсинга JSON: {e}")
+        except ZabbixProtocolError as e:
+            raise ValueError(str(e))
+
+    def create_stats_client(self):
+        """Клиент протокола Zabbix для локального trapper'а"""
+        return ZabbixProtocolClient(
+            self.get_zabbix_trapper_host(),
+            self.get_zabbix_trapper_port(),
+            timeout=self.stats_timeout
+        )
+
+    def task_2_zabbix_stats(self):
+        """Задача 2: Сбор zabbix.stats через socket
+
+        Ответ сохраняется как валидный JSON, который веб-интерфейс
+        разбирает напрямую через JSON.parse.
+        """
+        client = self.create_stats_client()
+
+        try:
+            print(f"Подключаемся к {client.host}:{client.port} для получения статистики")
+            print("Отправляем JSON запрос zabbix.stats...")
+            with self.task_control().on_cancel(client.abort):
+                stats = client.request({"request": "zabbix.stats"})
+            stats_text = "Успешно получен JSON ответ:\n" + json.dumps(stats, ensure_ascii=False)
+        except ZabbixProtocolError as e:
+            stats_text = f"Ошибка разбора ответа: {e}"
+        except socket.timeout:
+            print(f"Таймаут подключения к порту {client.port}")
+            return False
+        except Exception as e:
+            print(f"Ошибка получения статистики: {e}")
+            return False
+
+        # Сохраняем результат
+        with self.open_output("2_zabbix_stats.txt") as f:
+            f.write(self.format_stats_output(client.host, client.port, stats_text))
+
+        print("Статистика сохранена в 2_zabbix_stats.txt")
+        return True
+
+    def format_stats_output(self, host, port, stats_text):
+        """Содержимое файла 2_zabbix_stats.txt"""
+        return (
+            f"# Zabbix Stats (JSON Protocol)\n"
+            f"# Дата выполнения: {datetime.now()}\n"
+            f"# Адрес: {host}\n"
+            f"# Порт: {port}\n"
+            f"# Таймаут: {self.stats_timeout}\n\n"
+            f"{stats_text}"
+        )
+
+    def task_2_latency_probe(self):
+        """Задача 2.2: Задержки trapper'а (и БД) по серии запросов, см. LatencyProbe"""
+        probe = LatencyProbe(self, count=self.probe_count, interval=self.probe_interval, db=self.probe_db)
+        print(f"Замер задержек: {probe.count} запросов zabbix.stats на новых соединениях и на одном соединении"
+              + (f", БД: {self.probe_db}" if self.probe_db != 'off' else ""))
+        try:
+            result = probe.run()
+        except Exception as e:
+            print(f"Ошибка замера задержек: {e}")
+            return False
+
+        with self.open_output("2_latency_probe.json") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+
+        for mode, data in result['trapper'].items():
+            total = data['latency_ms']['total']
+            if total['count']:
+                print(f"trapper ({mode}): {total['count']} из {data['rounds']}, полный цикл p50 {total['p50']} мс, "
+                      f"p95 {total['p95']} мс, p99 {total['p99']} мс")
+            else:
+                print(f"trapper ({mode}): нет успешных запросов")
+        database = result.get('database')
+        if database:
+            query = database.get('latency_ms', {}).get('query', {})
+            if query.get('count'):
+                print(f"БД ({database['type']}, {database['driver']}): SELECT 1 p50 {query['p50']} мс, "
+                      f"p99 {query['p99']} мс")
+            else:
+                print(f"БД: {database.get('skipped') or database.get('error')}")
+
+        print("Результат сохранен в 2_latency_probe.json")
+        return any(data['successful'] for data in result['trapper'].values())
+
+    def capture_diaginfo(self, temp_config_path, timeout=60):
+        """Запуск zabbix_server -R diaginfo через capture_command, возвращает вывод команды
+
+        При превышении таймаута группа процессов завершается и выбрасывается
+        subprocess.TimeoutExpired с полученной частью вывода.
+        """
+        binary_path, _ = self.get_zabbix_paths()
+        command = [binary_path, '-c', temp_config_path, '-R', 'diaginfo']
+        result = self.capture_command(command, shell=False, timeout=timeout)
+        with result.stdout as stdout:
+            output = stdout.read().decode('utf-8', errors='replace')
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(command, timeout, output=output)
+        return output
+
+    def task_2_zabbix_stats_watch(self):
+        """Задача 2.1: Серия замеров zabbix.stats (и diaginfo) за период наблюдения
+
+        Каждый замер дописывается строкой JSON в 2_zabbix_stats_watch.jsonl
+        вместе с приращениями и скоростями счетчиков относительно предыдущего.
+        Используется один клиент и, если сервер позволяет, одно соединение.
+        """
+        client = self.create_stats_client()
+        calculator = StatsRateCalculator()
+        control = self.task_control()
+        stack = ExitStack()
+        stack.enter_context(control.on_cancel(client.abort))
+        temp_config_path = stack.enter_context(self.shared_temp_config()) if self.watch_diaginfo_every else None
+        count = max(1, int(self.watch_duration // self.watch_interval) + 1)
+        successful = 0
+
+        print(f"Наблюдение за {client.host}:{client.port}: {count} замеров с интервалом {self.watch_interval} сек")
+
+        try:
+            with self.open_output("2_zabbix_stats_watch.jsonl") as f:
+                start = time.monotonic()
+                for i in range(count):
+                    delay = start + i * self.watch_interval - time.monotonic()
+                    if control.wait(delay):
+                        break
+
+                    now = time.monotonic()
+                    record = {'timestamp': datetime.now().isoformat(), 't': round(now - start, 3)}
+                    try:
+                        stats = client.request({"request": "zabbix.stats"}, keep_alive=True)
+                        record['stats'] = stats
+                        record.update(calculator.update(now, stats))
+                        successful += 1
+                    except Exception as e:
+                        client.close()
+                        record['error'] = str(e)
+
+                    if temp_config_path and i % self.watch_diaginfo_every == 0:
+                        try:
+                            record['diaginfo'] = self.capture_diaginfo(temp_config_path)
+                        except Exception as e:
+                            record['diaginfo_error'] = str(e)
+
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    f.flush()
+        finally:
+            client.close()
+            stack.close()
+
+        print(f"Успешных замеров: {successful} из {count}, результат сохранен в 2_zabbix_stats_watch.jsonl")
+        return successful > 0
+
+    def task_3_ps_aux(self):
+        """Задача 3: Сбор ps aux | grep zabbix_server"""
+        return self.run_command("ps aux | grep zabbix_server", "3_ps_aux")
+
+    def task_3_zabbix_workers(self):
+        """Задача 3.1: Замеры нагрузки процессов zabbix_server по /proc"""
+        print(f"Замеры процессов zabbix_server: {self.worker_samples} x {self.worker_interval} сек")
+        try:
+            summary = self.worker_sampler.capture(
+                self.worker_samples, self.worker_interval, stop_event=self.task_control().event
+            )
+        except Exception as e:
+            print(f"Ошибка сбора метрик процессов: {e}")
+            return False
+
+        if not summary['processes']:
+            print("Процессы zabbix_server не найдены")
+            return False
+
+        with self.open_output("3_zabbix_workers.json") as f:
+            json.dump({
+                'source': '/proc/<pid>/stat, /proc/<pid>/status, /proc/<pid>/io',
+                'collected': datetime.now().isoformat(),
+                'samples': self.worker_samples,
+                'interval': self.worker_interval,
+                'types': summary['types'],
+                'processes': summary['processes'],
+            }, f, ensure_ascii=False, indent=1)
+
+        print("Результат сохранен в 3_zabbix_workers.json")
+        return True
+
+    def task_4_free(self):
+        """Задача 4: Сбор информации о памяти (аналог free -b)"""
+        return self.collect_native("4_free", "/proc/meminfo", self.system_info.free_text)
+
+    def task_5_vmstat(self):
+        """Задача 5: Сбор системных метрик встроенным сэмплером (аналог vmstat)
+
+        Сохраняет 5_vmstat.txt в формате vmstat и 5_vmstat_samples.json
+        в колоночном формате с метриками PSI.
+        """
+        source = "/proc/stat, /proc/vmstat, /proc/meminfo, /proc/pressure"
+        print(f"Сбор метрик: интервал {self.sample_interval} сек, длительность {self.sample_duration} сек")
+
+        try:
+            rows = self.system_sampler.capture(
+                self.sample_interval, self.sample_duration, stop_event=self.task_control().event
+            )
+        except Exception as e:
+            print(f"Ошибка сбора системных метрик: {e}")
+            return False
+
+        self.write_output(
+            "5_vmstat", f"{source} (интервал {self.sample_interval} сек)",
+            self.system_sampler.vmstat_text(rows)
+        )
+
+        with self.open_output("5_vmstat_samples.json") as f:
+            json.dump({
+                'source': source,
+                'interval': self.sample_interval,
+                'duration': self.sample_duration,
+                'collected': datetime.now().isoformat(),
+                'samples': len(rows),
+                'columns': self.system_sampler.columnar(rows),
+            }, f, separators=(',', ':'))
+
+        print("Результат сохранен в 5_vmstat_samples.json")
+        return True
+
+    def task_6_zabbix_config(self):
+        """Задача 6: Сбор конфигурации zabbix_server"""
+        _, config_path = self.get_zabbix_paths()
+        config = self.get_zabbix_config()
+
+        if not config:
+            print(f"Конфиг-файл не найден: {config_path}")
+            return False
+
+        # Файлы конфигурации не менялись с базового архива (--since) - фильтрация не нужна
+        fingerprint = config.fingerprint()
+        if fingerprint and self.unchanged("6_zabbix_config.txt", fingerprint=fingerprint):
+            return True
+
+        try:
+            # Действующие значения всех файлов, сгруппированные по файлу, где они заданы
+            entries, excluded = config.redacted()
+            lines = []
+            current = None
+            for key, value, path, _ in entries:
+                if path != current:
+                    lines.append(f"\n# {path}\n" if lines else f"# {path}\n")
+                    current = path
+                lines.append(f"{key}={value}\n")
+            content = ''.join(lines)
+
+            digest = CollectionManifest.digest(content)
+            if self.unchanged("6_zabbix_config.txt", digest=digest, fingerprint=fingerprint):
+                return True
+
+            # Сохраняем отфильтрованный конфиг
+            with self.open_output("6_zabbix_config.txt") as f:
+                f.write(f"# Zabbix Server Configuration (filtered)\n")
+                f.write(f"# Дата выполнения: {datetime.now()}\n")
+                f.write(f"# Исходный файл: {config_path}\n")
+                f.write(f"# Прочитано файлов: {len(config.files)}\n")
+                for cycle in config.cycles:
+                    f.write(f"# Пропущен циклический Include: {cycle}\n")
+                f.write(f"# Исключены чувствительные параметры: {', '.join(excluded) or 'нет'}\n\n")
+                f.write(content)
+            self.manifest.record("6_zabbix_config.txt", digest, fingerprint)
+
+            print("Конфигурация сохранена в 6_zabbix_config.txt")
+            print(f"Действующих параметров: {len(entries)}, файлов: {len(config.files)}")
+            return True
+
+        except Exception as e:
+            print(f"Ошибка обработки конфига: {e}")
+            return False
+
+    def task_7_os_release(self):
+        """Задача 7: Сбор /etc/os-release"""
+        try:
+            path, content = self.system_info.os_release()
+        except Exception as e:
+            print(f"Ошибка чтения os-release: {e}")
+            return False
+        return self.write_static("7_os_release", path, content)
+
+    def task_8_uptime(self):
+        """Задача 8: Сбор uptime"""
+        return self.collect_native("8_uptime", "/proc/uptime, /proc/loadavg", self.system_info.uptime_text)
+
+    def task_9_nproc(self):
+        """Задача 9: Сбор количества доступных CPU (аналог nproc)"""
+        return self.collect_native(
+            "9_nproc", "sched_getaffinity", lambda: f"{self.system_info.nproc()}\n", normalize=str
+        )
+
+    def task_10_cpuinfo(self):
+        """Задача 10: Сбор информации о процессоре"""
+        return self.collect_native(
+            "10_cpuinfo", "/proc/cpuinfo", self.system_info.cpuinfo_text,
+            normalize=SystemInfoCollector.stable_cpuinfo
+        )
+
+    def task_final(self):
+        """Финальная задача: Запись времени завершения"""
+        try:
+            with self.open_output("final.txt") as f:
+                f.write(f"# Время завершения сбора диагностических данных\n")
+                f.write(f"# Дата и время: {datetime.now()}\n\n")
+                f.write(datetime.now().isoformat())
+            
+            print("Время завершения записано в final.txt")
+            return True
+        
+        except Exception as e:
+            print(f"Ошибка записи времени завершения: {e}")
+            return False
+
+    def create_zip_archive(self):
+        """Завершение записи zip-архива с именем HOSTNAME.zip"""
+        try:
+            self.archive.close()
+            for name, size in sorted(self.archive.sizes.items()):
+                print(f"Добавлен в архив: {name} ({size} байт)")
+            print(f"Архив создан: {self.archive.zip_path}")
+            return True, self.archive.zip_path
 
-    def setup_output_directory(self):
-        """Создание выходной директории, удаление существующей если есть"""
-        if self.output_dir.exists():
-            print(f"Удаляем существующую директорию {self.output_dir}")
-            shutil.rmtree(self.output_dir)
+        except Exception as e:
+            print(f"Ошибка создания архива: {e}")
+            return False, None
 
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Создана директория для вывода: {self.output_dir}")
+    def task_0_version(self):
+        """Задача 0: Запись версии скрипта"""
+        try:
+            with self.open_output("0_version.txt") as f:
+                f.write(f"# Версия скрипта zdiag.py\n")
+                f.write(f"# Дата выполнения: {datetime.now()}\n\n")
+                f.write(VERSION)
+            
+            print("Версия сохранена в 0_version.txt")
+            return True
+        
+        except Exception as e:
+            print(f"Ошибка записи версии: {e}")
+            return False
 
-    def run_command(self, command, filename, shell=True, timeout=30):
-        """Выполнение команды и сохранение результата в файл"""
+    def run_task(self, task_name, task_func, control=None):
+        """Выполнение одной задачи с перехватом исключений и самоизмерением
+
+        control - управление отменой задачи (TaskControl), его отмена
+        останавливает задачу по таймауту.
+        """
+        print(f"\n--- Выполняем задачу: {task_name} ---")
+        with self.attach_control(control or TaskControl()), self.metrics.measure(task_name) as record:
+            try:
+                success = bool(task_func())
+                status = "✓" if success else "✗"
+                print(f"{status} {task_name}: {'успешно' if success else 'ошибка'}")
+            except TaskCancelled:
+                print(f"✗ {task_name}: остановлена по таймауту, результат не сохранен")
+                success = False
+            except Exception as e:
+                print(f"✗ {task_name}: исключение - {e}")
+                success = False
+            record['success'] = success
+        return success
+
+    def write_collector_metrics(self):
+        """Запись collector_metrics.json и, при --profile-collector, профиля cProfile"""
         try:
-            print(f"Выполняем: {command}")
-            result = subprocess.run(
-                command,
-                shell=shell,
-                capture_output=True,
-                text=True,
-                timeout=timeout
+            with self.open_output("collector_metrics.json") as f:
+                json.dump(self.metrics.to_dict(), f, ensure_ascii=False, indent=1)
+            print("Метрики сборщика сохранены в collector_metrics.json")
+
+            if self.metrics.stats is not None:
+                with self.open_output("collector_profile.pstats", binary=True) as f:
+                    marshal.dump(self.metrics.stats.stats, f)
+                with self.open_output("collector_profile.txt") as f:
+                    f.write(self.metrics.profile_text())
+                print("Профиль сборщика сохранен в collector_profile.pstats и collector_profile.txt")
+        except Exception as e:
+            print(f"Ошибка записи метрик сборщика: {e}")
+
+    def write_manifest(self):
+        """Запись manifest.json - базы для следующего инкрементального сбора"""
+        try:
+            manifest = self.manifest.to_dict()
+            with self.open_output(CollectionManifest.NAME) as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            referenced = sorted({entry['archive'] for entry in manifest['artifacts'].values()}
+                                - {manifest['archive']})
+            if referenced:
+                print(f"Манифест сохранен в {CollectionManifest.NAME}, ссылки на архивы: {', '.join(referenced)}")
+            else:
+                print(f"Манифест сохранен в {CollectionManifest.NAME}")
+        except Exception as e:
+            print(f"Ошибка записи манифеста: {e}")
+
+    def plan_tasks(self):
+        """Задачи выбранного профиля в порядке реестра"""
+        return [task for task in self.TASKS if task.enabled(self)]
+
+    def start_task(self, task, control=None):
+        """Запуск задачи из реестра; None - задача пропущена из-за бюджета времени"""
+        remaining = self.remaining_budget()
+        if remaining is not None and task.estimate(self) > remaining:
+            print(f"- {task.name}: пропущена, не укладывается в бюджет времени "
+                  f"(нужно ~{task.estimate(self):.0f} сек, осталось {remaining:.0f} сек)")
+            return None
+        return self.run_task(task.name, getattr(self, task.method), control)
+
+    def task_timeout(self, task, start):
+        """Таймаут задачи, запущенной в момент start, с учетом бюджета времени"""
+        timeout = task.limit(self)
+        if self.deadline is not None:
+            # Небольшой запас на запись результата после таймаута команды
+            timeout = min(timeout, self.deadline - start + 5)
+        return timeout
+
+    @staticmethod
+    def failed_dependency(task, results):
+        """Первая зависимость задачи, завершившаяся ошибкой, или None"""
+        dep = next((dep for dep in task.deps if results.get(dep) is False), None)
+        if dep is not None:
+            print(f"- {task.name}: пропущена, задача {dep} завершилась ошибкой")
+        return dep
+
+    def run_tasks_serial(self, tasks):
+        """Последовательное выполнение задач (порядок реестра учитывает зависимости)
+
+        Каждая задача выполняется в своем потоке под TaskControl и, как при
+        параллельном выполнении, отменяется по таймауту; следующая задача
+        запускается сразу после этого, не дожидаясь остановки зависшей.
+        """
+        results = {}
+        for task in tasks:
+            if self.failed_dependency(task, results):
+                results[task.name] = False
+                continue
+
+            control = TaskControl()
+            outcome = {}
+            thread = threading.Thread(
+                target=lambda task, control, outcome: outcome.update(result=self.start_task(task, control)),
+                args=(task, control, outcome), name="zdiag-serial", daemon=True
             )
+            start = time.monotonic()
+            try:
+                thread.start()
+                timeout = self.task_timeout(task, start)
+                thread.join(max(0.0, timeout))
+                if thread.is_alive():
+                    print(f"✗ {task.name}: превышен таймаут задачи ({timeout:.0f} сек)")
+                    results[task.name] = False
+                else:
+                    results[task.name] = outcome.get('result', False)
+            finally:
+                # Задача, не завершившаяся к таймауту или при прерывании, отменяется
+                if thread.is_alive():
+                    control.cancel()
 
-            output_file = self.output_dir / f"{filename}.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Команда: {command}\n")
-                f.write(f"# Дата выполнения: {datetime.now()}\n")
-                f.write(f"# Exit code: {result.returncode}\n\n")
-                f.write("=== STDOUT ===\n")
-                f.write(result.stdout)
-                if result.stderr:
-                    f.write("\n=== STDERR ===\n")
-                    f.write(result.stderr)
+        return [(task.name, results[task.name]) for task in tasks]
+
+    def run_tasks_parallel(self, tasks):
+        """Параллельное выполнение задач в пуле потоков с учетом зависимостей
+
+        Задача отправляется в пул, когда завершены задачи из её deps и after
+        (при ошибке зависимости из deps она пропускается). Для каждой
+        задачи отслеживается таймаут с момента её фактического запуска, но не
+        дольше оставшегося бюджета времени. Задача, превысившая таймаут,
+        считается неуспешной и отменяется через TaskControl: ожидания
+        прерываются, её команды завершаются, в архив она больше не пишет.
+        """
+        planned = {task.name for task in tasks}
+        started = {}
+        controls = {task.name: TaskControl() for task in tasks}
+
+        def wrapper(task):
+            started[task.name] = time.monotonic()
+            return self.start_task(task, controls[task.name])
+
+        results = {}
+        waiting = list(tasks)
+        executor = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="zdiag")
+        try:
+            pending = {}
+            while waiting or pending:
+                # Пропуск задачи может сделать готовыми зависящие от нее
+                ready = True
+                while ready:
+                    ready = [task for task in waiting
+                             if all(dep in results or dep not in planned for dep in task.deps + task.after)]
+                    for task in ready:
+                        waiting.remove(task)
+                        if self.failed_dependency(task, results):
+                            results[task.name] = False
+                        else:
+                            pending[executor.submit(wrapper, task)] = task
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    results[task.name] = future.result()
+
+                now = time.monotonic()
+                for future, task in list(pending.items()):
+                    start = started.get(task.name)
+                    if start is None:
+                        continue
+                    timeout = self.task_timeout(task, start)
+                    if now - start > timeout:
+                        print(f"✗ {task.name}: превышен таймаут задачи ({timeout:.0f} сек)")
+                        controls[task.name].cancel()
+                        results[task.name] = False
+                        del pending[future]
+        finally:
+            # Незавершенные задачи (например, при прерывании) отменяются до закрытия архива
+            for name, control in controls.items():
+                if name not in results:
+                    control.cancel()
+            executor.shutdown(wait=False)
+
+        return [(task.name, results.get(task.name, False)) for task in tasks]
+
+    def run_all_tasks(self):
+        """Выполнение задач выбранного профиля"""
+        print("=== Начинаем сбор диагностической информации Zabbix ===")
+        print(f"Профиль сбора: {self.profile}")
 
-            print(f"Результат сохранен в {output_file}")
-            return result.returncode == 0, result.stdout
+        started_at = time.monotonic()
+        if self.time_budget:
+            self.deadline = started_at + self.time_budget
+            print(f"Бюджет времени: {self.time_budget} сек")
+        self.apply_priority()
 
-        except subprocess.TimeoutExpired:
-            print(f"Команда '{command}' превысила таймаут")
-            return False, ""
+        # Подготовка
+        with self.metrics.measure("Setup") as record:
+            self.setup_output()
+            self.discover_zabbix_server()
+            record['success'] = True
+
+        tasks = self.plan_tasks()
+        excluded = [task.name for task in self.TASKS if self.profile not in task.profiles]
+        if excluded:
+            print(f"Не входят в профиль {self.profile}: {', '.join(excluded)}")
+
+        results = [("0. Version", self.run_task("0. Version", self.task_0_version))]
+
+        if self.serial:
+            results += self.run_tasks_serial(tasks)
+        else:
+            print(f"Параллельное выполнение задач, потоков: {self.jobs}")
+            results += self.run_tasks_parallel(tasks)
+
+        # Время завершения записывается только после всех задач
+        results.append(("Final", self.run_task("Final", self.task_final)))
+
+        self.write_collector_metrics()
+        self.write_manifest()
+
+        # Создаем архив
+        print(f"\n--- Создание архива ---")
+        archive_success, archive_path = self.create_zip_archive()
+
+        # Итоговый отчет
+        print(f"\n=== Итоговый отчет ===")
+        for task_name, success in results:
+            if success is None:
+                print(f"- {task_name} (пропущена: бюджет времени)")
+                continue
+            status = "✓" if success else "✗"
+            wall = self.metrics.wall_time(task_name)
+            print(f"{status} {task_name}" + (f" ({wall:.1f} сек)" if wall is not None else ""))
+
+        if archive_success:
+            print(f"✓ Архив создан: {archive_path}")
+        else:
+            print(f"✗ Ошибка создания архива")
+
+        if self.keep_output_dir:
+            print(f"\nДанные собраны в: {self.output_dir}")
+        print(f"Общее время сбора: {time.monotonic() - started_at:.1f} сек")
+
+
+class DaemonTrigger:
+    """Условие выгрузки архива в режиме демона, например preprocessing_queue>1000
+
+    Левая часть - путь в ответе zabbix.stats (vcache.buffer.pfree), скорость
+    счетчика (rate.vcache.cache.misses) или системная метрика (system.wa,
+    system.psi_memory_some).
+    """
+
+    PATTERN = re.compile(r'^\s*([\w. ]+?)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$')
+    OPERATORS = {
+        '>': lambda value, limit: value > limit,
+        '<': lambda value, limit: value < limit,
+        '>=': lambda value, limit: value >= limit,
+        '<=': lambda value, limit: value <= limit,
+    }
+
+    def __init__(self, spec):
+        match = self.PATTERN.match(spec)
+        if not match:
+            raise ValueError(f"Неверное условие '{spec}', ожидается вида preprocessing_queue>1000")
+        self.spec = spec.strip()
+        self.path, self.operator, limit = match.groups()
+        self.limit = float(limit)
+
+    def value(self, record):
+        if self.path.startswith('rate.'):
+            return (record.get('rates') or {}).get(self.path[5:])
+        if self.path.startswith('system.'):
+            return (record.get('system') or {}).get(self.path[7:])
+        stats = record.get('stats') or {}
+        return StatsRateCalculator.lookup(stats.get('data', stats), self.path)
+
+    def check(self, record):
+        """Значение метрики, если условие выполнено, иначе None"""
+        value = self.value(record)
+        if value is not None and self.OPERATORS[self.operator](value, self.limit):
+            return value
+        return None
+
+
+class DiagnosticDaemon:
+    """Режим демона: непрерывные замеры в кольцевой буфер и выгрузка по триггерам
+
+    С интервалом interval снимаются zabbix.stats, системные метрики /proc и
+    нагрузка процессов zabbix_server; замеры хранятся в deque фиксированной
+    длины (window / interval), поэтому расход памяти не растет. При
+    срабатывании условия или по сигналу SIGUSR1 в фоне создается обычный
+    архив: буфер за последние window секунд и быстрые задачи профиля.
+    """
+
+    # Задачи, данные которых берутся из буфера, а не собираются при выгрузке
+    BUFFERED_TASKS = ('task_2_zabbix_stats', 'task_2_zabbix_stats_watch', 'task_3_zabbix_workers', 'task_5_vmstat')
+    WORKER_REFRESH = 30
+
+    def __init__(self, diag, window=DEFAULT_DAEMON_WINDOW, interval=DEFAULT_WATCH_INTERVAL, triggers=(),
+                 cooldown=DEFAULT_DAEMON_COOLDOWN, dump_dir=DEFAULT_DAEMON_DIR, max_dumps=DEFAULT_DAEMON_MAX_DUMPS):
+        self.diag = diag
+        self.window = window
+        self.interval = max(0.1, interval)
+        self.triggers = [DaemonTrigger(spec) for spec in triggers]
+        self.cooldown = cooldown
+        self.dump_dir = Path(dump_dir)
+        self.max_dumps = max_dumps
+        self.buffer = deque(maxlen=max(1, int(window / self.interval)))
+        self.stopping = False
+        self.dump_requested = False
+        self.dump_thread = None
+        self.last_dump = None
+
+    def handle_signal(self, signum, frame):
+        # Только флаги: обработчик выполняется между байткодами основного потока,
+        # и захват блокировок здесь может привести к взаимоблокировке.
+        # Ожидание прерывается через signal.set_wakeup_fd
+        if signum == signal.SIGUSR1:
+            self.dump_requested = True
+        else:
+            self.stopping = True
+
+    def worker_types(self, intervals):
+        """Нагрузка процессов по типам за интервал"""
+        types = {}
+        for pid, data in intervals.items():
+            worker = self.diag.worker_sampler.workers.get(pid)
+            if worker is None:
+                continue
+            group = types.setdefault(worker['type'], {'count': 0, 'cpu_pct': 0.0, 'rss': 0})
+            group['count'] += 1
+            group['cpu_pct'] = round(group['cpu_pct'] + data['cpu_pct'], 2)
+            group['rss'] += data['rss']
+        return types
+
+    def sample(self, client, calculator, prev):
+        """Один замер; prev - предыдущие снимки /proc, обновляются на месте"""
+        now = time.monotonic()
+        record = {'timestamp': datetime.now().isoformat()}
+
+        try:
+            stats = client.request({"request": "zabbix.stats"}, keep_alive=True)
+            record['stats'] = stats
+            record.update(calculator.update(now, stats))
         except Exception as e:
-            print(f"Ошибка выполнения команды '{command}': {e}")
-            return False, ""
+            client.close()
+            record['error'] = str(e)
+
+        system = self.diag.system_sampler.snapshot()
+        record['system'] = self.diag.system_sampler.row(prev['system'], system)
+        prev['system'] = system
+
+        sampler = self.diag.worker_sampler
+        workers = sampler.snapshot()
+        record['workers'] = self.worker_types(sampler.interval(prev['workers'], workers))
+        prev['workers'] = workers
+        prev['ticks'] += 1
+        if not sampler.workers or prev['ticks'] % self.WORKER_REFRESH == 0:
+            # Процессы zabbix_server могли перезапуститься
+            sampler.close()
+            sampler.open()
+            prev['workers'] = sampler.snapshot()
+
+        return record
+
+    def check_triggers(self, record):
+        """Описание сработавшего условия с учетом паузы после предыдущей выгрузки"""
+        if self.last_dump is not None and time.monotonic() - self.last_dump < self.cooldown:
+            return None
+        for trigger in self.triggers:
+            value = trigger.check(record)
+            if value is not None:
+                return f"{trigger.spec} (значение {value})"
+        return None
+
+    def start_dump(self, reason):
+        if self.dump_thread is not None and self.dump_thread.is_alive():
+            print(f"Выгрузка уже выполняется, пропускаем: {reason}")
+            return
+        self.last_dump = time.monotonic()
+        records = list(self.buffer)
+        self.dump_thread = threading.Thread(target=self.dump, args=(reason, records), name="zdiag-dump")
+        self.dump_thread.start()
+
+    def dump(self, reason, records):
+        """Создание архива из буфера и быстрых задач текущего профиля"""
+        diag = self.diag
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        hostname = diag.get_hostname()
+        zip_path = self.dump_dir / f"zdiag-{stamp}" / f"{hostname}.zip"
+        print(f"\n=== Выгрузка архива: {reason} ===")
 
-    def get_zabbix_paths(self):
-        """Получение путей к бинарнику и конфиг-файлу zabbix_server из ps aux"""
         try:
-            result = subprocess.run(
-                ["ps", "aux"],
-                capture_output=True,
-                text=True,
-                timeout=10
+            zip_path.parent.mkdir(parents=True, exist_ok=True)
+            diag.metrics = CollectorMetrics(profile=diag.metrics.profile)
+            diag.setup_output(zip_path)
+            diag.run_task("0. Version", diag.task_0_version)
+            self.write_buffer(reason, records)
+            diag.run_tasks_serial([
+                task for task in diag.plan_tasks() if task.method not in self.BUFFERED_TASKS
+            ])
+            diag.run_task("Final", diag.task_final)
+            diag.write_collector_metrics()
+            diag.write_manifest()
+            diag.create_zip_archive()
+        except Exception as e:
+            print(f"Ошибка выгрузки архива: {e}")
+            return
+
+        self.cleanup_dumps()
+
+    def write_buffer(self, reason, records):
+        """Файлы архива из кольцевого буфера в стандартном формате"""
+        diag = self.diag
+        with diag.open_output("daemon_trigger.json") as f:
+            json.dump({
+                'reason': reason,
+                'dumped': datetime.now().isoformat(),
+                'window': self.window,
+                'interval': self.interval,
+                'samples': len(records),
+                'first': records[0]['timestamp'] if records else None,
+                'triggers': [trigger.spec for trigger in self.triggers],
+            }, f, ensure_ascii=False, indent=1)
+
+        with diag.open_output("daemon_buffer.jsonl") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        latest = next((record['stats'] for record in reversed(records) if 'stats' in record), None)
+        if latest is not None:
+            client = diag.create_stats_client()
+            with diag.open_output("2_zabbix_stats.txt") as f:
+                f.write(diag.format_stats_output(
+                    client.host, client.port,
+                    "Успешно получен JSON ответ:\n" + json.dumps(latest, ensure_ascii=False)
+                ))
+
+        rows = [record['system'] for record in records]
+        if rows:
+            source = "/proc/stat, /proc/vmstat, /proc/meminfo, /proc/pressure"
+            diag.write_output(
+                "5_vmstat", f"{source} (режим демона, интервал {self.interval} сек)",
+                diag.system_sampler.vmstat_text(rows)
             )
+            with diag.open_output("5_vmstat_samples.json") as f:
+                json.dump({
+                    'source': source,
+                    'interval': self.interval,
+                    'duration': self.interval * len(rows),
+                    'collected': datetime.now().isoformat(),
+                    'samples': len(rows),
+                    'columns': SystemSampler.columnar(rows),
+                }, f, separators=(',', ':'))
+
+    def cleanup_dumps(self):
+        """Удаление самых старых выгрузок сверх max_dumps"""
+        if not self.max_dumps:
+            return
+        dumps = sorted(path for path in self.dump_dir.glob("zdiag-*") if path.is_dir())
+        for path in dumps[:-self.max_dumps]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def run(self):
+        diag = self.diag
+        diag.apply_priority()
+        diag.discover_zabbix_server()
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        for signum in (signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.handle_signal)
+
+        print(f"Режим демона: замер каждые {self.interval} сек, буфер {self.window} сек "
+              f"({self.buffer.maxlen} замеров), выгрузки в {self.dump_dir}")
+        for trigger in self.triggers:
+            print(f"Условие выгрузки: {trigger.spec}")
+        print(f"Выгрузка по запросу: kill -USR1 {os.getpid()}")
+
+        client = diag.create_stats_client()
+        calculator = StatsRateCalculator()
+        diag.system_sampler.open()
+        diag.worker_sampler.open()
+        try:
+            prev = {
+                'system': diag.system_sampler.snapshot(),
+                'workers': diag.worker_sampler.snapshot(),
+                'ticks': 0,
+            }
+            next_tick = time.monotonic() + self.interval
+
+            while not self.stopping:
+                ready, _, _ = select.select([wakeup_read], [], [], max(0.0, next_tick - time.monotonic()))
+                if ready:
+                    try:
+                        os.read(wakeup_read, 512)
+                    except BlockingIOError:
+                        pass
+                if self.stopping:
+                    break
+
+                reason = None
+                if time.monotonic() >= next_tick:
+                    record = self.sample(client, calculator, prev)
+                    self.buffer.append(record)
+                    reason = self.check_triggers(record)
+                    next_tick = max(next_tick + self.interval, time.monotonic())
 
-            for line in result.stdout.split('\n'):
-                if 'zabbix_server' in line and '-c' in line:
-                    # Ищем паттерн: /path/to/zabbix_server -c /path/to/config
-                    match = re.search(r'(\S+zabbix_server)\s+.*?-c\s+(\S+)', line)
-                    if match:
-                        binary_path = match.group(1)
-                        config_path = match.group(2)
-                        print(f"Найден zabbix_server: {binary_path}, конфиг: {config_path}")
-                        return binary_path, config_path
+                if self.dump_requested:
+                    self.dump_requested = False
+                    reason = "SIGUSR1"
+                if reason:
+                    self.start_dump(reason)
+        finally:
+            client.close()
+            diag.system_sampler.close()
+            diag.worker_sampler.close()
+            if self.dump_thread is not None:
+                self.dump_thread.join()
+            signal.set_wakeup_fd(-1)
+            os.close(wakeup_read)
+            os.close(wakeup_write)
 
-            print("Не удалось найти zabbix_server в процессах")
-            return None, None
+        print("Режим демона остановлен")
+        return True
 
+
+class StatsCache:
+    """Ответ zabbix.stats с временем жизни ttl и единственным запросом
+
+    Пока ответ свежий, он отдается из кэша. Устаревший ответ обновляет
+    только один поток: запрос к trapper'у выполняется под блокировкой, а
+    одновременные обращения ждут ее и получают уже обновленный ответ,
+    поэтому параллельные опросы не умножают нагрузку на сервер. Ошибка
+    запроса кэшируется так же, как ответ. После каждого обновления
+    вызывается on_refresh.
+    """
+
+    def __init__(self, fetch, ttl=DEFAULT_EXPORTER_TTL, on_refresh=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.on_refresh = on_refresh
+        self.lock = threading.Lock()
+        self.state = None
+        self.fetched = None
+        self.requests = 0
+
+    def get(self):
+        """Состояние: stats, error, duration (длительность запроса), age, requests"""
+        with self.lock:
+            if self.fetched is None or time.monotonic() - self.fetched >= self.ttl:
+                self.refresh()
+            return dict(self.state, age=round(time.monotonic() - self.fetched, 3))
+
+    def refresh(self):
+        started = time.monotonic()
+        stats, error = None, None
+        try:
+            stats = self.fetch()
+            if not isinstance(stats, dict) or stats.get('response') != 'success':
+                error = f"Неуспешный ответ zabbix.stats: {str(stats)[:200]}"
+                stats = None
         except Exception as e:
-            print(f"Ошибка получения путей zabbix: {e}")
-            return None, None
+            error = str(e)
+        self.fetched = time.monotonic()
+        self.requests += 1
+        self.state = {
+            'stats': stats,
+            'error': error,
+            'duration': round(self.fetched - started, 6),
+            'requests': self.requests,
+        }
+        if self.on_refresh:
+            self.on_refresh(dict(self.state, age=0.0))
 
-    def task_1_diaginfo(self):
-        """Задача 1: Сбор diaginfo"""
-        binary_path, config_path = self.get_zabbix_paths()
 
-        if not binary_path or not config_path:
-            print("Не удалось получить пути к zabbix_server")
-            return False
+class MetricsText:
+    """Построение текста метрик в формате Prometheus text 0.0.4 или OpenMetrics
 
-        if not os.path.exists(config_path):
-            print(f"Конфиг-файл не найден: {config_path}")
+    Семейства добавляются через add() и выводятся в порядке добавления.
+    Имена образцов в обоих форматах одинаковы (у счетчиков суффикс _total),
+    различаются только строки TYPE/HELP счетчиков и завершающий # EOF.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.families = {}
+
+    @staticmethod
+    def escape(value, quotes=True):
+        """Экранирование значения метки (в HELP кавычки не экранируются)"""
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+        return value.replace('"', '\\"') if quotes else value
+
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        if isinstance(value, int):
+            return str(value)
+        return repr(float(value))
+
+    def add(self, name, kind, help_text, value, labels=None):
+        """Добавление образца; нечисловые значения пропускаются"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        family = self.families.setdefault(f"{self.prefix}_{name}", {'type': kind, 'help': help_text, 'samples': []})
+        family['samples'].append((labels or {}, value))
+
+    def render(self, openmetrics=False):
+        lines = []
+        for name, family in self.families.items():
+            sample_name = f"{name}_total" if family['type'] == 'counter' else name
+            family_name = name if openmetrics else sample_name
+            lines.append(f"# HELP {family_name} {self.escape(family['help'], quotes=False)}")
+            lines.append(f"# TYPE {family_name} {family['type']}")
+            for labels, value in family['samples']:
+                label_text = ','.join(f'{key}="{self.escape(val)}"' for key, val in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {self.format_value(value)}" if label_text
+                             else f"{sample_name} {self.format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter:
+    """Экспорт zabbix.stats в формате Prometheus
+
+    Режим --exporter поднимает HTTP-сервер с /metrics, ответ zabbix.stats
+    берется через StatsCache, поэтому trapper опрашивается не чаще раза в
+    ttl секунд при любом числе одновременных опросов. При заданном textfile
+    после каждого обновления метрики атомарно записываются в файл для
+    textfile collector node_exporter.
+    """
+
+    PREFIX = 'zabbix_server'
+
+    # Числовые поля zabbix.stats: путь -> (имя метрики, тип, описание)
+    FIELDS = {
+        'uptime': ('uptime_seconds', 'gauge', 'Время работы zabbix_server'),
+        'boottime': ('boot_time_seconds', 'gauge', 'Время запуска zabbix_server (Unix time)'),
+        'hosts': ('hosts', 'gauge', 'Количество отслеживаемых узлов'),
+        'items': ('items', 'gauge', 'Количество активных элементов данных'),
+        'item_unsupported': ('items_unsupported', 'gauge', 'Количество неподдерживаемых элементов данных'),
+        'triggers': ('triggers', 'gauge', 'Количество активных триггеров'),
+        'requiredperformance': ('required_performance_vps', 'gauge', 'Требуемая производительность, значений в секунду'),
+        'preprocessing_queue': ('preprocessing_queue', 'gauge', 'Значения в очереди препроцессинга'),
+        'lld_queue': ('lld_queue', 'gauge', 'Значения в очереди LLD'),
+        'connector_queue': ('connector_queue', 'gauge', 'Значения в очереди коннекторов'),
+        'vcache.cache.requests': ('vcache_requests', 'counter', 'Запросы к value cache'),
+        'vcache.cache.hits': ('vcache_hits', 'counter', 'Попадания в value cache'),
+        'vcache.cache.misses': ('vcache_misses', 'counter', 'Промахи value cache'),
+        'vcache.cache.mode': ('vcache_mode', 'gauge', 'Режим value cache (1 - режим низкой памяти)'),
+    }
+
+    # Разделы памяти кэшей: путь -> метка cache
+    CACHES = {
+        'rcache': 'rcache',
+        'vcache.buffer': 'vcache',
+        'wcache.history': 'wcache_history',
+        'wcache.index': 'wcache_index',
+        'wcache.trend': 'wcache_trend',
+    }
+
+    def __init__(self, diag, listen=DEFAULT_EXPORTER_LISTEN, ttl=DEFAULT_EXPORTER_TTL, textfile=None):
+        self.diag = diag
+        self.listen = listen
+        self.textfile = textfile
+        self.cache = StatsCache(self.fetch, ttl, on_refresh=self.write_textfile if textfile else None)
+        self.client = None
+        # Ошибка последней записи textfile (None - записан успешно)
+        self.textfile_error = None
+
+    def fetch(self):
+        """Запрос zabbix.stats тем же клиентом, что и в задаче 2"""
+        if self.client is None:
+            self.client = self.diag.create_stats_client()
+        return self.client.request({"request": "zabbix.stats"})
+
+    @classmethod
+    def build(cls, state):
+        """Метрики по состоянию StatsCache"""
+        metrics = MetricsText(cls.PREFIX)
+        stats = state['stats']
+        metrics.add('up', 'gauge', 'Успешность последнего запроса zabbix.stats', 1 if stats else 0)
+        metrics.add('stats_request_duration_seconds', 'gauge',
+                    'Длительность последнего запроса zabbix.stats', state['duration'])
+        metrics.add('stats_age_seconds', 'gauge', 'Возраст закэшированного ответа zabbix.stats', state['age'])
+        metrics.add('stats_requests', 'counter', 'Запросы zabbix.stats, выполненные экспортером', state['requests'])
+        if not stats:
+            return metrics
+
+        data = stats.get('data', {})
+        if isinstance(data.get('version'), str):
+            metrics.add('info', 'gauge', 'Версия zabbix_server', 1, {'version': data['version']})
+
+        for path, (name, kind, help_text) in cls.FIELDS.items():
+            metrics.add(name, kind, help_text, StatsRateCalculator.lookup(data, path))
+
+        for path, cache in cls.CACHES.items():
+            section = StatsRateCalculator.section(data, path)
+            if section is None:
+                continue
+            for state_name in ('total', 'used', 'free'):
+                metrics.add('cache_bytes', 'gauge', 'Размер разделов кэшей zabbix_server',
+                            section.get(state_name), {'cache': cache, 'state': state_name})
+            metrics.add('cache_free_percent', 'gauge', 'Свободное место в кэшах zabbix_server, %',
+                        section.get('pfree'), {'cache': cache})
+
+        values = StatsRateCalculator.section(data, 'wcache.values')
+        if values:
+            for value_type, count in values.items():
+                if value_type != 'all':
+                    metrics.add('wcache_values', 'counter', 'Значения, обработанные history cache, по типам',
+                                count, {'type': value_type})
+
+        for process_type, process in sorted((data.get('process') or {}).items()):
+            if not isinstance(process, dict):
+                continue
+            for stat in ('avg', 'max', 'min'):
+                metrics.add('process_busy_percent', 'gauge', 'Загрузка процессов zabbix_server по типам, %',
+                            (process.get('busy') or {}).get(stat), {'type': process_type, 'stat': stat})
+            metrics.add('process_count', 'gauge', 'Количество процессов zabbix_server по типам',
+                        process.get('count'), {'type': process_type})
+
+        return metrics
+
+    def write_textfile(self, state):
+        """Атомарная запись метрик: временный файл в той же директории и os.replace
+
+        node_exporter читает только файлы *.prom, поэтому недописанный
+        временный файл не попадает в сбор.
+        """
+        path = os.path.abspath(self.textfile)
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp',
+                                             dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.build(state).render())
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+            self.textfile_error = None
+        except BaseException as e:
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            if not isinstance(e, Exception):
+                raise
+            self.textfile_error = str(e)
+            print(f"Ошибка записи {path}: {e}")
+
+    def make_handler(self):
+        exporter = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                    body = exporter.build(exporter.cache.get()).render(openmetrics).encode('utf-8')
+                    content_type = MetricsText.OPENMETRICS_CONTENT_TYPE if openmetrics else MetricsText.CONTENT_TYPE
+                    status = 200
+                elif path == '/':
+                    body = b'<html><body><a href="/metrics">/metrics</a></body></html>\n'
+                    content_type = 'text/html; charset=utf-8'
+                    status = 200
+                else:
+                    body = b'Not Found\n'
+                    content_type = 'text/plain; charset=utf-8'
+                    status = 404
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+    def parse_listen(self):
+        host, _, port = self.listen.rpartition(':')
+        return host.strip('[]') or '0.0.0.0', int(port)
+
+    def write_once(self):
+        """Однократная запись textfile (запуск из cron)
+
+        Возвращает False, если запрос zabbix.stats или запись файла не
+        удались, чтобы cron мог обнаружить ошибку по коду завершения.
+        """
+        state = self.cache.get()
+        if self.textfile_error is not None:
             return False
+        if state['error']:
+            print(f"Ошибка получения статистики: {state['error']}")
+            print(f"В {self.textfile} записана только метрика {self.PREFIX}_up 0")
+            return False
+        print(f"Метрики сохранены в {self.textfile}")
+        return True
+
+    def run(self):
+        """HTTP-сервер /metrics до получения SIGTERM или SIGINT"""
+        self.diag.discover_zabbix_server()
+        host, port = self.parse_listen()
 
-        # Создаем временный конфиг-файл
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+            address_family = socket.AF_INET6 if ':' in host else socket.AF_INET
+
+        # Сигналы блокируются до запуска потоков, чтобы их получал только
+        # основной поток в sigwait
+        signals = {signal.SIGTERM, signal.SIGINT}
+        signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+        server = Server((host, port), self.make_handler())
+        thread = threading.Thread(target=server.serve_forever, name="zdiag-exporter")
+        thread.start()
+        print(f"Экспорт метрик: http://{self.listen}/metrics, кэш zabbix.stats {self.cache.ttl} сек"
+              + (f", textfile {self.textfile}" if self.textfile else ""))
         try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='_zabbix.conf') as temp_config:
-                self.temp_config_path = temp_config.name
+            signal.sigwait(signals)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+            if self.client is not None:
+                self.client.close()
+
+        print("Экспорт метрик остановлен")
+        return True
+
+
+class FleetCollector:
+    """Параллельный опрос zabbix.stats у нескольких серверов и прокси через asyncio
+
+    Количество одновременных подключений ограничено семафором, каждая
+    попытка ограничена таймаутом, неудачные попытки повторяются. Результат
+    записывается в один архив, где у каждого узла свой подкаталог.
+    """
+
+    SUMMARY_NAME = "fleet_summary.json"
+
+    def __init__(self, diag, endpoints, concurrency=DEFAULT_FLEET_CONCURRENCY,
+                 retries=DEFAULT_FLEET_RETRIES, retry_delay=1.0):
+        self.diag = diag
+        self.endpoints = endpoints
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+
+    @staticmethod
+    def parse_endpoint(endpoint):
+        """Разбор адреса вида host, host:port или [ipv6]:port"""
+        endpoint = endpoint.strip()
+        match = re.match(r'^\[([^\]]+)\](?::(\d+))?$', endpoint)
+        if match:
+            return match.group(1), int(match.group(2) or DEFAULT_TRAPPER_PORT)
+        if endpoint.count(':') == 1:
+            host, port = endpoint.split(':')
+            return host, int(port)
+        return endpoint, DEFAULT_TRAPPER_PORT
+
+    @classmethod
+    def load_endpoints(cls, items=None, path=None):
+        """Список (host, port) из аргументов и файла (по одному адресу в строке)"""
+        endpoints = []
+        for item in items or []:
+            endpoints.extend(part for part in item.split(',') if part.strip())
+        if path:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if line:
+                        endpoints.append(line)
+
+        result = []
+        for endpoint in endpoints:
+            parsed = cls.parse_endpoint(endpoint)
+            if parsed not in result:
+                result.append(parsed)
+        return result
+
+    async def request_stats(self, host, port):
+        """Одна попытка запроса zabbix.stats"""
+        client = ZabbixProtocolClient(host, port, timeout=self.diag.stats_timeout)
+        return await client.request_async({"request": "zabbix.stats"})
+
+    async def collect_one(self, semaphore, host, port):
+        """Опрос одного узла с таймаутом и повторами"""
+        result = {'host': host, 'port': port, 'success': False, 'attempts': 0}
+        started = time.monotonic()
+
+        async with semaphore:
+            for attempt in range(1, self.retries + 2):
+                result['attempts'] = attempt
+                try:
+                    result['stats'] = await asyncio.wait_for(
+                        self.request_stats(host, port), timeout=self.diag.stats_timeout
+                    )
+                    result['success'] = True
+                    result.pop('error', None)
+                    break
+                except asyncio.TimeoutError:
+                    result['error'] = f"Таймаут {self.diag.stats_timeout} сек"
+                except (OSError, ValueError, ZabbixProtocolError, asyncio.IncompleteReadError) as e:
+                    result['error'] = str(e) or e.__class__.__name__
+
+                if attempt <= self.retries:
+                    await asyncio.sleep(self.retry_delay * attempt)
+
+        result['elapsed'] = round(time.monotonic() - started, 3)
+        status = "✓" if result['success'] else "✗"
+        print(f"{status} {host}:{port} (попыток: {result['attempts']}, {result['elapsed']} сек)"
+              + ("" if result['success'] else f": {result['error']}"))
+        return result
+
+    async def collect_async(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(
+            self.collect_one(semaphore, host, port) for host, port in self.endpoints
+        ))
 
-                # Читаем оригинальный конфиг
-                with open(config_path, 'r') as original_config:
-                    config_content = original_config.read()
+    def collect(self):
+        """Опрос всех узлов, возвращает список результатов в порядке адресов"""
+        print(f"Опрос {len(self.endpoints)} узлов, одновременно: {self.concurrency}")
+        return asyncio.run(self.collect_async())
 
-                # Заменяем Timeout на 30 (или добавляем если нет)
-                if re.search(r'^Timeout=', config_content, re.MULTILINE):
-                    config_content = re.sub(r'^Timeout=.*$', 'Timeout=30', config_content, flags=re.MULTILINE)
+    @staticmethod
+    def subtree_name(host, port):
+        return re.sub(r'[^A-Za-z0-9._-]', '_', f"{host}_{port}")
+
+    def write_archive(self, results, zip_path):
+        """Запись результатов в архив: <host>_<port>/2_zabbix_stats.txt и сводка"""
+        archive = ArchiveWriter(
+            zip_path, None,
+            compression=self.diag.compression,
+            compression_level=self.diag.compression_level
+        )
+        summary = []
+        try:
+            for result in results:
+                subtree = self.subtree_name(result['host'], result['port'])
+                with archive.open(f"{subtree}/0_version.txt") as f:
+                    f.write(f"# Версия скрипта zdiag.py\n# Дата выполнения: {datetime.now()}\n\n{VERSION}")
+                if result['success']:
+                    stats_text = "Успешно получен JSON ответ:\n" + json.dumps(result['stats'], ensure_ascii=False)
                 else:
-                    config_content += '\nTimeout=30\n'
+                    stats_text = f"Ошибка получения статистики: {result['error']}"
+                with archive.open(f"{subtree}/2_zabbix_stats.txt") as f:
+                    f.write(self.diag.format_stats_output(result['host'], result['port'], stats_text))
+                summary.append({key: value for key, value in result.items() if key != 'stats'})
+
+            with archive.open(self.SUMMARY_NAME) as f:
+                json.dump({
+                    'version': VERSION,
+                    'collected': datetime.now().isoformat(),
+                    'targets': summary,
+                }, f, ensure_ascii=False, indent=1)
+        finally:
+            archive.close()
+
+        print(f"Архив создан: {zip_path}")
+
+    def run(self, zip_path=None):
+        """Опрос всех узлов и запись архива; возвращает True, если все узлы ответили"""
+        if not zip_path:
+            zip_path = Path("/tmp") / f"fleet-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+        results = self.collect()
+        try:
+            self.write_archive(results, zip_path)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка записи архива {zip_path}: {e}")
+            return False
+
+        failed = [result for result in results if not result['success']]
+        print(f"\nУспешно: {len(results) - len(failed)} из {len(results)}")
+        return not failed
+
+
+class DiagnosticArchive:
+    """Архив <hostname>.zip, созданный сборщиком, для офлайн-анализа
+
+    Файлы ищутся по имени без учета каталога внутри архива, как в веб-интерфейсе
+    (DataParser). Поддерживаются архивы старых версий: ответ zabbix.stats в
+    виде repr() словаря Python и diaginfo только в текстовом виде. Файлы
+    инкрементального сбора (--since), на которые ссылается manifest.json,
+    читаются из архивов в той же директории. Архивы, где одно имя файла
+    встречается в нескольких каталогах (в том числе архивы --fleet), не
+    поддерживаются: load() завершается ValueError.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        self.date_time = None
+
+    def load(self):
+        with zipfile.ZipFile(self.path) as zipf:
+            names = [info.filename.rsplit('/', 1)[-1] for info in zipf.infolist() if not info.is_dir()]
+            if FleetCollector.SUMMARY_NAME in names:
+                raise ValueError(
+                    f"{self.path.name}: архив опроса нескольких серверов (--fleet), "
+                    f"анализируются только архивы сбора одного сервера"
+                )
+            if len(set(names)) != len(names):
+                raise ValueError(f"{self.path.name}: файлы с одинаковыми именами в разных каталогах архива")
+
+            for info in zipf.infolist():
+                if info.is_dir():
+                    continue
+                self.files[info.filename.rsplit('/', 1)[-1]] = zipf.read(info).decode('utf-8', errors='replace')
+                self.date_time = max(self.date_time or info.date_time, info.date_time)
+        self.load_references()
+        return self
+
+    def manifest(self):
+        """Содержимое manifest.json или пустой словарь для старых архивов"""
+        content = self.files.get(CollectionManifest.NAME)
+        if not content:
+            return {}
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def load_references(self):
+        """Чтение неизменившихся файлов из архивов, на которые ссылается manifest.json"""
+        artifacts = self.manifest().get('artifacts')
+        if not isinstance(artifacts, dict):
+            return
+
+        missing = {}
+        for name, entry in artifacts.items():
+            archive = entry.get('archive')
+            if name not in self.files and archive and archive != self.path.name:
+                missing.setdefault(archive, set()).add(name)
+
+        for archive, names in missing.items():
+            try:
+                with zipfile.ZipFile(self.path.parent / archive) as zipf:
+                    for info in zipf.infolist():
+                        name = info.filename.rsplit('/', 1)[-1]
+                        if name in names:
+                            self.files[name] = zipf.read(info).decode('utf-8', errors='replace')
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"{self.path.name}: архив {archive} из manifest.json недоступен: {e}")
+
+    @staticmethod
+    def stdout_lines(content):
+        """Строки вывода команды без заголовка сборщика"""
+        marker = '=== STDOUT ==='
+        if marker in content:
+            content = content.split(marker, 1)[1]
+        return content.splitlines()
+
+    @staticmethod
+    def integers(values):
+        """Список целых чисел или None, если хотя бы одно значение не число"""
+        try:
+            return [int(value) for value in values]
+        except ValueError:
+            return None
+
+    @property
+    def hostname(self):
+        """Имя хоста из manifest.json; для старых архивов - имя файла без расширения"""
+        hostname = self.manifest().get('hostname')
+        if isinstance(hostname, str) and hostname:
+            return hostname
+        return self.path.stem
+
+    def version(self):
+        content = self.files.get('0_version.txt')
+        if content:
+            match = re.search(r'(\d{8})', content)
+            if match:
+                return match.group(1)
+        return None
+
+    def collected(self):
+        """Время завершения сбора: из final.txt или по датам файлов архива"""
+        content = self.files.get('final.txt')
+        if content:
+            for line in content.splitlines():
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+                        try:
+                            return datetime.strptime(line, fmt)
+                        except ValueError:
+                            pass
+                    break
+        if self.date_time:
+            return datetime(*self.date_time)
+        return datetime.fromtimestamp(self.path.stat().st_mtime)
+
+    def stats(self):
+        """Поле data ответа zabbix.stats"""
+        content = self.files.get('2_zabbix_stats.txt')
+        if not content or '{' not in content:
+            return None
+
+        text = content[content.index('{'):]
+        try:
+            response = json.loads(text)
+        except ValueError:
+            try:
+                response = ast.literal_eval(text.strip())
+            except (ValueError, SyntaxError):
+                return None
+
+        if not isinstance(response, dict) or response.get('response') != 'success':
+            return None
+        data = response.get('data')
+        return data if isinstance(data, dict) else None
+
+    def config(self):
+        """Параметры из отфильтрованной конфигурации zabbix_server"""
+        content = self.files.get('6_zabbix_config.txt')
+        config = {}
+        if not content:
+            return config
+
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            config[key.strip()] = value.strip()
+        return config
+
+    def memory(self):
+        """Вывод free -b: {'mem': {...}, 'swap': {...}} в байтах"""
+        content = self.files.get('4_free.txt')
+        if not content:
+            return None
+
+        memory = {}
+        for line in self.stdout_lines(content):
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'Mem:' and len(parts) >= 7:
+                values = self.integers(parts[1:7])
+                if values:
+                    keys = ('total', 'used', 'free', 'shared', 'buff_cache', 'available')
+                    memory['mem'] = dict(zip(keys, values))
+            elif parts[0] == 'Swap:' and len(parts) >= 4:
+                values = self.integers(parts[1:4])
+                if values:
+                    memory['swap'] = dict(zip(('total', 'used', 'free'), values))
+        return memory or None
+
+    def vmstat(self):
+        """Замеры vmstat в колоночном виде: имя колонки -> список значений"""
+        content = self.files.get('5_vmstat_samples.json')
+        if content:
+            try:
+                columns = json.loads(content)['columns']
+            except (ValueError, KeyError, TypeError):
+                columns = None
+            if isinstance(columns, dict):
+                return {name: values for name, values in columns.items() if isinstance(values, list)}
+
+        content = self.files.get('5_vmstat.txt')
+        if not content:
+            return None
+
+        header = None
+        rows = []
+        for line in self.stdout_lines(content):
+            parts = line.split()
+            if parts[:2] == ['r', 'b']:
+                header = parts
+            elif header and len(parts) == len(header) and all(part.isdigit() for part in parts):
+                rows.append(dict(zip(header, (int(part) for part in parts))))
+        return SystemSampler.columnar(rows) if rows else None
+
+    def diaginfo(self):
+        """Секции diaginfo: из 1_diaginfo.json или разбором текста"""
+        content = self.files.get('1_diaginfo.json')
+        if content:
+            try:
+                sections = json.loads(content)['sections']
+            except (ValueError, KeyError, TypeError):
+                sections = None
+            if isinstance(sections, dict):
+                return sections
+
+        content = self.files.get('1_diaginfo.txt')
+        if not content:
+            return None
+        return DiaginfoParser().parse(content.splitlines()) or None
+
+
+class HealthAnalyzer:
+    """Набор правил оценки состояния сервера по данным архива
+
+    Пороги совпадают с STATUS_THRESHOLDS веб-интерфейса (config/constants.js).
+    Каждое правило возвращает список находок со статусом good, warning или
+    critical; правило пропускается, если в архиве нет нужных данных.
+    """
+
+    THRESHOLDS = {
+        'memory': {'warning': 70, 'critical': 90},
+        'swap': {'warning': 5, 'critical': 30},
+        'cpu': {'warning': 60, 'critical': 80},
+        'cache_hits': {'warning': 70, 'critical': 30},
+        'cache_free': {'good': 70, 'critical': 30},
+        'process_busy': {'critical': 50},
+        'swap_activity': {'critical': 50},
+    }
+
+    # Тип процесса zabbix_server -> параметр конфигурации и значение по умолчанию
+    PROCESS_PARAMETERS = {
+        'poller': ('StartPollers', 5),
+        'unreachable poller': ('StartPollersUnreachable', 1),
+        'agent poller': ('StartAgentPollers', 1),
+        'http agent poller': ('StartHTTPAgentPollers', 1),
+        'snmp poller': ('StartSNMPPollers', 1),
+        'http poller': ('StartHTTPPollers', 1),
+        'browser poller': ('StartBrowserPollers', 1),
+        'ipmi poller': ('StartIPMIPollers', 0),
+        'java poller': ('StartJavaPollers', 0),
+        'odbc poller': ('StartODBCPollers', 1),
+        'proxy poller': ('StartProxyPollers', 1),
+        'history poller': ('StartHistoryPollers', 5),
+        'trapper': ('StartTrappers', 5),
+        'pinger': ('StartPingers', 1),
+        'discovery worker': ('StartDiscoverers', 5),
+        'discoverer': ('StartDiscoverers', 5),
+        'history syncer': ('StartDBSyncers', 4),
+        'escalator': ('StartEscalators', 1),
+        'timer': ('StartTimers', 1),
+        'alerter': ('StartAlerters', 3),
+        'lld worker': ('StartLLDProcessors', 2),
+        'preprocessing worker': ('StartPreprocessors', 16),
+        'vmware collector': ('StartVMwareCollectors', 0),
+        'report writer': ('StartReportWriters', 0),
+        'connector worker': ('StartConnectors', 0),
+    }
+
+    RULES = (
+        'rule_vcache_hit_ratio',
+        'rule_cache_free',
+        'rule_process_busy',
+        'rule_memory',
+        'rule_swap',
+        'rule_cpu',
+    )
+
+    SEVERITY_ORDER = {'critical': 0, 'warning': 1, 'good': 2}
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.stats = archive.stats()
+        self.config = archive.config()
+        self.memory = archive.memory()
+        self.vmstat = archive.vmstat()
+        self.diaginfo = archive.diaginfo()
+
+    @staticmethod
+    def status(value, thresholds):
+        """Статус по возрастающему порогу, как utils.getStatus в веб-интерфейсе"""
+        if value >= thresholds['critical']:
+            return 'critical'
+        if value >= thresholds.get('warning', thresholds['critical']):
+            return 'warning'
+        return 'good'
+
+    @staticmethod
+    def finding(rule, severity, metric, value, message, **details):
+        result = {'rule': rule, 'severity': severity, 'metric': metric, 'value': value, 'message': message}
+        result.update(details)
+        return result
+
+    def stats_section(self, path):
+        """Вложенный словарь ответа zabbix.stats по пути вида 'wcache.history'"""
+        return StatsRateCalculator.section(self.stats, path)
+
+    @staticmethod
+    def number(value):
+        """Числовое значение метрики или None для строк, bool и прочих типов"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        return None
+
+    @classmethod
+    def average(cls, values):
+        values = [value for value in map(cls.number, values) if value is not None]
+        return sum(values) / len(values) if values else None
+
+    def rule_vcache_hit_ratio(self):
+        cache = self.stats_section('vcache.cache')
+        if not isinstance(cache, dict):
+            return []
+
+        findings = []
+        hits = self.number(cache.get('hits')) or 0
+        misses = self.number(cache.get('misses')) or 0
+        if hits + misses:
+            ratio = round(hits / (hits + misses) * 100, 2)
+            thresholds = self.THRESHOLDS['cache_hits']
+            if ratio < thresholds['critical']:
+                severity = 'critical'
+            elif ratio < thresholds['warning']:
+                severity = 'warning'
+            else:
+                severity = 'good'
+            findings.append(self.finding(
+                'vcache_hit_ratio', severity, 'vcache.cache.hits', ratio,
+                f"Попадания в value cache: {ratio}% (hits {hits}, misses {misses})"
+            ))
 
-                temp_config.write(config_content)
-                print(f"Создан временный конфиг: {self.temp_config_path}")
+        if cache.get('mode'):
+            findings.append(self.finding(
+                'vcache_hit_ratio', 'critical', 'vcache.cache.mode', cache['mode'],
+                "Value cache работает в режиме нехватки памяти, увеличьте ValueCacheSize"
+            ))
+        return findings
 
-            # Запускаем diaginfo
-            diaginfo_cmd = f"{binary_path} -c {self.temp_config_path} -R diaginfo"
-            success, _ = self.run_command(diaginfo_cmd, "1_diaginfo", timeout=60)
+    def rule_cache_free(self):
+        caches = (
+            ('rcache', 'CacheSize'),
+            ('wcache.history', 'HistoryCacheSize'),
+            ('wcache.index', 'HistoryIndexCacheSize'),
+            ('wcache.trend', 'TrendCacheSize'),
+            ('vcache.buffer', 'ValueCacheSize'),
+        )
+        thresholds = self.THRESHOLDS['cache_free']
+        findings = []
 
-            # Удаляем временный файл если не нужно сохранять
-            if not self.keep_temp_config and self.temp_config_path:
-                try:
-                    os.unlink(self.temp_config_path)
-                    print(f"Удален временный конфиг: {self.temp_config_path}")
-                except Exception as e:
-                    print(f"Не удалось удалить временный конфиг: {e}")
+        for metric, parameter in caches:
+            cache = self.stats_section(metric)
+            pfree = self.number((cache or {}).get('pfree'))
+            if pfree is None:
+                continue
+            pfree = round(pfree, 2)
+            if pfree < thresholds['critical']:
+                severity = 'critical'
+            elif pfree < thresholds['good']:
+                severity = 'warning'
             else:
-                print(f"Временный конфиг сохранен: {self.temp_config_path}")
+                severity = 'good'
+            message = f"{metric}: свободно {pfree}%"
+            if severity == 'critical':
+                message += f", увеличьте {parameter} (сейчас {self.config.get(parameter, 'по умолчанию')})"
+            findings.append(self.finding('cache_free', severity, f"{metric}.pfree", pfree, message))
+        return findings
 
-            return success
+    def rule_process_busy(self):
+        processes = (self.stats or {}).get('process')
+        if not isinstance(processes, dict):
+            return []
 
-        except Exception as e:
-            print(f"Ошибка создания временного конфига: {e}")
-            return False
+        limit = self.THRESHOLDS['process_busy']['critical']
+        findings = []
+        for name, data in sorted(processes.items()):
+            busy = StatsRateCalculator.lookup(data, 'busy.avg')
+            if busy is None or busy <= limit:
+                continue
 
-    def get_zabbix_trapper_port(self):
-        """Получение порта trapper'а из конфигурации"""
-        _, config_path = self.get_zabbix_paths()
-        default_port = 10051
+            busy = round(busy, 2)
+            count = self.number(data.get('count'))
+            message = f"{name}: занят {busy}%"
+            details = {'count': count}
+            if name in self.PROCESS_PARAMETERS:
+                parameter, default = self.PROCESS_PARAMETERS[name]
+                configured = self.config.get(parameter, default)
+                details['parameter'] = parameter
+                details['configured'] = configured
+                message += f", {parameter}={configured}"
+                if count:
+                    details['suggested'] = math.ceil(count * busy / limit)
+                    message += f", рекомендуется не менее {details['suggested']}"
+            findings.append(self.finding(
+                'process_busy', 'critical', f"process.{name}.busy.avg", busy, message, **details
+            ))
 
-        if not config_path or not os.path.exists(config_path):
-            print(f"Используем порт по умолчанию: {default_port}")
-            return default_port
+        if not findings:
+            findings.append(self.finding(
+                'process_busy', 'good', 'process.busy.avg', None,
+                f"Все процессы заняты не более чем на {limit}%"
+            ))
+        return findings
 
-        try:
-            with open(config_path, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('ListenPort='):
-                        port = int(line.split('=')[1])
-                        print(f"Найден порт в конфиге: {port}")
-                        return port
-        except Exception as e:
-            print(f"Ошибка чтения конфига для порта: {e}")
+    def rule_memory(self):
+        mem = (self.memory or {}).get('mem')
+        if not mem or not mem['total']:
+            return []
 
-        print(f"Используем порт по умолчанию: {default_port}")
-        return default_port
+        used = round((mem['total'] - mem['available']) / mem['total'] * 100, 2)
+        return [self.finding(
+            'memory', self.status(used, self.THRESHOLDS['memory']), 'memory.used', used,
+            f"Использовано памяти: {used}% (доступно {mem['available']} байт)"
+        )]
 
-    def create_zabbix_header(self, data_length):
-        """Создает заголовок Zabbix протокола"""
-        protocol = b"ZBXD"  # Сигнатура протокола
-        flags = 0x01  # Базовый флаг протокола Zabbix
-        reserved = 0
+    def rule_swap(self):
+        findings = []
 
-        # Упаковываем заголовок: протокол + флаги + длина данных + зарезервированное поле
-        import struct
-        header = protocol + struct.pack("<BII", flags, data_length, reserved)
-        return header
+        swap = (self.memory or {}).get('swap')
+        if swap and swap['total']:
+            used = round(swap['used'] / swap['total'] * 100, 2)
+            findings.append(self.finding(
+                'swap', self.status(used, self.THRESHOLDS['swap']), 'swap.used', used,
+                f"Использовано swap: {used}%"
+            ))
 
-    def create_stats_request(self):
-        """Создает JSON запрос для получения статистики Zabbix"""
-        import json
+        if self.vmstat and 'si' in self.vmstat and 'so' in self.vmstat:
+            pairs = [
+                (self.number(si) or 0, self.number(so) or 0)
+                for si, so in zip(self.vmstat['si'], self.vmstat['so'])
+            ]
+            active = sum(1 for si, so in pairs if si or so)
+            if pairs:
+                share = round(active / len(pairs) * 100, 2)
+                if not active:
+                    severity = 'good'
+                elif share >= self.THRESHOLDS['swap_activity']['critical']:
+                    severity = 'critical'
+                else:
+                    severity = 'warning'
+                findings.append(self.finding(
+                    'swap', severity, 'vmstat.si_so', share,
+                    f"Подкачка (si/so) в {active} из {len(pairs)} замеров, "
+                    f"в среднем si={self.average(si for si, _ in pairs):.1f} so={self.average(so for _, so in pairs):.1f}",
+                    si_max=max(si for si, _ in pairs), so_max=max(so for _, so in pairs)
+                ))
+        return findings
 
-        # Формируем JSON запрос для получения статистики
-        request_data = {
-            "request": "zabbix.stats"
-        }
+    def rule_cpu(self):
+        idle = self.average((self.vmstat or {}).get('id') or [])
+        if idle is None:
+            return []
 
-        # Конвертируем в JSON строку и затем в байты
-        json_data = json.dumps(request_data, separators=(',', ':'))
-        data_bytes = json_data.encode('utf-8')
+        usage = round(100 - idle, 2)
+        message = f"Загрузка CPU: {usage}%"
+        wait_avg = self.average(self.vmstat.get('wa') or [])
+        if wait_avg:
+            message += f", iowait {wait_avg:.1f}%"
+        return [self.finding('cpu', self.status(usage, self.THRESHOLDS['cpu']), 'vmstat.cpu', usage, message)]
 
-        # Создаем заголовок и объединяем с данными
-        header = self.create_zabbix_header(len(data_bytes))
-        packet = header + data_bytes
+    def run(self):
+        findings = []
+        for name in self.RULES:
+            findings.extend(getattr(self, name)())
+        findings.sort(key=lambda item: self.SEVERITY_ORDER[item['severity']])
+        return findings
 
-        return packet
 
-    def parse_zabbix_response(self, raw_response):
-        """Парсит ответ от Zabbix сервера"""
-        import struct
-        import json
+def analyze_archive(path):
+    """Анализ одного архива; выполняется в отдельном процессе пула"""
+    result = {'archive': str(path), 'hostname': Path(path).stem}
+    try:
+        archive = DiagnosticArchive(path).load()
+        result['hostname'] = archive.hostname
+        result['version'] = archive.version()
+        findings = HealthAnalyzer(archive).run()
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        result['error'] = str(e)
+        return result
+    except Exception as e:
+        # Поврежденный архив не должен прерывать анализ остальных
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
 
-        if len(raw_response) < 13:  # Минимальный размер заголовка
-            raise ValueError("Получен слишком короткий ответ")
+    result['findings'] = findings
+    result['summary'] = {
+        severity: sum(1 for item in findings if item['severity'] == severity)
+        for severity in HealthAnalyzer.SEVERITY_ORDER
+    }
+    return result
 
-        # Проверяем сигнатуру протокола
-        if raw_response[:4] != b"ZBXD":
-            raise ValueError("Некорректная сигнатура протокола")
 
-        # Извлекаем информацию из заголовка
-        flags = raw_response[4]
-        data_length, reserved = struct.unpack("<II", raw_response[5:13])
+def format_analysis_text(results):
+    """Текстовый отчет: проблемы каждого архива, сначала наиболее проблемные"""
+    lines = []
+    for result in results:
+        lines.append(f"=== {result['hostname']} ({result['archive']}) ===")
+        if 'error' in result:
+            lines.append(f"  Ошибка чтения архива: {result['error']}")
+            lines.append("")
+            continue
 
-        # Извлекаем JSON данные
-        json_data = raw_response[13:13 + data_length]
+        problems = [item for item in result['findings'] if item['severity'] != 'good']
+        for item in problems:
+            lines.append(f"  [{item['severity'].upper()}] {item['message']}")
+        if not problems:
+            lines.append("  Все проверки в норме")
 
-        # Парсим JSON
-        try:
-            response = json.loads(json_data.decode('utf-8'))
-            return response
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Ошибка парсинга JSON: {e}")
+        summary = result['summary']
+        lines.append(
+            f"  Итого: критических {summary['critical']}, предупреждений {summary['warning']}, "
+            f"в норме {summary['good']}"
+        )
+        lines.append("")
+    return "\n".join(lines)
 
-    def task_2_zabbix_stats(self):
-        """Задача 2: Сбор zabbix.stats через socket"""
-        import struct
 
-        port = self.get_zabbix_trapper_port()
+def run_analyze(args):
+    """Подкоманда analyze: анализ архивов в пуле процессов"""
+    paths = []
+    for pattern in args.archives:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches or [pattern])
 
-        try:
-            print(f"Подключаемся к localhost:{port} для получения статистики")
+    jobs = max(1, min(args.jobs, len(paths)))
+    if jobs == 1:
+        results = [analyze_archive(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(analyze_archive, paths, chunksize=max(1, len(paths) // (jobs * 4))))
 
-            # Создаем запрос
-            request_packet = self.create_stats_request()
+    results.sort(key=lambda result: (
+        'error' not in result,
+        -result.get('summary', {}).get('critical', 0),
+        -result.get('summary', {}).get('warning', 0),
+        result['hostname'],
+    ))
 
-            # Создаем socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.stats_timeout)
+    if args.format == 'json':
+        output = json.dumps({
+            'version': VERSION,
+            'analyzed': datetime.now().isoformat(),
+            'archives': results,
+        }, ensure_ascii=False, indent=1)
+    else:
+        output = format_analysis_text(results)
 
-            # Подключаемся
-            sock.connect(('localhost', port))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        print(f"Результат анализа сохранен в {args.output}")
+    else:
+        print(output)
 
-            print("Отправляем JSON запрос zabbix.stats...")
-            sock.sendall(request_packet)
-
-            print("Ожидание ответа...")
-            # Сначала читаем заголовок
-            header_data = sock.recv(13)
-            if len(header_data) < 13:
-                raise ValueError("Получен неполный заголовок")
-
-            # Извлекаем длину данных из заголовка
-            data_length = struct.unpack("<I", header_data[5:9])[0]
-
-            # Читаем данные
-            response_data = header_data
-            remaining = data_length
-            while remaining > 0:
-                chunk = sock.recv(min(remaining, 4096))
-                if not chunk:
-                    break
-                response_data += chunk
-                remaining -= len(chunk)
+    return not any('error' in result for result in results)
 
-            sock.close()
 
-            # Парсим ответ
-            try:
-                stats = self.parse_zabbix_response(response_data)
-                stats_text = f"Успешно получен JSON ответ:\n{stats}"
-            except Exception as e:
-                stats_text = f"Ошибка парсинга ответа: {e}\nСырые данные:\n{response_data}"
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-            # Сохраняем результат
-            output_file = self.output_dir / "2_zabbix_stats.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Zabbix Stats (JSON Protocol)\n")
-                f.write(f"# Дата выполнения: {datetime.now()}\n")
-                f.write(f"# Порт: {port}\n")
-                f.write(f"# Таймаут: {self.stats_timeout}\n\n")
-                f.write(stats_text)
 
-            print(f"Статистика сохранена в {output_file}")
-            return True
+def extract_archive_metrics(path):
+    """Метрики архива для индекса; выполняется в отдельном процессе пула"""
+    archive = DiagnosticArchive(path).load()
+    result = {
+        'path': str(Path(path).resolve()),
+        'host': archive.hostname,
+        'collected': archive.collected().isoformat(),
+        'collector_version': archive.version(),
+        'stats': [],
+        'diaginfo': [],
+        'vmstat': [],
+        'memory': None,
+    }
 
-        except socket.timeout:
-            print(f"Таймаут подключения к порту {port}")
-            return False
-        except Exception as e:
-            print(f"Ошибка получения статистики: {e}")
-            return False
+    stats = archive.stats()
+    if stats:
+        result['stats'] = list(ArchiveIndex.flatten(stats))
+        uptime = stats.get('uptime')
+        if uptime:
+            # Счетчики накапливаются с момента запуска, для сравнения полезна средняя скорость
+            for counter in StatsRateCalculator.COUNTERS:
+                value = StatsRateCalculator.lookup(stats, counter)
+                if value is not None:
+                    result['stats'].append((f"rate.{counter}", value / uptime))
 
-    def task_3_ps_aux(self):
-        """Задача 3: Сбор ps aux | grep zabbix_server"""
-        return self.run_command("ps aux | grep zabbix_server", "3_ps_aux")
+    for section, data in (archive.diaginfo() or {}).items():
+        for metric, value in ArchiveIndex.flatten({key: data.get(key) for key in ('summary', 'memory')}):
+            if '.buckets.' not in metric:
+                result['diaginfo'].append((section, metric.split('.', 1)[1], value))
 
-    def task_4_free(self):
-        """Задача 4: Сбор free"""
-        return self.run_command("free -b", "4_free")
+    for name, values in (archive.vmstat() or {}).items():
+        values = [value for value in values if isinstance(value, (int, float))]
+        if name != 't' and values:
+            result['vmstat'].append((name, len(values), sum(values) / len(values), min(values), max(values)))
 
-    def task_5_vmstat(self):
-        """Задача 5: Сбор vmstat 1 30"""
-        return self.run_command("vmstat 1 30", "5_vmstat", timeout=35)
+    memory = archive.memory()
+    if memory:
+        mem = memory.get('mem', {})
+        swap = memory.get('swap', {})
+        result['memory'] = tuple(mem.get(key) for key in ArchiveIndex.MEMORY_FIELDS) + \
+            tuple(swap.get(key) for key in ArchiveIndex.SWAP_FIELDS)
 
-    def task_6_zabbix_config(self):
-        """Задача 6: Сбор конфигурации zabbix_server"""
-        _, config_path = self.get_zabbix_paths()
+    return result
 
-        if not config_path or not os.path.exists(config_path):
-            print(f"Конфиг-файл не найден: {config_path}")
-            return False
 
-        try:
-            # Чувствительные параметры, которые нужно исключить
-            sensitive_params = {
-                'DBUser', 'DBPassword', 'DBName', 'DBHost', 'StatsAllowedIP',
-                'VaultURL', 'VaultToken'
-            }
+class ArchiveIndex:
+    """Локальный индекс архивов в SQLite для сравнения запусков без чтения zip
 
-            filtered_config = []
+    Архив определяется по SHA-256 содержимого, поэтому повторная загрузка
+    того же файла (в том числе переименованного) пропускается. Метрики
+    хранятся в типизированных таблицах stats, diaginfo, vmstat и memory и
+    адресуются именами вида stats.vcache.cache.misses, diaginfo.valuecache.Items,
+    vmstat.si.avg, memory.mem_available.
+    """
 
-            with open(config_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
+    MEMORY_FIELDS = ('total', 'used', 'free', 'shared', 'buff_cache', 'available')
+    SWAP_FIELDS = ('total', 'used', 'free')
+    MEMORY_COLUMNS = tuple(f"mem_{field}" for field in MEMORY_FIELDS) + \
+        tuple(f"swap_{field}" for field in SWAP_FIELDS)
+    VMSTAT_AGGREGATES = ('avg', 'min', 'max')
 
-                    # Пропускаем пустые строки и комментарии
-                    if not line or line.startswith('#'):
-                        continue
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS archives (
+            id INTEGER PRIMARY KEY,
+            sha256 TEXT NOT NULL UNIQUE,
+            path TEXT NOT NULL,
+            host TEXT NOT NULL,
+            collected TEXT NOT NULL,
+            collector_version TEXT,
+            ingested TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS archives_host ON archives (host, collected);
+        CREATE TABLE IF NOT EXISTS stats (
+            archive_id INTEGER NOT NULL REFERENCES archives (id) ON DELETE CASCADE,
+            metric TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (metric, archive_id)
+        );
+        CREATE TABLE IF NOT EXISTS diaginfo (
+            archive_id INTEGER NOT NULL REFERENCES archives (id) ON DELETE CASCADE,
+            section TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (section, metric, archive_id)
+        );
+        CREATE TABLE IF NOT EXISTS vmstat (
+            archive_id INTEGER NOT NULL REFERENCES archives (id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            avg REAL,
+            min REAL,
+            max REAL,
+            PRIMARY KEY (name, archive_id)
+        );
+        CREATE TABLE IF NOT EXISTS memory (
+            archive_id INTEGER PRIMARY KEY REFERENCES archives (id) ON DELETE CASCADE,
+            {', '.join(f'{column} INTEGER' for column in MEMORY_COLUMNS)}
+        );
+    """
 
-                    # Проверяем чувствительные параметры
-                    is_sensitive = False
-                    for param in sensitive_params:
-                        if line.startswith(f"{param}="):
-                            is_sensitive = True
-                            break
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(self.SCHEMA)
 
-                    if not is_sensitive:
-                        filtered_config.append(line)
+    def close(self):
+        self.conn.close()
 
-            # Сохраняем отфильтрованный конфиг
-            output_file = self.output_dir / "6_zabbix_config.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Zabbix Server Configuration (filtered)\n")
-                f.write(f"# Дата выполнения: {datetime.now()}\n")
-                f.write(f"# Исходный файл: {config_path}\n")
-                f.write(f"# Исключены чувствительные параметры: {', '.join(sensitive_params)}\n\n")
+    def __enter__(self):
+        return self
 
-                for line in filtered_config:
-                    f.write(line + '\n')
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-            print(f"Конфигурация сохранена в {output_file}")
-            print(f"Обработано строк: {len(filtered_config)}")
-            return True
+    @staticmethod
+    def flatten(data, prefix=''):
+        """Числовые листья вложенного словаря с путями через точку"""
+        for key, value in data.items():
+            path = f"{prefix}{key}"
+            if isinstance(value, dict):
+                yield from ArchiveIndex.flatten(value, f"{path}.")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield path, value
 
-        except Exception as e:
-            print(f"Ошибка обработки конфига: {e}")
-            return False
+    def known_hashes(self):
+        return {row[0] for row in self.conn.execute("SELECT sha256 FROM archives")}
 
-    def task_7_os_release(self):
-        """Задача 7: Сбор cat /etc/os-release"""
-        return self.run_command("cat /etc/os-release", "7_os_release")
+    def ingest(self, paths, jobs=DEFAULT_ANALYZE_JOBS):
+        """Загрузка новых архивов; возвращает (добавлено, пропущено, ошибки)"""
+        known = self.known_hashes()
+        pending = {}
+        skipped = 0
+        errors = []
 
-    def task_8_uptime(self):
-        """Задача 8: Сбор uptime"""
-        return self.run_command("uptime", "8_uptime")
+        for path in paths:
+            try:
+                digest = file_sha256(path)
+            except OSError as e:
+                errors.append((path, str(e)))
+                continue
+            if digest in known or digest in pending:
+                skipped += 1
+                continue
+            pending[digest] = path
 
-    def task_9_nproc(self):
-        """Задача 9: Сбор nproc"""
-        return self.run_command("nproc", "9_nproc")
+        if not pending:
+            return 0, skipped, errors
 
-    def task_10_cpuinfo(self):
-        """Задача 10: Сбор информации о процессоре"""
-        return self.run_command("cat /proc/cpuinfo", "10_cpuinfo")
+        jobs = max(1, min(jobs, len(pending)))
+        items = list(pending.items())
+        if jobs == 1:
+            results = map(self.safe_extract, items)
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            results = executor.map(self.safe_extract, items)
 
-    def task_final(self):
-        """Финальная задача: Запись времени завершения"""
+        added = 0
+        ingested = datetime.now().isoformat()
         try:
-            output_file = self.output_dir / "final.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Время завершения сбора диагностических данных\n")
-                f.write(f"# Дата и время: {datetime.now()}\n\n")
-                f.write(datetime.now().isoformat())
-            
-            print(f"Время завершения записано в {output_file}")
-            return True
-        
-        except Exception as e:
-            print(f"Ошибка записи времени завершения: {e}")
-            return False
+            with self.conn:
+                for digest, path, result, error in results:
+                    if error:
+                        errors.append((path, error))
+                        continue
+                    self.insert(digest, result, ingested)
+                    added += 1
+        finally:
+            if jobs > 1:
+                executor.shutdown()
+        return added, skipped, errors
 
-    def create_zip_archive(self):
-        """Создание zip-архива с именем HOSTNAME.zip"""
+    @staticmethod
+    def safe_extract(item):
+        digest, path = item
         try:
-            # Получаем hostname
-            result = subprocess.run(['hostname'], capture_output=True, text=True)
-            hostname = result.stdout.strip()
+            return digest, path, extract_archive_metrics(path), None
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            return digest, path, None, str(e)
+        except Exception as e:
+            # Поврежденный архив записывается в ошибки, загрузка остальных продолжается
+            return digest, path, None, f"{type(e).__name__}: {e}"
 
-            if not hostname:
-                hostname = "unknown"
+    @staticmethod
+    def parse_collected(value):
+        """Время сбора из колонки collected (isoformat с микросекундами или без)"""
+        for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        return None
 
-            zip_filename = f"{hostname}.zip"
-            zip_path = Path("/tmp") / zip_filename
+    def insert(self, digest, result, ingested):
+        cursor = self.conn.execute(
+            "INSERT INTO archives (sha256, path, host, collected, collector_version, ingested) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (digest, result['path'], result['host'], result['collected'], result['collector_version'], ingested)
+        )
+        archive_id = cursor.lastrowid
 
-            if os.path.exists(zip_path):
-                os.unlink(zip_path)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO stats (archive_id, metric, value) VALUES (?, ?, ?)",
+            ((archive_id, metric, value) for metric, value in result['stats'])
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO diaginfo (archive_id, section, metric, value) VALUES (?, ?, ?, ?)",
+            ((archive_id,) + row for row in result['diaginfo'])
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO vmstat (archive_id, name, samples, avg, min, max) VALUES (?, ?, ?, ?, ?, ?)",
+            ((archive_id,) + tuple(row) for row in result['vmstat'])
+        )
+        if result['memory']:
+            self.conn.execute(
+                f"INSERT INTO memory (archive_id, {', '.join(self.MEMORY_COLUMNS)}) "
+                f"VALUES (?{', ?' * len(self.MEMORY_COLUMNS)})",
+                (archive_id,) + tuple(result['memory'])
+            )
 
-            print(f"Создаем архив: {zip_path}")
+    def metric_query(self, metric):
+        """SQL-выражение и параметры для метрики вида <источник>.<имя>"""
+        source, _, name = metric.partition('.')
+        if source == 'stats' and name:
+            return "SELECT archive_id, value FROM stats WHERE metric = ?", (name,)
+        if source == 'diaginfo' and '.' in name:
+            section, _, name = name.partition('.')
+            return "SELECT archive_id, value FROM diaginfo WHERE section = ? AND metric = ?", (section, name)
+        if source == 'vmstat' and '.' in name:
+            column, _, aggregate = name.rpartition('.')
+            if aggregate in self.VMSTAT_AGGREGATES:
+                return f"SELECT archive_id, {aggregate} AS value FROM vmstat WHERE name = ?", (column,)
+        if source == 'memory' and name in self.MEMORY_COLUMNS:
+            return f"SELECT archive_id, {name} AS value FROM memory", ()
+        raise ValueError(
+            f"Неизвестная метрика: {metric} (ожидается stats.<путь>, diaginfo.<секция>.<путь>, "
+            f"vmstat.<колонка>.avg|min|max или memory.<{'|'.join(self.MEMORY_COLUMNS)}>)"
+        )
 
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in self.output_dir.rglob('*.txt'):
-                    arcname = file_path.relative_to(self.output_dir.parent)
-                    zipf.write(file_path, arcname)
-                    print(f"Добавлен в архив: {file_path}")
+    def series(self, metric, host=None):
+        """Значения метрики по хостам: {host: [(collected, value), ...]} по времени"""
+        query, params = self.metric_query(metric)
+        sql = (f"SELECT a.host, a.collected, m.value FROM ({query}) m "
+               "JOIN archives a ON a.id = m.archive_id")
+        if host:
+            sql += " WHERE a.host = ?"
+            params += (host,)
+        sql += " ORDER BY a.host, a.collected"
 
-            print(f"Архив создан: {zip_path}")
-            return True, zip_path
+        series = {}
+        for row_host, collected, value in self.conn.execute(sql, params):
+            series.setdefault(row_host, []).append((collected, value))
+        return series
 
-        except Exception as e:
-            print(f"Ошибка создания архива: {e}")
-            return False, None
+    def diff(self, metric, ratio=2.0, days=None, host=None):
+        """Хосты, у которых метрика изменилась не менее чем в ratio раз
 
-    def task_0_version(self):
-        """Задача 0: Запись версии скрипта"""
-        try:
-            output_file = self.output_dir / "0_version.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"# Версия скрипта zdiag.py\n")
-                f.write(f"# Дата выполнения: {datetime.now()}\n\n")
-                f.write(VERSION)
-            
-            print(f"Версия сохранена в {output_file}")
-            return True
-        
-        except Exception as e:
-            print(f"Ошибка записи версии: {e}")
-            return False
+        Последний архив хоста сравнивается с предыдущим или, если задан days,
+        с последним архивом, собранным не позднее чем за days дней до него.
+        При ratio < 1 ищется снижение.
+        """
+        rows = []
+        for row_host, points in self.series(metric, host).items():
+            collected, value = points[-1]
+            base = None
+            if days is None:
+                base = points[-2] if len(points) > 1 else None
+            else:
+                latest = self.parse_collected(collected)
+                if latest is None:
+                    continue
+                limit = latest - timedelta(days=days)
+                earlier = [point for point in points[:-1]
+                           if (self.parse_collected(point[0]) or datetime.max) <= limit]
+                base = earlier[-1] if earlier else None
+            if base is None or value is None or base[1] is None:
+                continue
 
-    def run_all_tasks(self):
-        """Выполнение всех задач"""
-        print("=== Начинаем сбор диагностической информации Zabbix ===")
+            base_collected, base_value = base
+            if base_value:
+                change = value / base_value
+            else:
+                change = float('inf') if value else 1.0
+            if (ratio >= 1 and change >= ratio) or (ratio < 1 and change <= ratio):
+                rows.append({
+                    'host': row_host,
+                    'base_collected': base_collected,
+                    'base_value': base_value,
+                    'collected': collected,
+                    'value': value,
+                    'ratio': round(change, 4) if change != float('inf') else None,
+                })
+        rows.sort(key=lambda row: -(row['ratio'] if row['ratio'] is not None else float('inf')))
+        return rows
 
-        # Подготовка
-        self.setup_output_directory()
-
-        # Выполняем все задачи
-        tasks = [
-            ("0. Version", self.task_0_version),
-            ("1. Diaginfo", self.task_1_diaginfo),
-            ("2. Zabbix Stats", self.task_2_zabbix_stats),
-            ("3. PS AUX", self.task_3_ps_aux),
-            ("4. Free", self.task_4_free),
-            ("5. VMStat", self.task_5_vmstat),
-            ("6. Zabbix Config", self.task_6_zabbix_config),
-            ("7. OS Release", self.task_7_os_release),
-            ("8. Uptime", self.task_8_uptime),
-            ("9. Nproc", self.task_9_nproc),
-            ("10. CPU Info", self.task_10_cpuinfo),
-            ("Final", self.task_final),
-        ]
 
-        results = []
-        for task_name, task_func in tasks:
-            print(f"\n--- Выполняем задачу: {task_name} ---")
-            try:
-                success = task_func()
-                results.append((task_name, success))
-                status = "✓" if success else "✗"
-                print(f"{status} {task_name}: {'успешно' if success else 'ошибка'}")
-            except Exception as e:
-                print(f"✗ {task_name}: исключение - {e}")
-                results.append((task_name, False))
+def format_index_table(headers, rows):
+    """Простая текстовая таблица с выравниванием по ширине колонок"""
+    rows = [["" if value is None else (f"{value:g}" if isinstance(value, float) else str(value))
+             for value in row] for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = ["  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip()
+             for row in [headers] + rows]
+    return "\n".join(lines)
 
-        # Создаем архив
-        print(f"\n--- Создание архива ---")
-        archive_success, archive_path = self.create_zip_archive()
 
-        # Итоговый отчет
-        print(f"\n=== Итоговый отчет ===")
-        for task_name, success in results:
-            status = "✓" if success else "✗"
-            print(f"{status} {task_name}")
+def run_index(args):
+    """Подкоманда index: загрузка архивов и запросы diff/trend"""
+    with ArchiveIndex(args.db) as index:
+        if args.index_command == 'ingest':
+            paths = []
+            for pattern in args.archives:
+                paths.extend(sorted(glob.glob(pattern)) or [pattern])
+            added, skipped, errors = index.ingest(paths, jobs=args.jobs)
+            for path, error in errors:
+                print(f"Ошибка загрузки {path}: {error}")
+            print(f"Добавлено: {added}, пропущено (уже в индексе): {skipped}, ошибок: {len(errors)}")
+            return not errors
 
-        if archive_success:
-            print(f"✓ Архив создан: {archive_path}")
+        try:
+            if args.index_command == 'diff':
+                rows = index.diff(args.metric, ratio=args.ratio, days=args.days, host=args.host)
+                records = rows
+                headers = ['host', 'base_collected', 'base_value', 'collected', 'value', 'ratio']
+                table = [[row[key] for key in headers] for row in rows]
+            else:
+                series = index.series(args.metric, host=args.host)
+                records = [{'host': host, 'collected': collected, 'value': value}
+                           for host, points in series.items()
+                           for collected, value in points[-args.limit:]]
+                headers = ['host', 'collected', 'value']
+                table = [[row[key] for key in headers] for row in records]
+        except ValueError as e:
+            print(e)
+            return False
+
+        if args.format == 'json':
+            print(json.dumps({'metric': args.metric, 'rows': records}, ensure_ascii=False, indent=1))
+        elif table:
+            print(format_index_table(headers, table))
         else:
-            print(f"✗ Ошибка создания архива")
+            print("Нет данных")
+        return True
+
 
-        print(f"\nДанные собраны в: {self.output_dir}")
+def parse_diaginfo_sections(value):
+    """Список секций для --diaginfo-sections; full - полный diaginfo одной командой"""
+    if value.strip() == 'full':
+        return ()
+    sections = tuple(part.strip() for part in value.split(',') if part.strip())
+    unknown = [section for section in sections if section not in DIAGINFO_SECTIONS]
+    if unknown or not sections:
+        raise argparse.ArgumentTypeError(
+            f"неизвестные секции: {', '.join(unknown) or value} (допустимы: {', '.join(DIAGINFO_SECTIONS)}, full)"
+        )
+    return sections
 
 
 def main():
@@ -497,7 +4974,7 @@ def main():
     parser.add_argument(
         '--output-dir',
         default='/tmp/zabbix-diag',
-        help='Директория для вывода (по умолчанию: /tmp/zabbix-diag)'
+        help='Директория для вывода, также имя каталога внутри архива (по умолчанию: /tmp/zabbix-diag)'
     )
     parser.add_argument(
         '--keep-temp-config',
@@ -505,24 +4982,396 @@ def main():
         help='Не удалять временный конфиг-файл',
         default=False
     )
+    parser.add_argument(
+        '--keep-output-dir',
+        action='store_true',
+        help='Сохранить копии файлов в выходной директории (по умолчанию пишется только архив)',
+        default=False
+    )
+    parser.add_argument(
+        '--compression',
+        choices=sorted(name for name, method in COMPRESSION_METHODS.items() if method is not None),
+        default=DEFAULT_COMPRESSION,
+        help=f'Метод сжатия архива (по умолчанию: {DEFAULT_COMPRESSION}); '
+             'веб-интерфейс читает только deflate и store'
+    )
+    parser.add_argument(
+        '--compression-level',
+        type=int,
+        default=None,
+        help='Уровень сжатия архива (deflate: 0-9, bzip2: 1-9)'
+    )
     parser.add_argument(
         '--stats-timeout',
         type=int,
         default=60,
         help='Таймаут для получения статистики в секундах (по умолчанию: 60)'
     )
+    parser.add_argument(
+        '--stats-host',
+        default=None,
+        help='Адрес trapper\'а для zabbix.stats (по умолчанию: первый ListenIP из конфига или localhost)'
+    )
+    parser.add_argument(
+        '--watch',
+        type=float,
+        default=None,
+        metavar='DURATION',
+        help='Режим наблюдения: серия замеров zabbix.stats в течение DURATION секунд '
+             f'(по умолчанию выключен, в профиле deep: {COLLECTION_PROFILES["deep"]["watch_duration"]})'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=DEFAULT_WATCH_INTERVAL,
+        metavar='SECS',
+        help=f'Интервал между замерами в режиме наблюдения (по умолчанию: {DEFAULT_WATCH_INTERVAL})'
+    )
+    parser.add_argument(
+        '--probe-count',
+        type=int,
+        metavar='N',
+        help=f'Запросов zabbix.stats для замера задержек в каждом режиме соединения '
+             f'(по умолчанию: по профилю, {DEFAULT_PROBE_COUNT})'
+    )
+    parser.add_argument(
+        '--probe-interval',
+        type=float,
+        default=DEFAULT_PROBE_INTERVAL,
+        metavar='SECS',
+        help=f'Пауза между запросами замера задержек (по умолчанию: {DEFAULT_PROBE_INTERVAL})'
+    )
+    parser.add_argument(
+        '--probe-db',
+        choices=('off', 'auto', 'mysql', 'postgresql'),
+        default='off',
+        help='Замер задержки БД запросом SELECT 1 с параметрами DB* из конфигурации zabbix_server; '
+             'нужен драйвер MySQLdb/pymysql или psycopg2/psycopg (по умолчанию: off)'
+    )
+    parser.add_argument(
+        '--diaginfo-sections',
+        type=parse_diaginfo_sections,
+        default=DIAGINFO_SECTIONS,
+        metavar='LIST',
+        help='Секции diaginfo через запятую в порядке запуска или full - один полный -R diaginfo '
+             f'(по умолчанию: {",".join(DIAGINFO_SECTIONS)})'
+    )
+    parser.add_argument(
+        '--diaginfo-jobs',
+        type=int,
+        metavar='N',
+        help='Количество одновременно снимаемых секций diaginfo, 1 - по очереди (по умолчанию: все сразу)'
+    )
+    parser.add_argument(
+        '--diaginfo-timeout',
+        type=float,
+        default=DEFAULT_DIAGINFO_TIMEOUT,
+        help=f'Таймаут на одну секцию diaginfo в секундах (по умолчанию: {DEFAULT_DIAGINFO_TIMEOUT})'
+    )
+    parser.add_argument(
+        '--watch-diaginfo-every',
+        type=int,
+        default=0,
+        metavar='N',
+        help='В режиме наблюдения снимать diaginfo на каждом N-м замере (по умолчанию: не снимать)'
+    )
+    parser.add_argument(
+        '--sample-interval',
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL,
+        help=f'Интервал сбора системных метрик в секундах, например 0.1 (по умолчанию: {DEFAULT_SAMPLE_INTERVAL})'
+    )
+    parser.add_argument(
+        '--sample-duration',
+        type=float,
+        default=None,
+        help=f'Длительность сбора системных метрик в секундах (по умолчанию: {DEFAULT_SAMPLE_DURATION}, '
+             f'в профиле light: {COLLECTION_PROFILES["light"]["sample_duration"]})'
+    )
+    parser.add_argument(
+        '--worker-samples',
+        type=int,
+        default=None,
+        help=f'Количество замеров нагрузки процессов zabbix_server (по умолчанию: {DEFAULT_WORKER_SAMPLES}, '
+             f'в профиле light: {COLLECTION_PROFILES["light"]["worker_samples"]})'
+    )
+    parser.add_argument(
+        '--worker-interval',
+        type=float,
+        default=DEFAULT_WORKER_INTERVAL,
+        help=f'Интервал замеров процессов zabbix_server в секундах (по умолчанию: {DEFAULT_WORKER_INTERVAL})'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=tuple(COLLECTION_PROFILES),
+        default=DEFAULT_PROFILE,
+        help=f'Профиль сбора (по умолчанию: {DEFAULT_PROFILE}); light - минимальная нагрузка для '
+             'загруженных серверов и cron, deep - длительные замеры и режим наблюдения'
+    )
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        default=None,
+        metavar='SECS',
+        help='Общий бюджет времени сбора; задачи, которые в него не укладываются, пропускаются'
+    )
+    parser.add_argument(
+        '--nice',
+        type=int,
+        default=None,
+        help='Приращение nice для сборщика и запускаемых команд (по умолчанию задается профилем)'
+    )
+    parser.add_argument(
+        '--ionice',
+        choices=tuple(IONICE_CLASSES),
+        default=None,
+        help='Класс приоритета ввода-вывода (по умолчанию задается профилем)'
+    )
+    parser.add_argument(
+        '--profile-collector',
+        action='store_true',
+        default=False,
+        help='Профилировать сборщик через cProfile (collector_profile.pstats и .txt в архиве)'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f'Количество параллельно выполняемых задач (по умолчанию: {DEFAULT_JOBS})'
+    )
+    parser.add_argument(
+        '--serial',
+        action='store_true',
+        help='Выполнять задачи последовательно (аналогично --jobs 1)',
+        default=False
+    )
+    parser.add_argument(
+        '--since',
+        metavar='ARCHIVE',
+        help='Инкрементальный сбор: не сохранять редко меняющиеся файлы (конфигурация, os-release, '
+             'nproc, cpuinfo), не изменившиеся с указанного архива, а ссылаться на него в manifest.json; '
+             'новый архив создается рядом с ним под именем HOSTNAME-ДАТА.zip'
+    )
+    parser.add_argument(
+        '--exporter',
+        action='store_true',
+        default=False,
+        help='Экспорт zabbix.stats для Prometheus: HTTP-сервер с /metrics на адресе --exporter-listen'
+    )
+    parser.add_argument(
+        '--exporter-listen',
+        default=DEFAULT_EXPORTER_LISTEN,
+        metavar='HOST:PORT',
+        help=f'Адрес HTTP-сервера экспорта (по умолчанию: {DEFAULT_EXPORTER_LISTEN})'
+    )
+    parser.add_argument(
+        '--exporter-ttl',
+        type=float,
+        default=DEFAULT_EXPORTER_TTL,
+        help=f'Время жизни закэшированного ответа zabbix.stats в секундах (по умолчанию: {DEFAULT_EXPORTER_TTL})'
+    )
+    parser.add_argument(
+        '--textfile',
+        metavar='PATH',
+        help='Файл метрик для textfile collector node_exporter (*.prom); без --exporter записывается '
+             'один раз, с --exporter - после каждого обновления'
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        default=False,
+        help='Режим демона: непрерывные замеры с интервалом --interval в кольцевой буфер '
+             'и выгрузка архива по условиям --trigger или сигналу SIGUSR1'
+    )
+    parser.add_argument(
+        '--daemon-window',
+        type=float,
+        default=DEFAULT_DAEMON_WINDOW,
+        metavar='SECS',
+        help=f'Сколько последних секунд хранить в буфере и выгружать (по умолчанию: {DEFAULT_DAEMON_WINDOW})'
+    )
+    parser.add_argument(
+        '--trigger',
+        action='append',
+        default=[],
+        metavar='EXPR',
+        help='Условие выгрузки, например preprocessing_queue>1000, vcache.buffer.pfree<20, '
+             'rate.vcache.cache.misses>500, system.wa>30 (можно указать несколько)'
+    )
+    parser.add_argument(
+        '--daemon-cooldown',
+        type=float,
+        default=DEFAULT_DAEMON_COOLDOWN,
+        metavar='SECS',
+        help=f'Минимальная пауза между выгрузками по условиям (по умолчанию: {DEFAULT_DAEMON_COOLDOWN})'
+    )
+    parser.add_argument(
+        '--daemon-dir',
+        default=DEFAULT_DAEMON_DIR,
+        help=f'Директория для выгрузок (по умолчанию: {DEFAULT_DAEMON_DIR})'
+    )
+    parser.add_argument(
+        '--daemon-max-dumps',
+        type=int,
+        default=DEFAULT_DAEMON_MAX_DUMPS,
+        help=f'Сколько последних выгрузок хранить, 0 - все (по умолчанию: {DEFAULT_DAEMON_MAX_DUMPS})'
+    )
+    parser.add_argument(
+        '--fleet',
+        action='append',
+        metavar='HOST[:PORT],...',
+        help='Опросить zabbix.stats у перечисленных trapper\'ов вместо локального сбора'
+    )
+    parser.add_argument(
+        '--fleet-file',
+        help='Файл со списком trapper\'ов для опроса (по одному HOST[:PORT] в строке)'
+    )
+    parser.add_argument(
+        '--fleet-concurrency',
+        type=int,
+        default=DEFAULT_FLEET_CONCURRENCY,
+        help=f'Количество одновременных подключений при опросе (по умолчанию: {DEFAULT_FLEET_CONCURRENCY})'
+    )
+    parser.add_argument(
+        '--fleet-retries',
+        type=int,
+        default=DEFAULT_FLEET_RETRIES,
+        help=f'Количество повторных попыток для узла (по умолчанию: {DEFAULT_FLEET_RETRIES})'
+    )
+    parser.add_argument(
+        '--fleet-archive',
+        help='Путь к архиву с результатами опроса (по умолчанию: /tmp/fleet-<дата>.zip)'
+    )
     parser.add_argument(
         '--version',
         action='store_true',
         help='Вывести версию скрипта'
     )
 
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    analyze_parser = subparsers.add_parser(
+        'analyze',
+        help='Анализ собранных архивов без веб-интерфейса'
+    )
+    analyze_parser.add_argument(
+        'archives',
+        nargs='+',
+        metavar='ARCHIVE',
+        help='Архивы <hostname>.zip или маски, например /data/*.zip'
+    )
+    analyze_parser.add_argument(
+        '--format',
+        choices=('text', 'json'),
+        default='text',
+        help='Формат отчета (по умолчанию: text)'
+    )
+    analyze_parser.add_argument(
+        '--output',
+        help='Файл для отчета (по умолчанию: стандартный вывод)'
+    )
+    analyze_parser.add_argument(
+        '--jobs',
+        type=int,
+        default=DEFAULT_ANALYZE_JOBS,
+        help=f'Количество процессов для анализа (по умолчанию: {DEFAULT_ANALYZE_JOBS})'
+    )
+
+    index_parser = subparsers.add_parser(
+        'index',
+        help='Индекс архивов в SQLite для сравнения запусков'
+    )
+    index_parser.add_argument(
+        '--db',
+        default=DEFAULT_INDEX_DB,
+        help=f'Файл индекса (по умолчанию: {DEFAULT_INDEX_DB})'
+    )
+    index_commands = index_parser.add_subparsers(dest='index_command', metavar='COMMAND')
+    index_commands.required = True
+    ingest_parser = index_commands.add_parser('ingest', help='Добавить архивы в индекс')
+    ingest_parser.add_argument(
+        'archives',
+        nargs='+',
+        metavar='ARCHIVE',
+        help='Архивы <hostname>.zip или маски; уже загруженные архивы пропускаются'
+    )
+    ingest_parser.add_argument(
+        '--jobs',
+        type=int,
+        default=DEFAULT_ANALYZE_JOBS,
+        help=f'Количество процессов для разбора архивов (по умолчанию: {DEFAULT_ANALYZE_JOBS})'
+    )
+    for name, help_text in (('diff', 'Хосты, у которых метрика изменилась в заданное число раз'),
+                            ('trend', 'Значения метрики по времени')):
+        query_parser = index_commands.add_parser(name, help=help_text)
+        query_parser.add_argument(
+            'metric',
+            help='Метрика, например stats.vcache.cache.misses, stats.rate.vcache.cache.misses, '
+                 'diaginfo.valuecache.Items, vmstat.si.avg, memory.mem_available'
+        )
+        query_parser.add_argument('--host', help='Только указанный хост')
+        query_parser.add_argument(
+            '--format',
+            choices=('text', 'json'),
+            default='text',
+            help='Формат вывода (по умолчанию: text)'
+        )
+        if name == 'diff':
+            query_parser.add_argument(
+                '--ratio',
+                type=float,
+                default=2.0,
+                help='Во сколько раз должна измениться метрика; меньше 1 - снижение (по умолчанию: 2)'
+            )
+            query_parser.add_argument(
+                '--days',
+                type=float,
+                help='Сравнивать с архивом, собранным не позднее чем за DAYS дней (по умолчанию: с предыдущим)'
+            )
+        else:
+            query_parser.add_argument(
+                '--limit',
+                type=int,
+                default=30,
+                help='Количество последних значений по каждому хосту (по умолчанию: 30)'
+            )
+
     args = parser.parse_args()
 
     if args.version:
         print(VERSION)
         sys.exit(0)
 
+    if args.command == 'analyze':
+        sys.exit(0 if run_analyze(args) else 1)
+
+    if args.command == 'index':
+        sys.exit(0 if run_index(args) else 1)
+
+    if args.fleet or args.fleet_file:
+        diag = ZabbixDiagnostic(
+            stats_timeout=args.stats_timeout,
+            compression=args.compression,
+            compression_level=args.compression_level
+        )
+        try:
+            endpoints = FleetCollector.load_endpoints(args.fleet, args.fleet_file)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения списка узлов: {e}")
+            sys.exit(1)
+        fleet = FleetCollector(
+            diag, endpoints,
+            concurrency=args.fleet_concurrency,
+            retries=args.fleet_retries
+        )
+        sys.exit(0 if fleet.run(args.fleet_archive) else 1)
+
+    if args.since and (args.daemon or args.exporter or args.textfile):
+        print("--since применяется только к разовому сбору, не к режиму демона и экспорту метрик")
+        sys.exit(1)
+    if args.since and not os.path.isfile(args.since):
+        print(f"Базовый архив не найден: {args.since}")
+        sys.exit(1)
+
     # Проверяем права root
     if os.geteuid() != 0:
         print("Внимание: скрипт запущен не от root. Некоторые команды могут не работать.")
@@ -531,9 +5380,60 @@ def main():
     diag = ZabbixDiagnostic(
         output_dir=args.output_dir,
         keep_temp_config=args.keep_temp_config,
-        stats_timeout=args.stats_timeout
+        stats_timeout=args.stats_timeout,
+        stats_host=args.stats_host,
+        jobs=args.jobs,
+        serial=args.serial,
+        sample_interval=args.sample_interval,
+        sample_duration=args.sample_duration,
+        worker_samples=args.worker_samples,
+        worker_interval=args.worker_interval,
+        watch_duration=args.watch,
+        watch_interval=args.interval,
+        watch_diaginfo_every=args.watch_diaginfo_every,
+        compression=args.compression,
+        compression_level=args.compression_level,
+        keep_output_dir=args.keep_output_dir,
+        profile=args.profile,
+        time_budget=args.time_budget,
+        nice=args.nice,
+        ionice=args.ionice,
+        profile_collector=args.profile_collector,
+        diaginfo_sections=args.diaginfo_sections,
+        diaginfo_jobs=args.diaginfo_jobs,
+        diaginfo_timeout=args.diaginfo_timeout,
+        probe_count=args.probe_count,
+        probe_interval=args.probe_interval,
+        probe_db=args.probe_db,
+        since=args.since
     )
 
+    if args.exporter or args.textfile:
+        exporter = PrometheusExporter(diag, listen=args.exporter_listen, ttl=args.exporter_ttl, textfile=args.textfile)
+        if not args.exporter:
+            sys.exit(0 if exporter.write_once() else 1)
+        try:
+            sys.exit(0 if exporter.run() else 1)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка запуска экспорта метрик: {e}")
+            sys.exit(1)
+
+    if args.daemon:
+        try:
+            daemon = DiagnosticDaemon(
+                diag,
+                window=args.daemon_window,
+                interval=args.interval,
+                triggers=args.trigger,
+                cooldown=args.daemon_cooldown,
+                dump_dir=args.daemon_dir,
+                max_dumps=args.daemon_max_dumps
+            )
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(0 if daemon.run() else 1)
+
     try:
         diag.run_all_tasks()
     except KeyboardInterrupt:
@@ -0,0 +1,734 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный стенд для сборщика zdiag.py
+
+Стенд не требует Zabbix: поднимается поддельный trapper, который отдает
+ответ zabbix.stats заданного размера (обычные, сжатые и большие пакеты),
+создается поддельный бинарник zabbix_server с синтетическим diaginfo и
+дерево /proc с процессами zabbix_server. На этом окружении замеряются:
+  stats     - прием zabbix.stats через ZabbixProtocolClient (задержка, МБ/с);
+  archive   - запись в архив через ArchiveWriter (время, размер, память);
+  collector - полный запуск сборщика в отдельном процессе (общее время,
+              время задач из collector_metrics.json, пиковый RSS, размер
+              архива).
+Результаты записываются в JSON. С --baseline результаты сравниваются с
+предыдущим запуском, при регрессии скрипт завершается с кодом 1.
+"""
+
+import os
+import sys
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import argparse
+import platform
+import statistics
+import struct
+import threading
+import time
+import json
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import zdiag  # noqa: E402
+
+# Параметры окружения по умолчанию
+DEFAULT_STATS_SIZE = 256 * 1024
+DEFAULT_DIAGINFO_ITEMS = 1000
+DEFAULT_WORKERS = 60
+
+# Параметры замеров по умолчанию
+DEFAULT_REQUESTS = 50
+DEFAULT_REPEAT = 3
+DEFAULT_ARCHIVE_SIZE = 32 * 1024 * 1024
+DEFAULT_ARCHIVE_FILES = 16
+DEFAULT_COMPRESSIONS = ('deflate', 'store')
+DEFAULT_PROFILES = ('light', 'standard')
+BENCHMARKS = ('stats', 'archive', 'collector')
+
+# Допустимое ухудшение относительно --baseline и порог шума, ниже которого
+# значения не сравниваются (секунды, миллисекунды, KiB и байты)
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR = {'seconds': 0.05, 'ms': 1.0, 'kb': 1024, 'bytes': 64 * 1024}
+
+# Режимы поддельного trapper'а
+TRAPPER_MODES = ('plain', 'compressed', 'large')
+
+# Типы процессов zabbix_server для zabbix.stats и /proc
+PROCESS_TYPES = (
+    'alert manager', 'alert syncer', 'alerter', 'availability manager', 'configuration syncer',
+    'discoverer', 'escalator', 'history poller', 'history syncer', 'housekeeper', 'http poller',
+    'icmp pinger', 'lld manager', 'lld worker', 'poller', 'preprocessing manager',
+    'preprocessing worker', 'proxy poller', 'self-monitoring', 'task manager', 'timer',
+    'trapper', 'unreachable poller',
+)
+
+# Поддельный zabbix_server: -R diaginfo[=секция] печатает синтетический
+# diaginfo с items строками в top-списках, иначе - версию
+FAKE_SERVER = '''#!{python}
+import sys
+
+ITEMS = {items}
+SECTIONS = {sections!r}
+args = " ".join(sys.argv[1:])
+if "diaginfo" not in args:
+    print("zabbix_server (Zabbix) 7.0.0")
+    sys.exit(0)
+
+section = args.split("diaginfo=", 1)[1].split()[0] if "diaginfo=" in args else None
+if section is not None and section not in SECTIONS:
+    sys.stderr.write("invalid diaginfo section: " + section + "\\n")
+    sys.exit(1)
+
+def memory(name):
+    return [
+        name + ":",
+        "  size: free:6235088 used:1963872",
+        "  chunks: free:7 used:11823 min:32 max:6232512",
+        "    buckets:",
+        "      32:2",
+        "      256+:4",
+    ]
+
+def top(name, line):
+    return [name + ":"] + [line.format(itemid=100000 + i, count=ITEMS - i) for i in range(ITEMS)]
+
+blocks = {{
+    "historycache": ["Items:%d values:%d time:0.000056" % (ITEMS, ITEMS * 3)]
+        + memory("Memory.data") + memory("Memory.index")
+        + top("Top.values", "  itemid:{{itemid}} values:{{count}}"),
+    "valuecache": ["Items:%d values:%d mode:0 time:0.000205" % (ITEMS, ITEMS * 50)]
+        + memory("Memory")
+        + top("Top.values", "  itemid:{{itemid}} values:{{count}} request.values:{{count}}")
+        + top("Top.request.values", "  itemid:{{itemid}} values:{{count}} request.values:{{count}}"),
+    "preprocessing": ["Values:%d done:%d queued:0 processing:0 pending:0 time:0.000398" % (ITEMS, ITEMS)]
+        + top("Top.values", "  itemid:{{itemid}} values:{{count}} steps:2")
+        + ["Top.oldest.preproc.values:"],
+    "lld": ["Rules:%d values:%d time:0.000322" % (ITEMS, ITEMS)]
+        + top("Top.values", "  itemid:{{itemid}} values:1"),
+    "alerting": ["Alerts:0 time:0.000231", "Media.alerts:", "Source.alerts:"],
+    "locks": ["Locks:"] + ["  ZBX_MUTEX_%d:0x7f095cb6f%03x" % (i, i * 40) for i in range(40)],
+    "connector": ["Values:0 done:0 queued:0 processing:0 pending:0 time:0.000100"],
+}}
+titles = {{"historycache": "history cache", "valuecache": "value cache", "lld": "LLD"}}
+
+out = []
+for name in ([section] if section else SECTIONS):
+    out.append("== %s diagnostic information ==" % titles.get(name, name))
+    out.extend(blocks[name])
+    out.append("==")
+sys.stdout.write("\\n".join(out) + "\\n")
+'''
+
+
+def parse_size(value):
+    """Размер в байтах из строки вида 512, 256K, 64M, 1G"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    value = value.strip().upper().rstrip('B')
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверный размер: {value}")
+
+
+def parse_list(choices):
+    """Тип argparse для списка через запятую из допустимых значений"""
+    def parse(value):
+        items = tuple(item.strip() for item in value.split(',') if item.strip())
+        unknown = [item for item in items if item not in choices]
+        if unknown or not items:
+            raise argparse.ArgumentTypeError(
+                f"недопустимые значения: {', '.join(unknown) or value} (допустимы: {', '.join(choices)})"
+            )
+        return items
+    return parse
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def synthetic_stats(size):
+    """Ответ zabbix.stats размером не меньше size байт в формате JSON"""
+    now = int(time.time())
+    data = {
+        'boottime': now - 86400,
+        'uptime': 86400,
+        'hosts': 811,
+        'items': 204622,
+        'item_unsupported': 12,
+        'requiredperformance': 3431.2,
+        'preprocessing_queue': 0,
+        'lld_queue': 490,
+        'triggers': 2433,
+        'vcache': {
+            'buffer': {'total': 8388224, 'free': 6235088, 'pfree': 74.33, 'used': 2153136, 'pused': 25.67},
+            'cache': {'requests': 2028779, 'hits': 1946868, 'misses': 81911, 'mode': 0},
+        },
+        'wcache': {
+            'values': {'all': 5067741, 'float': 1540226, 'uint': 3112416, 'str': 10521, 'log': 0,
+                       'text': 404578, 'not supported': 0},
+            'history': {'pfree': 99.9, 'free': 16776832, 'total': 16777216, 'used': 384, 'pused': 0.1},
+            'index': {'pfree': 76.5, 'free': 3210320, 'total': 4193776, 'used': 983456, 'pused': 23.5},
+            'trend': {'pfree': 83.1, 'free': 13950160, 'total': 16777216, 'used': 2827056, 'pused': 16.9},
+        },
+        'rcache': {'total': 33554312, 'free': 10617872, 'pfree': 31.6, 'used': 22936440, 'pused': 68.4},
+        'version': '7.0.0',
+        'process': {
+            name: {
+                'busy': {'avg': 12.5, 'max': 40.1, 'min': 0.3},
+                'idle': {'avg': 87.5, 'max': 99.7, 'min': 59.9},
+                'count': 5,
+            }
+            for name in PROCESS_TYPES
+        },
+    }
+    response = {'response': 'success', 'data': data}
+
+    # Недостающий объем добавляется списком элементов, как в больших
+    # ответах с тысячами записей
+    base = len(json.dumps(response, separators=(',', ':')))
+    entry = len(json.dumps({'itemid': 100000, 'values': 100000}, separators=(',', ':'))) + 1
+    if size > base:
+        data['padding'] = [{'itemid': 100000 + i, 'values': i} for i in range((size - base) // entry + 1)]
+    return response
+
+
+class FakeTrapperHandler(socketserver.BaseRequestHandler):
+    """Обработка одного соединения: прием запроса и отправка готового пакета"""
+
+    def handle(self):
+        client = zdiag.ZabbixProtocolClient()
+        client.sock = self.request
+        try:
+            client.receive()
+            self.request.sendall(self.server.packet)
+        except (zdiag.ZabbixProtocolError, OSError):
+            pass
+        finally:
+            client.sock = None
+
+
+class FakeTrapper(socketserver.ThreadingTCPServer):
+    """Поддельный trapper на 127.0.0.1 со случайным портом
+
+    Ответ сериализуется один раз, поэтому замеряется клиент, а не сервер.
+    Как и zabbix_server, trapper закрывает соединение после ответа.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, stats_size=DEFAULT_STATS_SIZE, mode='plain'):
+        super().__init__(('127.0.0.1', 0), FakeTrapperHandler)
+        self.mode = mode
+        self.body = json.dumps(synthetic_stats(stats_size), separators=(',', ':')).encode('utf-8')
+        self.packet = self.build_packet(self.body, mode)
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @staticmethod
+    def build_packet(body, mode):
+        client = zdiag.ZabbixProtocolClient
+        if mode == 'compressed':
+            return client.pack(body, compress=True)
+        if mode == 'large':
+            # Флаг больших пакетов с 8-байтовыми длинами независимо от размера
+            flags = client.FLAG_PROTOCOL | client.FLAG_LARGE
+            return client.SIGNATURE + struct.pack("<BQQ", flags, len(body), 0) + body
+        return client.pack(body)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name=f"fake-trapper-{self.mode}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeEnvironment:
+    """Рабочая директория стенда: бинарник, конфиг, дерево /proc и trapper
+
+    Дерево /proc содержит основной процесс zabbix_server с -c <конфиг> и
+    workers процессов с заголовками вида "zabbix_server: poller #3", а
+    также системные файлы, которые читают SystemSampler и
+    SystemInfoCollector.
+    """
+
+    def __init__(self, workdir, stats_size=DEFAULT_STATS_SIZE, mode='plain',
+                 diaginfo_items=DEFAULT_DIAGINFO_ITEMS, workers=DEFAULT_WORKERS):
+        self.workdir = Path(workdir)
+        self.stats_size = stats_size
+        self.mode = mode
+        self.diaginfo_items = diaginfo_items
+        self.workers = workers
+        self.proc_root = self.workdir / 'proc'
+        self.binary = self.workdir / 'sbin' / 'zabbix_server'
+        self.config = self.workdir / 'zabbix_server.conf'
+        self.trapper = None
+
+    def __enter__(self):
+        self.trapper = FakeTrapper(self.stats_size, self.mode).start()
+        self.create_binary()
+        self.create_config()
+        self.create_proc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trapper.stop()
+
+    def create_binary(self):
+        self.binary.parent.mkdir(parents=True, exist_ok=True)
+        self.binary.write_text(FAKE_SERVER.format(
+            python=sys.executable, items=self.diaginfo_items, sections=zdiag.DIAGINFO_SECTIONS
+        ))
+        self.binary.chmod(0o755)
+
+    def create_config(self):
+        include_dir = self.workdir / 'zabbix_server.conf.d'
+        include_dir.mkdir(exist_ok=True)
+        (include_dir / 'listen.conf').write_text(f"ListenPort={self.trapper.port}\n")
+        self.config.write_text(
+            "LogFile=/var/log/zabbix/zabbix_server.log\n"
+            "DBName=zabbix\n"
+            "DBUser=zabbix\n"
+            "DBPassword=secret\n"
+            "ListenIP=127.0.0.1\n"
+            "StartPollers=5\n"
+            "CacheSize=32M\n"
+            "Timeout=4\n"
+            f"Include={include_dir}/*.conf\n"
+        )
+
+    def write(self, name, content):
+        path = self.proc_root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def create_proc(self):
+        if self.proc_root.exists():
+            shutil.rmtree(self.proc_root)
+
+        self.write('stat', (
+            "cpu  4705 150 1120 16250 520 0 40 0 0 0\n"
+            "cpu0 2352 75 560 8125 260 0 20 0 0 0\n"
+            "intr 1462898 0 0 0\n"
+            "ctxt 3425190\n"
+            "btime 1754746660\n"
+            "processes 26442\n"
+            "procs_running 2\n"
+            "procs_blocked 0\n"
+        ))
+        self.write('vmstat', "pgpgin 2107072\npgpgout 6436044\npswpin 0\npswpout 0\n")
+        self.write('meminfo', (
+            "MemTotal:       16318480 kB\n"
+            "MemFree:         8035620 kB\n"
+            "MemAvailable:   12640112 kB\n"
+            "Buffers:          262596 kB\n"
+            "Cached:          4283500 kB\n"
+            "SwapCached:            0 kB\n"
+            "Shmem:            473420 kB\n"
+            "SReclaimable:     205580 kB\n"
+            "SwapTotal:       2097148 kB\n"
+            "SwapFree:        2097148 kB\n"
+        ))
+        for resource in zdiag.SystemSampler.PSI_RESOURCES:
+            self.write(f'pressure/{resource}', (
+                "some avg10=0.00 avg60=0.00 avg300=0.00 total=125412\n"
+                "full avg10=0.00 avg60=0.00 avg300=0.00 total=52011\n"
+            ))
+        self.write('uptime', "86400.12 160123.45\n")
+        self.write('loadavg', "0.25 0.30 0.35 2/512 26442\n")
+        self.write('cpuinfo', "".join(
+            f"processor\t: {cpu}\nmodel name\t: Bench CPU @ 2.40GHz\ncpu MHz\t\t: 2400.000\n\n"
+            for cpu in range(os.cpu_count() or 1)
+        ))
+
+        titles = [f"{self.binary} -c {self.config}"]
+        for i in range(self.workers):
+            process_type = PROCESS_TYPES[i % len(PROCESS_TYPES)]
+            titles.append(f"{self.binary}: {process_type} #{i // len(PROCESS_TYPES) + 1} [idle 1 sec]")
+
+        for offset, title in enumerate(titles):
+            pid = 1000 + offset
+            # Основной процесс хранит аргументы через \0, заголовки процессов - одной строкой
+            cmdline = '\0'.join(title.split(' ')) if offset == 0 else title
+            self.write(f'{pid}/cmdline', cmdline + '\0')
+            fields = ['S', '1'] + ['0'] * 9 + [str(100 + offset), str(20 + offset)] + ['0'] * 8 + ['2048']
+            self.write(f'{pid}/stat', f"{pid} (zabbix_server) {' '.join(fields)}\n")
+            self.write(f'{pid}/status', (
+                "Name:\tzabbix_server\n"
+                f"voluntary_ctxt_switches:\t{1000 + offset}\n"
+                f"nonvoluntary_ctxt_switches:\t{10 + offset}\n"
+            ))
+            self.write(f'{pid}/io', f"read_bytes: {4096 * offset}\nwrite_bytes: {8192 * offset}\n")
+
+
+def bench_stats(args, workdir):
+    """Прием zabbix.stats в каждом режиме trapper'а"""
+    results = {}
+    for mode in TRAPPER_MODES:
+        trapper = FakeTrapper(args.stats_size, mode).start()
+        try:
+            client = zdiag.ZabbixProtocolClient('127.0.0.1', trapper.port, timeout=30)
+            client.request({"request": "zabbix.stats"})
+
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                request_started = time.perf_counter()
+                client.request({"request": "zabbix.stats"})
+                latencies.append(time.perf_counter() - request_started)
+            elapsed = time.perf_counter() - started
+
+            tracemalloc.start()
+            client.request({"request": "zabbix.stats"})
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            trapper.stop()
+
+        results[mode] = {
+            'payload_bytes': len(trapper.body),
+            'packet_bytes': len(trapper.packet),
+            'requests': args.requests,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'mb_per_sec': round(len(trapper.body) * args.requests / elapsed / 1024 / 1024, 1),
+            'peak_traced_kb': peak // 1024,
+        }
+        print(f"stats {mode}: p50 {results[mode]['p50_ms']} мс, {results[mode]['mb_per_sec']} МБ/с")
+    return results
+
+
+def archive_chunks(size):
+    """Текстовые данные, похожие на вывод команд, блоками по 64 KiB"""
+    line = b"  itemid:%d values:%d request.values:%d\n"
+    block = b"".join(line % (100000 + i, i, i % 100) for i in range(2000))
+    block = (block * (65536 // len(block) + 1))[:65536]
+    remaining = size
+    while remaining > 0:
+        yield block[:remaining]
+        remaining -= len(block)
+
+
+def write_archive(zip_path, compression, size, files, jobs):
+    """Запись files записей общим объемом size параллельно в jobs потоков"""
+    writer = zdiag.ArchiveWriter(zip_path, 'zabbix-diag', compression=compression)
+
+    def write_entry(index):
+        with writer.open(f"{index}_bench.txt", binary=True) as f:
+            for chunk in archive_chunks(size // files):
+                f.write(chunk)
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(write_entry, range(files)))
+    finally:
+        writer.close()
+
+
+def bench_archive(args, workdir):
+    """Потоковая запись в архив для каждого метода сжатия"""
+    results = {}
+    for compression in args.compression:
+        zip_path = workdir / f"bench-{compression}.zip"
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            write_archive(zip_path, compression, args.archive_size, args.archive_files, zdiag.DEFAULT_JOBS)
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        write_archive(zip_path, compression, args.archive_size, args.archive_files, zdiag.DEFAULT_JOBS)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        seconds = statistics.median(timings)
+        results[compression] = {
+            'input_bytes': args.archive_size,
+            'files': args.archive_files,
+            'archive_bytes': zip_path.stat().st_size,
+            'seconds': round(seconds, 3),
+            'mb_per_sec': round(args.archive_size / seconds / 1024 / 1024, 1),
+            'peak_traced_kb': peak // 1024,
+        }
+        zip_path.unlink()
+        print(f"archive {compression}: {results[compression]['seconds']} сек, "
+              f"{results[compression]['archive_bytes']} байт")
+    return results
+
+
+def run_collector_child(params_path):
+    """Запуск сборщика в дочернем процессе стенда (--child)"""
+    with open(params_path, 'r', encoding='utf-8') as f:
+        params = json.load(f)
+
+    class BenchDiagnostic(zdiag.ZabbixDiagnostic):
+        def get_archive_path(self):
+            return Path(params['archive'])
+
+    diag = BenchDiagnostic(
+        output_dir=params['output_dir'],
+        proc_root=params['proc_root'],
+        profile=params['profile'],
+        sample_interval=0.2,
+        sample_duration=1,
+        worker_samples=2,
+        worker_interval=0.2,
+        nice=0,
+        ionice='none',
+    )
+    diag.run_all_tasks()
+
+
+def bench_collector(args, workdir):
+    """Полные запуски сборщика на поддельном окружении"""
+    results = {}
+    with FakeEnvironment(workdir / 'env', args.stats_size, 'compressed', args.diaginfo_items, args.workers) as env:
+        for profile in args.profiles:
+            runs = []
+            for i in range(args.repeat):
+                archive = workdir / f"collector-{profile}.zip"
+                params_path = workdir / 'collector.json'
+                params_path.write_text(json.dumps({
+                    'archive': str(archive),
+                    'output_dir': str(workdir / 'zabbix-diag'),
+                    'proc_root': str(env.proc_root),
+                    'profile': profile,
+                }))
+
+                log_path = workdir / f"collector-{profile}-{i}.log"
+                started = time.perf_counter()
+                with open(log_path, 'wb') as log:
+                    process = subprocess.Popen(
+                        [sys.executable, os.path.abspath(__file__), '--child', str(params_path)],
+                        stdout=log, stderr=subprocess.STDOUT
+                    )
+                    # Пиковый RSS дочернего процесса берется из rusage os.wait4
+                    _, status, usage = os.wait4(process.pid, 0)
+                    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) \
+                        else os.WEXITSTATUS(status)
+                wall = time.perf_counter() - started
+
+                if process.returncode != 0 or not archive.exists():
+                    raise RuntimeError(f"Сборщик завершился с кодом {process.returncode}, журнал: {log_path}")
+
+                with zipfile.ZipFile(archive) as zf:
+                    metrics = json.loads(zf.read('zabbix-diag/collector_metrics.json'))
+                    files = len(zf.namelist())
+
+                runs.append({
+                    'wall': round(wall, 3),
+                    'maxrss_kb': usage.ru_maxrss,
+                    'archive_bytes': archive.stat().st_size,
+                    'files': files,
+                    'tasks': {task['name']: task['wall'] for task in metrics['tasks']},
+                })
+                archive.unlink()
+
+            tasks = {}
+            for name in runs[0]['tasks']:
+                values = [run['tasks'][name] for run in runs if name in run['tasks']]
+                tasks[name] = round(statistics.median(values), 3)
+
+            results[profile] = {
+                'runs': len(runs),
+                'wall': round(statistics.median(run['wall'] for run in runs), 3),
+                'maxrss_kb': max(run['maxrss_kb'] for run in runs),
+                'archive_bytes': runs[-1]['archive_bytes'],
+                'files': runs[-1]['files'],
+                'tasks': tasks,
+            }
+            print(f"collector {profile}: {results[profile]['wall']} сек, RSS {results[profile]['maxrss_kb']} KiB")
+    return results
+
+
+def comparable_metrics(results):
+    """Метрики для сравнения с базовым запуском: путь -> (значение, единица)
+
+    Все метрики устроены так, что меньшее значение лучше.
+    """
+    metrics = {}
+    for mode, data in results.get('stats', {}).items():
+        metrics[f"stats.{mode}.p50_ms"] = (data['p50_ms'], 'ms')
+        metrics[f"stats.{mode}.peak_traced_kb"] = (data['peak_traced_kb'], 'kb')
+    for compression, data in results.get('archive', {}).items():
+        metrics[f"archive.{compression}.seconds"] = (data['seconds'], 'seconds')
+        metrics[f"archive.{compression}.archive_bytes"] = (data['archive_bytes'], 'bytes')
+        metrics[f"archive.{compression}.peak_traced_kb"] = (data['peak_traced_kb'], 'kb')
+    for profile, data in results.get('collector', {}).items():
+        metrics[f"collector.{profile}.wall"] = (data['wall'], 'seconds')
+        metrics[f"collector.{profile}.maxrss_kb"] = (data['maxrss_kb'], 'kb')
+        metrics[f"collector.{profile}.archive_bytes"] = (data['archive_bytes'], 'bytes')
+        for name, wall in data['tasks'].items():
+            metrics[f"collector.{profile}.tasks.{name}"] = (wall, 'seconds')
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно baseline: (метрика, было, стало)"""
+    old = comparable_metrics(baseline)
+    regressions = []
+    for name, (value, unit) in comparable_metrics(results).items():
+        if name not in old:
+            continue
+        previous = old[name][0]
+        if max(value, previous) < NOISE_FLOOR[unit]:
+            continue
+        if value > previous * (1 + tolerance):
+            regressions.append((name, previous, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный стенд сборщика zdiag.py на поддельном Zabbix',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--output', default='zdiag-bench.json', help='Файл результатов (по умолчанию: zdiag-bench.json)')
+    parser.add_argument(
+        '--only',
+        type=parse_list(BENCHMARKS),
+        default=BENCHMARKS,
+        metavar='LIST',
+        help=f'Замеры через запятую (по умолчанию: {",".join(BENCHMARKS)})'
+    )
+    parser.add_argument(
+        '--stats-size',
+        type=parse_size,
+        default=DEFAULT_STATS_SIZE,
+        help='Размер ответа zabbix.stats, например 256K или 8M (по умолчанию: 256K)'
+    )
+    parser.add_argument(
+        '--diaginfo-items',
+        type=int,
+        default=DEFAULT_DIAGINFO_ITEMS,
+        help=f'Строк в каждом top-списке синтетического diaginfo (по умолчанию: {DEFAULT_DIAGINFO_ITEMS})'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Процессов zabbix_server в поддельном /proc (по умолчанию: {DEFAULT_WORKERS})'
+    )
+    parser.add_argument(
+        '--requests',
+        type=int,
+        default=DEFAULT_REQUESTS,
+        help=f'Запросов zabbix.stats на режим trapper\'а (по умолчанию: {DEFAULT_REQUESTS})'
+    )
+    parser.add_argument(
+        '--archive-size',
+        type=parse_size,
+        default=DEFAULT_ARCHIVE_SIZE,
+        help='Объем данных для записи в архив (по умолчанию: 32M)'
+    )
+    parser.add_argument(
+        '--archive-files',
+        type=int,
+        default=DEFAULT_ARCHIVE_FILES,
+        help=f'Количество записей архива (по умолчанию: {DEFAULT_ARCHIVE_FILES})'
+    )
+    parser.add_argument(
+        '--compression',
+        type=parse_list(tuple(name for name, method in zdiag.COMPRESSION_METHODS.items() if method is not None)),
+        default=DEFAULT_COMPRESSIONS,
+        metavar='LIST',
+        help=f'Методы сжатия архива через запятую (по умолчанию: {",".join(DEFAULT_COMPRESSIONS)})'
+    )
+    parser.add_argument(
+        '--profiles',
+        type=parse_list(tuple(zdiag.COLLECTION_PROFILES)),
+        default=DEFAULT_PROFILES,
+        metavar='LIST',
+        help=f'Профили сборщика через запятую (по умолчанию: {",".join(DEFAULT_PROFILES)})'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=DEFAULT_REPEAT,
+        help=f'Повторов записи архива и запуска сборщика, берется медиана (по умолчанию: {DEFAULT_REPEAT})'
+    )
+    parser.add_argument('--baseline', help='Результаты предыдущего запуска для сравнения')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f'Допустимое ухудшение относительно --baseline (по умолчанию: {DEFAULT_TOLERANCE})'
+    )
+    parser.add_argument('--keep-workdir', action='store_true', help='Не удалять рабочую директорию стенда')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        run_collector_child(args.child)
+        return
+
+    workdir = Path(tempfile.mkdtemp(prefix='zdiag-bench-'))
+    print(f"Рабочая директория: {workdir}")
+
+    results = {
+        'version': zdiag.VERSION,
+        'started': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {
+            'stats_size': args.stats_size,
+            'diaginfo_items': args.diaginfo_items,
+            'workers': args.workers,
+            'requests': args.requests,
+            'archive_size': args.archive_size,
+            'archive_files': args.archive_files,
+            'repeat': args.repeat,
+        },
+    }
+    benchmarks = {'stats': bench_stats, 'archive': bench_archive, 'collector': bench_collector}
+
+    try:
+        for name in args.only:
+            results[name] = benchmarks[name](args, workdir)
+    finally:
+        if args.keep_workdir:
+            print(f"Рабочая директория сохранена: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, previous, value in regressions:
+            print(f"✗ {name}: {previous} -> {value}")
+        if regressions:
+            print(f"Регрессий: {len(regressions)} (допуск {args.tolerance:.0%})")
+            sys.exit(1)
+        print(f"✓ Регрессий нет (допуск {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()